@@ -2,51 +2,613 @@
 
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import BytesIO
 import os
 import colorsys
+import functools
+import hashlib
 import numpy as np
 import math
+import queue
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from spotipy.exceptions import SpotifyException
+
+
+class GenerationCancelled(Exception):
+    """Raised inside generate_album_grid when its cancel token has been set."""
+
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("Generation cancelled.")
+
+def new_stats():
+    """
+    Structured counters for one generation, filled in by generate_album_grid:
+    per-stage seconds plus download, cache and dedup counts.
+    """
+    return {
+        "stages": {},
+        "tracks": 0,
+        "covers": 0,
+        "grid_size": 0,
+        "bytes_downloaded": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "duplicates_dropped": 0,
+        "download_failures": 0,
+        "peak_image_bytes": 0,
+        "coalesced": False,
+    }
+
+
+@contextmanager
+def timed_stage(stats, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats["stages"][stage] = stats["stages"].get(stage, 0.0) + time.perf_counter() - start
+
+
+def image_bytes(img):
+    """Size of a decoded image's pixel buffer. tracemalloc can't see these, so
+    generations account for them by hand."""
+    return img.width * img.height * len(img.getbands())
+
+
+def _count(stats, key, amount=1):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + amount
+
+
+def _merge_stats(into, other):
+    for stage, seconds in other["stages"].items():
+        into["stages"][stage] = into["stages"].get(stage, 0.0) + seconds
+    for key, value in other.items():
+        if key != "stages" and isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key in ("covers", "grid_size"):
+                into[key] = value
+            elif key.startswith("peak_"):
+                into[key] = max(into.get(key, 0), value)
+            else:
+                into[key] = into.get(key, 0) + value
+
+
+def _merge_render_stats(stats, render_stats, rendered_here):
+    """Fold a (possibly shared) render's stats into the caller's. A coalesced follower
+    takes only the grid it got: the downloads, cache lookups and stage times belong to
+    the leader and are already counted under the leader's generation."""
+    if stats is None:
+        return
+    if rendered_here:
+        _merge_stats(stats, render_stats)
+    else:
+        stats["covers"], stats["grid_size"] = render_stats["covers"], render_stats["grid_size"]
+    stats["coalesced"] = not rendered_here
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one in-flight operation.
+    The first caller (the leader) runs fn; callers arriving while it runs wait
+    for and share its result or exception. fn receives a report callable that
+    fans progress out to every attached caller's progress_callback.
+
+    With callbacks ({name: callable or None}), fn is called as fn(report, publish),
+    and publish(name, *args) fans out to every attached caller's callback of that
+    name; a caller that joins late gets the latest value of each replayed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, progress_callback=None, cancel_event=None, callbacks=None):
+        subscribed = [(name, cb) for name, cb in (callbacks or {}).items() if cb]
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _FlightCall()
+                    self._calls[key] = call
+                if progress_callback:
+                    call.listeners.append(progress_callback)
+                    if call.last_progress is not None:
+                        progress_callback(*call.last_progress)
+                for name, cb in subscribed:
+                    call.subscribers.setdefault(name, []).append(cb)
+                    if name in call.published:
+                        cb(*call.published[name])
+
+            if leader:
+                try:
+                    call.result = fn(call.report, call.publish) if callbacks is not None else fn(call.report)
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+                return call.result
+
+            try:
+                while not call.done.wait(0.1):
+                    check_cancelled(cancel_event)
+            finally:
+                with self._lock:
+                    if progress_callback in call.listeners:
+                        call.listeners.remove(progress_callback)
+                    for name, cb in subscribed:
+                        call.subscribers[name].remove(cb)
+
+            if isinstance(call.error, GenerationCancelled):
+                # The leader was cancelled, not us: start over, possibly as the new leader.
+                check_cancelled(cancel_event)
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class _FlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.listeners = []
+        self.last_progress = None
+        self.subscribers = {}
+        self.published = {}
+        self.result = None
+        self.error = None
+
+    def report(self, current, total, message):
+        self.last_progress = (current, total, message)
+        for listener in list(self.listeners):
+            listener(current, total, message)
+
+    def publish(self, name, *args):
+        self.published[name] = args
+        for callback in list(self.subscribers.get(name, ())):
+            callback(*args)
+
+
+def _publishers(publish, callbacks):
+    """Per-name functions that publish through a flight, or None where the caller passed none."""
+    return [(lambda *args, name=name: publish(name, *args)) if callback else None
+            for name, callback in callbacks.items()]
+
+
+# Shared across every generation in the process: identical playlist pages, cover
+# downloads and renders requested concurrently are performed only once.
+_page_flight = SingleFlight()
+_download_flight = SingleFlight()
+_render_flight = SingleFlight()
+
+
+PRIORITY_HIGH = 0   # interactive calls a user is waiting on, e.g. validating a playlist
+PRIORITY_BULK = 1   # pagination inside a background generation
+PRIORITY_LOW = 2    # speculative work nobody is waiting on yet, e.g. post-login prefetch
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_BULK: "bulk", PRIORITY_LOW: "low"}
+
+# 429 is left out so a rate-limited response reaches the governor with its
+# Retry-After header instead of being slept on inside spotipy's own retry loop.
+SPOTIFY_RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class SpotifyRateLimited(Exception):
+    """Raised when Spotify keeps answering 429 after the governor's retries."""
+
+
+class RateGovernor:
+    """
+    Process-wide token bucket for Spotify Web API calls. Bulk and low calls
+    leave `reserve` tokens untouched and yield to any waiting call of higher
+    priority, so a cheap interactive request is never stuck behind another
+    task's pagination, and prefetching never delays a real generation.
+    A 429 blocks every caller until its Retry-After has passed.
+    """
+
+    def __init__(self, rate=10.0, burst=20, reserve=5, max_retries=3, default_retry_after=5.0):
+        self.rate = float(rate)
+        self.burst = burst
+        self.reserve = min(reserve, burst - 1)
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiting = {p: 0 for p in PRIORITY_NAMES}
+        self._calls = 0
+        self._waits = 0
+        self._rate_limited = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=PRIORITY_BULK, cancel_event=None):
+        with self._cond:
+            self._waiting[priority] += 1
+            waited = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    floor = 0 if priority == PRIORITY_HIGH else self.reserve
+                    outranked = any(self._waiting[p] for p in self._waiting if p < priority)
+                    if now >= self._blocked_until and self._tokens >= floor + 1 and not outranked:
+                        self._tokens -= 1
+                        self._calls += 1
+                        if waited:
+                            self._waits += 1
+                        return
+                    waited = True
+                    delay = max(self._blocked_until - now, (floor + 1 - self._tokens) / self.rate, 0.01)
+                    self._cond.wait(min(delay, 0.25))
+                    check_cancelled(cancel_event)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def penalize(self, retry_after=None):
+        with self._cond:
+            delay = self.default_retry_after if retry_after is None else retry_after
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self._tokens = 0.0
+            self._rate_limited += 1
+
+    def call(self, fn, *args, priority=PRIORITY_BULK, cancel_event=None, **kwargs):
+        """Run fn(*args, **kwargs) under the governor, retrying 429s after Retry-After."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, cancel_event=cancel_event)
+            try:
+                return fn(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429:
+                    raise
+                self.penalize(_retry_after_seconds(e))
+                if attempt == self.max_retries:
+                    raise SpotifyRateLimited(
+                        "Spotify is rate limiting requests right now. Please try again in a minute."
+                    ) from e
+
+    def state(self):
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "reserve": self.reserve,
+                "tokens": round(self._tokens, 2),
+                "blocked_for_seconds": round(max(0.0, self._blocked_until - now), 2),
+                "waiting": {PRIORITY_NAMES[p]: n for p, n in self._waiting.items()},
+                "calls": self._calls,
+                "throttled_calls": self._waits,
+                "rate_limited_responses": self._rate_limited,
+            }
+
+
+def _retry_after_seconds(exc):
+    headers = getattr(exc, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+spotify_governor = RateGovernor(
+    rate=float(os.getenv("SPOTIFY_RATE_PER_SECOND", "10")),
+    burst=int(os.getenv("SPOTIFY_RATE_BURST", "20")),
+    reserve=int(os.getenv("SPOTIFY_RATE_RESERVE", "5")),
+)
+
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+MAX_CACHED_CLIENTS = 256
+
+
+def _pooled_session(retry=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry or 0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# One keep-alive connection pool for the Web API and one for the image CDN,
+# shared by every client and download in the process.
+_spotify_http = _pooled_session(Retry(
+    total=3,
+    connect=None,
+    read=False,
+    allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+    status=3,
+    backoff_factor=0.3,
+    status_forcelist=SPOTIFY_RETRY_STATUSES,
+))
+_cdn_http = _pooled_session()
+
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+class CoverCache:
+    """
+    Byte-bounded LRU of downloaded cover files keyed by URL, along with any
+    features (dominant colour, perceptual hash) already computed for them.
+    With disk_dir set, cover files are also written there and read back on a
+    memory miss, so several processes (or runs) can share one set of downloads.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                self.hits += 1
+                return entry
+        data = self._read_disk(url)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._insert(url, data)
+
+    def put(self, url, data):
+        self._write_disk(url, data)
+        self._insert(url, data)
+
+    def _insert(self, url, data):
+        entry = {"data": data}
+        if len(data) > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._bytes -= len(old["data"])
+            self._entries[url] = entry
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted["data"])
+        return entry
+
+    def _disk_path(self, url):
+        return os.path.join(self.disk_dir, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def _read_disk(self, url):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(url), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, url, data):
+        if not self.disk_dir:
+            return
+        # Write then rename, so a reader in another process never sees half a file.
+        path = self._disk_path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing cover cache file for {url}: {e}")
+
+    def discard(self, url):
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._bytes -= len(entry["data"])
+        if self.disk_dir:
+            try:
+                os.unlink(self._disk_path(url))
+            except OSError:
+                pass
+
+    def features(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            return dict(entry) if entry is not None else {}
+
+    def set_features(self, url, **features):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                entry.update(features)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+cover_cache = CoverCache(int(os.getenv("COVER_CACHE_BYTES", str(64 * 1024 * 1024))),
+                         disk_dir=os.getenv("COVER_CACHE_DIR") or None)
+
+
+def get_spotify_client(access_token):
+    """
+    Return a Spotipy client for access_token, reusing a recently built one.
+    All clients share the pooled Web API session, so new users skip the TLS handshake.
+    """
+    with _clients_lock:
+        sp = _clients.get(access_token)
+        if sp is not None:
+            _clients.move_to_end(access_token)
+            return sp
+        sp = spotipy.Spotify(auth=access_token, requests_session=_spotify_http)
+        _clients[access_token] = sp
+        while len(_clients) > MAX_CACHED_CLIENTS:
+            _clients.popitem(last=False)
+        return sp
+
 
 def create_spotify_client(client_id, client_secret, redirect_uri, token_info):
     """
     Given Spotify credentials and an existing token_info dictionary,
     return an authenticated Spotipy client.
     """
-    # Create a Spotipy client from the token info
-    sp = spotipy.Spotify(
-        auth=token_info["access_token"]
-    )
-    return sp
+    return get_spotify_client(token_info["access_token"])
+
+MAX_COVERS = 300
+# Large-library mode: covers considered, and the largest grid side that may be requested.
+LARGE_MAX_COVERS = 10000
+LARGE_MAX_GRID_SIZE = 100
+# Longest edge, in pixels, of a large-library output (grid side x cell size). Keeps the
+# composited canvas, and its rounded RGBA copy, to a few hundred MB whatever was asked for.
+LARGE_MAX_OUTPUT_EDGE = 10000
 
 def calculate_grid_size(num_images):
     return int(math.floor(math.sqrt(num_images)))
 
-def fetch_playlist_tracks(sp, playlist_id):
-    tracks = []
+def iter_playlist_pages(sp, playlist_id, cancel_event=None):
+    """Yield a playlist's track items one page at a time."""
     offset = 0
     limit = 100
     while True:
-        results = sp.playlist_items(playlist_id, offset=offset, limit=limit)
-        tracks.extend(results['items'])
+        check_cancelled(cancel_event)
+        fetched_here = []
+
+        def fetch(report):
+            fetched_here.append(True)
+            return spotify_governor.call(sp.playlist_items, playlist_id, offset=offset,
+                                         limit=limit, cancel_event=cancel_event)
+
+        try:
+            results = _page_flight.do(("playlist_items", playlist_id, offset, limit), fetch,
+                                      cancel_event=cancel_event)
+        except SpotifyException:
+            if fetched_here:
+                raise
+            # Only successful pages are shared: the leader's error (say, its token
+            # expiring) says nothing about this caller, so ask again with its own client.
+            results = fetch(None)
+        yield results['items']
+        if len(results['items']) < limit:
+            break
+        offset += limit
+
+PLAYLIST_FETCH_WORKERS = 4
+
+
+def iter_playlists_pages(sp, playlist_ids, cancel_event=None):
+    """
+    Yield the track pages of one playlist id or a list of them. Several playlists are
+    paginated concurrently, but their pages are yielded in playlist order so the merged
+    result does not depend on which playlist answered first.
+    """
+    if isinstance(playlist_ids, str):
+        yield from iter_playlist_pages(sp, playlist_ids, cancel_event)
+        return
+    if len(playlist_ids) == 1:
+        yield from iter_playlist_pages(sp, playlist_ids[0], cancel_event)
+        return
+
+    queues = [queue.Queue() for _ in playlist_ids]
+    stop = threading.Event()
+    finished = object()
+
+    def produce(index, playlist_id):
+        try:
+            for page in iter_playlist_pages(sp, playlist_id, cancel_event):
+                if stop.is_set():
+                    break
+                queues[index].put(page)
+            queues[index].put(finished)
+        except BaseException as e:
+            queues[index].put(e)
+
+    with ThreadPoolExecutor(max_workers=min(PLAYLIST_FETCH_WORKERS, len(playlist_ids)),
+                            thread_name_prefix="playlists") as pool:
+        for index, playlist_id in enumerate(playlist_ids):
+            pool.submit(produce, index, playlist_id)
+        try:
+            for pages in queues:
+                while True:
+                    page = pages.get()
+                    if page is finished:
+                        break
+                    if isinstance(page, BaseException):
+                        raise page
+                    yield page
+        finally:
+            # The consumer may stop early (a full AlbumStore, an error): let producers wind down.
+            stop.set()
+
+def iter_top_pages(sp, time_range="medium_term", cancel_event=None, priority=PRIORITY_BULK):
+    offset = 0
+    limit = 50
+    while True:
+        check_cancelled(cancel_event)
+        results = spotify_governor.call(sp.current_user_top_tracks, limit=limit, offset=offset,
+                                        time_range=time_range, priority=priority,
+                                        cancel_event=cancel_event)
+        yield results['items']
         if len(results['items']) < limit:
             break
         offset += limit
-    return tracks
 
-def fetch_top_tracks(sp, time_range="medium_term"):
-    tracks = []
+def iter_saved_pages(sp, cancel_event=None):
+    """Yield the user's Liked Songs one page at a time."""
     offset = 0
     limit = 50
     while True:
-        results = sp.current_user_top_tracks(limit=limit, offset=offset, time_range=time_range)
-        tracks.extend(results['items'])
+        check_cancelled(cancel_event)
+        results = spotify_governor.call(sp.current_user_saved_tracks, limit=limit, offset=offset,
+                                        cancel_event=cancel_event)
+        yield results['items']
         if len(results['items']) < limit:
             break
         offset += limit
-    return tracks
+
+def fetch_playlist_tracks(sp, playlist_id, cancel_event=None):
+    """Track items of a playlist, or of a list of playlists one after another."""
+    return [item for page in iter_playlists_pages(sp, playlist_id, cancel_event) for item in page]
+
+def fetch_top_tracks(sp, time_range="medium_term", cancel_event=None, priority=PRIORITY_BULK):
+    return [item for page in iter_top_pages(sp, time_range, cancel_event, priority) for item in page]
+
+def fetch_saved_tracks(sp, cancel_event=None):
+    return [item for page in iter_saved_pages(sp, cancel_event) for item in page]
+
+def iter_track_pages(sp, mode, playlist_id=None, time_range="medium_term", cancel_event=None):
+    if mode == 'playlist':
+        return iter_playlists_pages(sp, playlist_id, cancel_event)
+    if mode == 'saved':
+        return iter_saved_pages(sp, cancel_event)
+    return iter_top_pages(sp, time_range, cancel_event)
 
 def get_album_art_from_tracks(tracks):
     results = []
@@ -60,6 +622,19 @@ def get_album_art_from_tracks(tracks):
             continue
     return results
 
+def get_thumbnail_urls(tracks):
+    """Map each album's full-size cover URL to its smallest variant (Spotify's 64px)."""
+    thumbs = {}
+    for item in tracks:
+        try:
+            album = item['track']['album'] if 'track' in item else item['album']
+            images = album['images']
+            smallest = min(images, key=lambda image: image.get('width') or 0)
+            thumbs[images[0]['url']] = smallest['url']
+        except (TypeError, KeyError, IndexError, ValueError):
+            continue
+    return thumbs
+
 def remove_duplicates(album_entries):
     seen_ids = set()
     seen_urls = set()
@@ -71,18 +646,119 @@ def remove_duplicates(album_entries):
             unique.append((album_id, url))
     return unique
 
+class AlbumStore:
+    """
+    Album entries for a large-library generation, kept in flat lists and arrays
+    instead of the raw track items: the cover and 64px URLs of each unique album,
+    then for each cover that made it through processing its index, hue and a
+    cell-size JPEG thumbnail.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.thumb_urls = []
+        self.tracks = 0
+        self.duplicates = 0
+        self._seen = set()
+        self.kept = array("I")
+        self.hues = array("f")
+        self.thumbs = []
+        self.thumb_bytes = 0
+
+    def add_tracks(self, items, remove_dups=False, limit=None):
+        """Add one page of track items. Returns False once limit entries are held."""
+        thumbs = get_thumbnail_urls(items)
+        for album_id, url in get_album_art_from_tracks(items):
+            if limit is not None and len(self.urls) >= limit:
+                return False
+            self.tracks += 1
+            if remove_dups:
+                if album_id in self._seen or url in self._seen:
+                    self.duplicates += 1
+                    continue
+                self._seen.add(album_id)
+                self._seen.add(url)
+            self.urls.append(url)
+            self.thumb_urls.append(thumbs.get(url, url))
+        return limit is None or len(self.urls) < limit
+
+    def keep(self, index, hue, thumb):
+        self.kept.append(index)
+        self.hues.append(hue)
+        self.thumbs.append(thumb)
+        self.thumb_bytes += len(thumb)
+
+    def hue_order(self):
+        """Positions in the kept arrays, ordered by hue."""
+        return np.argsort(np.frombuffer(self.hues, dtype=np.float32), kind="stable").tolist()
+
 def get_dominant_color(image):
     image = image.convert("RGB").resize((1, 1))
     dominant_color = image.getpixel((0, 0))
     return colorsys.rgb_to_hsv(*[x / 255.0 for x in dominant_color])
 
-def download_image(url):
-    response = requests.get(url)
-    return Image.open(BytesIO(response.content))
+DOWNLOAD_TIMEOUT_SECONDS = 15
+
+
+def fetch_image_bytes(url):
+    response = _cdn_http.get(url, timeout=DOWNLOAD_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.content
+
+def _fetch_and_cache(url):
+    content = fetch_image_bytes(url)
+    # Only bytes that parse as an image are cached, so one bad response can't stick
+    # to the URL (or, with a disk tier, survive restarts).
+    Image.open(BytesIO(content))
+    cover_cache.put(url, content)
+    return content
+
+def download_image(url, stats=None):
+    # Concurrent downloads of one URL share the bytes; each caller decodes its
+    # own copy since PIL images are not safe to load from several threads.
+    entry = cover_cache.get(url)
+    if entry is not None:
+        try:
+            img = Image.open(BytesIO(entry["data"]))
+            _count(stats, "cache_hits")
+            return img
+        except UnidentifiedImageError:
+            # Written by an older version that cached error pages; fetch it again.
+            cover_cache.discard(url)
+    content = _download_flight.do(url, lambda report: _fetch_and_cache(url))
+    _count(stats, "cache_misses")
+    _count(stats, "bytes_downloaded", len(content))
+    return Image.open(BytesIO(content))
+
+def cover_features(url, img, with_hash=False, stats=None):
+    """Return (dominant_hsv, dhash or None) for a cover, reusing cached analysis."""
+    cached = cover_cache.features(url)
+    color = cached.get("color")
+    h = cached.get("hash")
+    if color is None:
+        with timed_stage(stats, "analyse"):
+            color = get_dominant_color(img)
+        cover_cache.set_features(url, color=color)
+    if with_hash and h is None:
+        with timed_stage(stats, "hash"):
+            h = image_hash(img)
+        cover_cache.set_features(url, hash=h)
+    return color, h
+
+def _draft(img, size):
+    """Let a not-yet-decoded JPEG decode at the smallest power-of-two scale no smaller than size."""
+    if size and img.format == "JPEG":
+        img.draft("RGB", size)
+    return img
+
+def warm_cover(url):
+    """Download and analyse a cover into the cache ahead of a generation that may need it."""
+    img = download_image(url)
+    cover_features(url, img, with_hash=True)
 
 def image_hash(img, size=8):
     """Compute a difference hash for visual dedup."""
-    small = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    small = img.convert("L").resize((size + 1, size), Image.BOX)
     pixels = list(small.getdata())
     bits = []
     for row in range(size):
@@ -90,100 +766,498 @@ def image_hash(img, size=8):
             bits.append(pixels[row * (size + 1) + col] < pixels[row * (size + 1) + col + 1])
     return tuple(bits)
 
-def round_image(img, radius):
+@functools.lru_cache(maxsize=64)
+def _corner_mask(radius):
+    """
+    The outside of a rounded rectangle's corners, drawn once per radius: an "L" image whose
+    radius + 1 square at each corner is 255 where that corner is cut away. Only these
+    regions of a full-size mask differ from 255.
+    """
     from PIL import ImageDraw
-    result = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    mask = Image.new("L", img.size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([0, 0, img.size[0]-1, img.size[1]-1], radius=radius, fill=255)
-    result.paste(img.convert("RGB"), mask=mask)
+    # A little larger than the corners themselves: at exactly 2 * (radius + 1), Pillow
+    # rasterises the arcs differently than it does for a big canvas.
+    side = 2 * radius + 4
+    mask = Image.new("L", (side, side), 0)
+    ImageDraw.Draw(mask).rounded_rectangle([0, 0, side - 1, side - 1], radius=radius, fill=255)
+    return mask.point(lambda v: 255 - v)
+
+
+def _cut_corners(image, radius, fill, offset=(0, 0), size=None):
+    """Paste fill over the outside of each rounded corner of the size-d box at offset,
+    touching only the four corner regions."""
+    mask = _corner_mask(radius)
+    c = radius + 1
+    far = mask.width - c
+    x0, y0 = offset
+    w, h = size or image.size
+    for mx, my, x, y in ((0, 0, x0, y0), (far, 0, x0 + w - c, y0),
+                         (0, far, x0, y0 + h - c), (far, far, x0 + w - c, y0 + h - c)):
+        image.paste(fill, (x, y, x + c, y + c), mask.crop((mx, my, mx + c, my + c)))
+
+
+def round_image(img, radius):
+    if 2 * radius + 4 > min(img.size):
+        from PIL import ImageDraw
+        result = Image.new("RGBA", img.size, (0, 0, 0, 0))
+        mask = Image.new("L", img.size, 0)
+        ImageDraw.Draw(mask).rounded_rectangle([0, 0, img.size[0]-1, img.size[1]-1], radius=radius, fill=255)
+        result.paste(img.convert("RGB"), mask=mask)
+        return result
+    # Any existing alpha is replaced by the rounded shape.
+    result = img.convert("RGBA") if img.mode == "RGB" else img.convert("RGB").convert("RGBA")
+    _cut_corners(result, radius, (0, 0, 0, 0))
     return result
 
-def create_normal_grid(images, grid_size, cell_size=100):
+def grid_positions(pattern, grid_size):
+    """Yield the (col, row) cells a pattern fills, in the order covers are placed."""
+    if pattern == 'diagonal':
+        for diag in range(2 * grid_size - 1):
+            for row in range(grid_size):
+                col = diag - row
+                if 0 <= col < grid_size:
+                    yield col, row
+    elif pattern == 'checkered':
+        for row in range(grid_size):
+            for col in range(grid_size):
+                if (row + col) % 2 == 0:
+                    yield col, row
+    elif pattern == 'spiral':
+        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+        direction_idx = 0
+        x, y = 0, 0
+        boundaries = [0, grid_size - 1, grid_size - 1, 0]
+        for _ in range(grid_size * grid_size):
+            yield y, x
+            dx, dy = directions[direction_idx]
+            nx, ny = x + dx, y + dy
+            if not (boundaries[3] <= ny <= boundaries[1] and boundaries[0] <= nx <= boundaries[2]):
+                if direction_idx == 0: boundaries[0] += 1
+                elif direction_idx == 1: boundaries[1] -= 1
+                elif direction_idx == 2: boundaries[2] -= 1
+                elif direction_idx == 3: boundaries[3] += 1
+                direction_idx = (direction_idx + 1) % 4
+                dx, dy = directions[direction_idx]
+            x, y = x + dx, y + dy
+    else:
+        for row in range(grid_size):
+            for col in range(grid_size):
+                yield col, row
+
+RESAMPLING_TIERS = ("fast", "balanced", "high")
+
+# sRGB decoding for every 8-bit value, for resampling in linear light.
+_SRGB_TO_LINEAR = np.array(
+    [v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4 for v in (i / 255.0 for i in range(256))],
+    dtype=np.float32,
+)
+
+
+def _linear_to_srgb(linear):
+    linear = np.clip(linear, 0.0, 1.0)
+    srgb = np.where(linear <= 0.0031308, linear * 12.92, 1.055 * np.power(linear, 1 / 2.4) - 0.055)
+    return np.round(srgb * 255.0).astype(np.uint8)
+
+
+def _resize_linear(img, size):
+    """Gamma-correct Lanczos downscale: filter in linear light rather than on sRGB values,
+    so fine detail averages to the right brightness instead of darkening."""
+    linear = _SRGB_TO_LINEAR[np.asarray(img.convert("RGB"))]
+    channels = [
+        np.asarray(Image.fromarray(np.ascontiguousarray(linear[:, :, c]), "F").resize(size, Image.LANCZOS))
+        for c in range(3)
+    ]
+    return Image.fromarray(_linear_to_srgb(np.stack(channels, axis=-1)), "RGB")
+
+
+def resample(img, size, resampling="balanced"):
+    """
+    Resize a cover to size with one of RESAMPLING_TIERS:
+    fast: integer reduce() then a box filter; balanced: Pillow's default bicubic;
+    high: gamma-correct Lanczos.
+    """
+    if resampling == "fast":
+        factor = min(img.width // size[0], img.height // size[1])
+        if factor > 1:
+            img = img.reduce(factor)
+        return img if img.size == size else img.resize(size, Image.BOX)
+    if resampling == "high":
+        return img if img.size == size else _resize_linear(img, size)
+    return img.resize(size)
+
+
+def _compose_grid(images, grid_size, cell_size, pattern, resampling="balanced"):
     grid_img = Image.new('RGB', (cell_size * grid_size, cell_size * grid_size))
-    for idx, img in enumerate(images):
-        row = idx // grid_size
-        col = idx % grid_size
-        img_resized = img.resize((cell_size, cell_size))
+    for img, (col, row) in zip(images, grid_positions(pattern, grid_size)):
+        img_resized = resample(img, (cell_size, cell_size), resampling)
         grid_img.paste(img_resized, (col * cell_size, row * cell_size))
     return grid_img
 
+def create_normal_grid(images, grid_size, cell_size=100):
+    return _compose_grid(images, grid_size, cell_size, 'normal')
+
 def create_diagonal_grid(images, grid_size, cell_size=100):
-    grid_img = Image.new('RGB', (cell_size * grid_size, cell_size * grid_size))
-    idx = 0
-    for diag in range(2 * grid_size - 1):
-        for row in range(grid_size):
-            col = diag - row
-            if 0 <= col < grid_size and idx < len(images):
-                img_resized = images[idx].resize((cell_size, cell_size))
-                grid_img.paste(img_resized, (col * cell_size, row * cell_size))
-                idx += 1
-    return grid_img
+    return _compose_grid(images, grid_size, cell_size, 'diagonal')
 
 def create_checkered_grid(images, grid_size, cell_size=100):
-    grid_img = Image.new('RGB', (cell_size * grid_size, cell_size * grid_size))
-    idx = 0
-    for row in range(grid_size):
-        for col in range(grid_size):
-            if (row + col) % 2 == 0 and idx < len(images):
-                img_resized = images[idx].resize((cell_size, cell_size))
-                grid_img.paste(img_resized, (col * cell_size, row * cell_size))
-                idx += 1
-    return grid_img
+    return _compose_grid(images, grid_size, cell_size, 'checkered')
 
 def create_spiral_grid(images, grid_size, cell_size=100):
-    grid_img = Image.new('RGB', (cell_size * grid_size, cell_size * grid_size))
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-    direction_idx = 0
-    x, y = 0, 0
-    boundaries = [0, grid_size - 1, grid_size - 1, 0]
-    for idx, img in enumerate(images):
-        img_resized = img.resize((cell_size, cell_size))
-        grid_img.paste(img_resized, (y * cell_size, x * cell_size))
-        dx, dy = directions[direction_idx]
-        nx, ny = x + dx, y + dy
-        if not (boundaries[3] <= ny <= boundaries[1] and boundaries[0] <= nx <= boundaries[2]):
-            if direction_idx == 0: boundaries[0] += 1
-            elif direction_idx == 1: boundaries[1] -= 1
-            elif direction_idx == 2: boundaries[2] -= 1
-            elif direction_idx == 3: boundaries[3] += 1
-            direction_idx = (direction_idx + 1) % 4
-            dx, dy = directions[direction_idx]
-        x, y = x + dx, y + dy
-    return grid_img
+    return _compose_grid(images, grid_size, cell_size, 'spiral')
+
+FRAME_PASTE_ROWS = 256
+
 
 def add_frame(image, padding_ratio=0.04, bg_color=(18, 18, 18), corner_radius_ratio=0.03):
-    from PIL import ImageDraw
     w, h = image.size
     pad = max(int(max(w, h) * padding_ratio), 8)
     inner_radius = max(int(max(w, h) * corner_radius_ratio), 6)
     new_w, new_h = w + 2 * pad, h + 2 * pad
     outer_radius = inner_radius + pad
 
-    framed = Image.new("RGBA", (new_w, new_h), (0, 0, 0, 0))
+    if 2 * inner_radius + 4 > min(w, h):
+        # Corners that meet: a tiny image, so full-size masks cost nothing.
+        from PIL import ImageDraw
+        framed = Image.new("RGBA", (new_w, new_h), (0, 0, 0, 0))
+        outer_mask = Image.new("L", (new_w, new_h), 0)
+        ImageDraw.Draw(outer_mask).rounded_rectangle([0, 0, new_w - 1, new_h - 1], radius=outer_radius, fill=255)
+        framed.paste((*bg_color, 255), mask=outer_mask)
+        inner_mask = Image.new("L", (w, h), 0)
+        ImageDraw.Draw(inner_mask).rounded_rectangle([0, 0, w - 1, h - 1], radius=inner_radius, fill=255)
+        framed.paste(image.convert("RGBA"), (pad, pad), inner_mask)
+        return framed
+
+    # Only the corner regions need masks; the border is the background colour already.
+    framed = Image.new("RGBA", (new_w, new_h), (*bg_color, 255))
+    _cut_corners(framed, outer_radius, (0, 0, 0, 0))
+    # Paste in bands, so converting to RGBA never needs a second full-size copy.
+    for top in range(0, h, FRAME_PASTE_ROWS):
+        band = image.crop((0, top, w, min(h, top + FRAME_PASTE_ROWS)))
+        framed.paste(band.convert("RGBA"), (pad, pad + top))
+    _cut_corners(framed, inner_radius, (*bg_color, 255), offset=(pad, pad), size=(w, h))
+    return framed
 
-    bg = Image.new("RGBA", (new_w, new_h), (*bg_color, 255))
-    outer_mask = Image.new("L", (new_w, new_h), 0)
-    draw_outer = ImageDraw.Draw(outer_mask)
-    draw_outer.rounded_rectangle([0, 0, new_w - 1, new_h - 1], radius=outer_radius, fill=255)
-    framed.paste(bg, mask=outer_mask)
+PREVIEW_MAX_PIXELS = 256
+PREVIEW_INTERVAL_SECONDS = 0.5
+PREVIEW_JPEG_QUALITY = 60
 
-    inner_mask = Image.new("L", (w, h), 0)
-    draw_inner = ImageDraw.Draw(inner_mask)
-    draw_inner.rounded_rectangle([0, 0, w - 1, h - 1], radius=inner_radius, fill=255)
-    framed.paste(image.convert("RGBA"), (pad, pad), inner_mask)
 
-    return framed
+class ProgressivePreview:
+    """
+    A small canvas of the grid as it fills in, handed to publish as JPEG bytes at
+    most once per interval. Covers land in download order until the real layout
+    has been composited.
+    """
+
+    def __init__(self, grid_size, publish, max_pixels=PREVIEW_MAX_PIXELS, interval=PREVIEW_INTERVAL_SECONDS):
+        self.grid_size = max(1, grid_size)
+        self.cell = max(1, max_pixels // self.grid_size)
+        self.canvas = Image.new("RGB", (self.cell * self.grid_size, self.cell * self.grid_size), (18, 18, 18))
+        self.publish = publish
+        self.interval = interval
+        self.published = 0
+        self._last_published = None
+
+    def add(self, index, img):
+        if index >= self.grid_size * self.grid_size:
+            return
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGB")
+        # A box reduce first keeps the resize from filtering the whole 640px cover.
+        factor = min(img.size) // (self.cell * 2)
+        thumb = img.reduce(factor) if factor > 1 else img
+        row, col = divmod(index, self.grid_size)
+        self.canvas.paste(thumb.convert("RGB").resize((self.cell, self.cell)), (col * self.cell, row * self.cell))
+        self.maybe_publish()
+
+    def show_composite(self, grid_image):
+        """Switch to a downscale of the composited grid. reduce() reads the compositor's
+        buffer directly, so no full-resolution copy is made."""
+        factor = grid_image.width // self.canvas.width
+        self.canvas = grid_image.reduce(factor) if factor > 1 else grid_image.copy()
+        self.maybe_publish(force=True)
+
+    def maybe_publish(self, force=False):
+        now = time.monotonic()
+        if not force and self._last_published is not None and now - self._last_published < self.interval:
+            return
+        self._last_published = now
+        buf = BytesIO()
+        self.canvas.convert("RGB").save(buf, "JPEG", quality=PREVIEW_JPEG_QUALITY)
+        self.published += 1
+        self.publish(buf.getvalue())
+
+
+def _finish_grid(images, grid_size, cell_size, pattern, rounded, framed, stats, step=None, resampling="balanced"):
+    """Composite one output size, then round and frame it. step(message) is called
+    before each optional stage so sequential renders can report progress."""
+    with timed_stage(stats, "composite"):
+        grid_image = _compose_grid(images, grid_size, cell_size, pattern, resampling)
+
+    if rounded:
+        if step:
+            step("Rounding corners...")
+        with timed_stage(stats, "round"):
+            radius = max(1, grid_image.width // 20)
+            grid_image = round_image(grid_image, radius)
+
+    if framed:
+        if step:
+            step("Adding frame...")
+        with timed_stage(stats, "frame"):
+            grid_image = add_frame(grid_image)
+    return grid_image
+
+
+def _composite_outputs(cells, grid_size, pattern, cell_sizes, rounded, framed, stats, step, resampling="balanced"):
+    """
+    Build one finished grid per cell size. cells() returns a fresh iterable of covers in
+    placement order; with several sizes they are composited in parallel, each from its
+    own iterable. Returns {cell_size: image}.
+    """
+    if len(cell_sizes) == 1:
+        return {cell_sizes[0]: _finish_grid(cells(), grid_size, cell_sizes[0], pattern,
+                                            rounded, framed, stats, step, resampling)}
+    size_stats = {size: new_stats() for size in cell_sizes}
+    with ThreadPoolExecutor(max_workers=len(cell_sizes), thread_name_prefix="bundle") as pool:
+        futures = {size: pool.submit(_finish_grid, cells(), grid_size, size, pattern,
+                                     rounded, framed, size_stats[size], None, resampling)
+                   for size in cell_sizes}
+        grid_images = {size: future.result() for size, future in futures.items()}
+    for per_size in size_stats.values():
+        for stage, seconds in per_size["stages"].items():
+            stats["stages"][stage] = stats["stages"].get(stage, 0.0) + seconds
+    return grid_images
+
+
+def _render_covers(album_urls, remove_dups, pattern, cell_sizes, rounded, framed,
+                   report, cancel_event, preview_callback=None, layout_callback=None, tiles_callback=None,
+                   resampling="balanced"):
+    """Download, analyse, sort and composite covers; the part of a generation shared by
+    concurrent requests for the same album set and options. Returns ({cell_size: image}, stats)."""
+    stats = new_stats()
+    total_downloads = len(album_urls)
+    preview = None
+    if preview_callback:
+        preview = ProgressivePreview(calculate_grid_size(total_downloads), preview_callback)
+
+    # Only a cell-size thumbnail of each cover is kept; the full decode is dropped at once.
+    thumb_size = max(cell_sizes)
+    draft = (thumb_size, thumb_size) if resampling == "fast" else None
+    held_bytes = 0
+    images = []
+    urls = []
+    colors = []
+    seen_hashes = set()
+    for i, url in enumerate(album_urls):
+        check_cancelled(cancel_event)
+        report(i, total_downloads, f"Downloading cover {i + 1} of {total_downloads}...")
+        try:
+            with timed_stage(stats, "download"):
+                img = _draft(download_image(url, stats), draft)
+            color, h = cover_features(url, img, with_hash=remove_dups, stats=stats)
+            if remove_dups:
+                if h in seen_hashes:
+                    stats["duplicates_dropped"] += 1
+                    continue
+                seen_hashes.add(h)
+            if preview is not None:
+                with timed_stage(stats, "preview"):
+                    preview.add(len(images), img)
+            with timed_stage(stats, "thumbnail"):
+                thumb = resample(img.convert("RGB"), (thumb_size, thumb_size), resampling)
+            stats["peak_image_bytes"] = max(stats["peak_image_bytes"], held_bytes + image_bytes(img))
+            img = None
+            held_bytes += image_bytes(thumb)
+            images.append(thumb)
+            urls.append(url)
+            colors.append(color)
+        except Exception as e:
+            stats["download_failures"] += 1
+            print(f"Error downloading {url}: {e}")
+
+    check_cancelled(cancel_event)
+    report(total_downloads, total_downloads, "Sorting by color...")
+
+    with timed_stage(stats, "sort"):
+        sorted_indices = np.argsort([c[0] for c in colors])
+        images = [images[i] for i in sorted_indices]
+        urls = [urls[i] for i in sorted_indices]
+
+        grid_size = calculate_grid_size(len(images))
+        images = images[:grid_size * grid_size]
+    stats["covers"] = len(images)
+    stats["grid_size"] = grid_size
+
+    if layout_callback:
+        layout_callback({
+            "grid_size": grid_size,
+            "cell_size": max(cell_sizes),
+            "pattern": pattern,
+            "slots": [[col, row, url] for url, (col, row) in zip(urls, grid_positions(pattern, grid_size))],
+        })
+    if tiles_callback:
+        tiles_callback(grid_size, thumb_size, pattern, lambda index, size: images[index])
+
+    check_cancelled(cancel_event)
+    report(total_downloads, total_downloads, "Building grid...")
+
+    def step(message):
+        check_cancelled(cancel_event)
+        report(total_downloads, total_downloads, message)
+
+    # With several sizes, the smaller outputs scale down from the largest-size thumbnails.
+    grid_images = _composite_outputs(lambda: images, grid_size, pattern, cell_sizes, rounded, framed, stats, step,
+                                     resampling)
+    stats["peak_image_bytes"] = max(stats["peak_image_bytes"],
+                                    held_bytes + sum(image_bytes(g) for g in grid_images.values()))
+
+    if preview is not None:
+        with timed_stage(stats, "preview"):
+            preview.show_composite(grid_images[max(cell_sizes)])
+
+    report(total_downloads, total_downloads, "Done!")
+    return grid_images, stats
+
+
+LARGE_CHUNK_SIZE = 64
+LARGE_DOWNLOAD_WORKERS = 8
+THUMBNAIL_JPEG_QUALITY = 90
+
+
+def _hash_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return value
+
+
+def _process_cover(url, thumb_size, with_hash, resampling="balanced"):
+    """Download and analyse one cover, returning (hue, hash, thumbnail JPEG bytes, stats).
+    The full-size decode is dropped before returning."""
+    stats = new_stats()
+    draft = (thumb_size, thumb_size) if resampling == "fast" else None
+    with timed_stage(stats, "download"):
+        img = _draft(download_image(url, stats), draft)
+    color, h = cover_features(url, img, with_hash=with_hash, stats=stats)
+    with timed_stage(stats, "thumbnail"):
+        buf = BytesIO()
+        thumb = resample(img.convert("RGB"), (thumb_size, thumb_size), resampling)
+        thumb.save(buf, "JPEG", quality=THUMBNAIL_JPEG_QUALITY)
+    stats["peak_image_bytes"] = image_bytes(img)
+    return color[0], (_hash_to_int(h) if with_hash else None), buf.getvalue(), stats
+
+
+def _open_thumb(data, size=None):
+    """Open a stored JPEG thumbnail, letting the decoder scale down when only size is needed."""
+    return _draft(Image.open(BytesIO(data)), size)
+
+
+def _render_large(store, grid_size, remove_dups, pattern, cell_sizes, rounded, framed,
+                  report, cancel_event, preview_callback=None, layout_callback=None, tiles_callback=None,
+                  resampling="balanced"):
+    """
+    The large-library counterpart of _render_covers. Covers are processed in chunks on a
+    small thread pool and each is reduced to a JPEG thumbnail at the largest cell size
+    straight away, so memory grows with the (compressed) thumbnails rather than with
+    decoded covers. Dropped or failed covers are backfilled from the rest of the store.
+    """
+    stats = new_stats()
+    needed = grid_size * grid_size
+    thumb_size = max(cell_sizes)
+    preview = ProgressivePreview(grid_size, preview_callback) if preview_callback else None
+    seen_hashes = set()
+
+    def process(index):
+        try:
+            return _process_cover(store.urls[index], thumb_size, remove_dups, resampling)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"Error downloading {store.urls[index]}: {e}")
+            return None
+
+    next_index = 0
+    with ThreadPoolExecutor(max_workers=LARGE_DOWNLOAD_WORKERS, thread_name_prefix="covers") as pool:
+        while len(store.kept) < needed and next_index < len(store.urls):
+            check_cancelled(cancel_event)
+            report(len(store.kept), needed, f"Processing covers: {len(store.kept)} of {needed}...")
+            chunk = range(next_index, min(len(store.urls), next_index + min(LARGE_CHUNK_SIZE, needed - len(store.kept))))
+            next_index = chunk.stop
+            largest_decode = 0
+            for index, result in zip(chunk, pool.map(process, chunk)):
+                if result is None:
+                    stats["download_failures"] += 1
+                    continue
+                hue, h, thumb, cover_stats = result
+                largest_decode = max(largest_decode, cover_stats.pop("peak_image_bytes"))
+                _merge_stats(stats, cover_stats)
+                if remove_dups:
+                    if h in seen_hashes:
+                        stats["duplicates_dropped"] += 1
+                        continue
+                    seen_hashes.add(h)
+                if preview is not None:
+                    with timed_stage(stats, "preview"):
+                        preview.add(len(store.kept), Image.open(BytesIO(thumb)))
+                store.keep(index, hue, thumb)
+            # Up to one full decode per worker is alive at once, on top of the stored thumbnails.
+            in_flight = largest_decode * min(LARGE_DOWNLOAD_WORKERS, len(chunk))
+            stats["peak_image_bytes"] = max(stats["peak_image_bytes"], store.thumb_bytes + in_flight)
+
+    check_cancelled(cancel_event)
+    report(needed, needed, "Sorting by color...")
+    with timed_stage(stats, "sort"):
+        grid_size = min(grid_size, calculate_grid_size(len(store.kept)))
+        order = store.hue_order()[:grid_size * grid_size]
+    stats["covers"] = len(order)
+    stats["grid_size"] = grid_size
+
+    if layout_callback:
+        layout_callback({
+            "grid_size": grid_size,
+            "cell_size": thumb_size,
+            "pattern": pattern,
+            "slots": [[col, row, store.thumb_urls[store.kept[k]]]
+                      for k, (col, row) in zip(order, grid_positions(pattern, grid_size))],
+        })
+    if tiles_callback:
+        tiles_callback(grid_size, thumb_size, pattern, lambda index, size: _open_thumb(store.thumbs[order[index]], size))
+
+    check_cancelled(cancel_event)
+    report(needed, needed, "Building grid...")
+
+    def cells():
+        for k in order:
+            yield Image.open(BytesIO(store.thumbs[k]))
+
+    def step(message):
+        check_cancelled(cancel_event)
+        report(needed, needed, message)
+
+    grid_images = _composite_outputs(cells, grid_size, pattern, cell_sizes, rounded, framed, stats, step, resampling)
+    stats["peak_image_bytes"] = max(stats["peak_image_bytes"],
+                                    store.thumb_bytes + sum(image_bytes(g) for g in grid_images.values()))
+
+    if preview is not None:
+        with timed_stage(stats, "preview"):
+            preview.show_composite(grid_images[thumb_size])
+
+    report(needed, needed, "Done!")
+    return grid_images, stats
+
 
 def generate_album_grid(sp, mode="playlist", playlist_id=None, remove_dups=False,
                         pattern="normal", time_range="medium_term", cell_size=100,
                         rounded=False, framed=False, grid_size_override=None,
-                        progress_callback=None):
+                        progress_callback=None, cancel_event=None, tracks=None, stats=None,
+                        preview_callback=None, layout_callback=None, large_library=False,
+                        tiles_callback=None, resampling="balanced"):
     """
     Main function to generate the album grid image (as a PIL Image object).
     :param sp: Spotipy client
-    :param mode: 'playlist' or 'top'
-    :param playlist_id: if 'playlist' mode, pass a valid playlist_id
+    :param mode: 'playlist', 'top' or 'saved' (Liked Songs)
+    :param playlist_id: if 'playlist' mode, pass a valid playlist_id, or a list of them to
+                        merge several playlists (fetched concurrently) into one grid
     :param remove_dups: bool to remove duplicate covers
     :param pattern: one of ['normal','diagonal','spiral','checkered']
     :param time_range: one of ['short_term','medium_term','long_term'] (top tracks only)
@@ -192,32 +1266,145 @@ def generate_album_grid(sp, mode="playlist", playlist_id=None, remove_dups=False
     :param framed: bool to add a dark rounded frame around the final image
     :param grid_size_override: optional int to force a specific grid size (e.g. 10 for 10x10)
     :param progress_callback: optional callable(current, total, message)
+    :param cancel_event: optional threading.Event; once set, the generation stops at the
+                         next stage or download boundary by raising GenerationCancelled
+    :param tracks: optional already-fetched track items; skips fetching from Spotify
+    :param stats: optional dict from new_stats(); filled with stage timings and counters
+    :param preview_callback: optional callable(jpeg_bytes) receiving small, rate-limited
+                             snapshots of the grid as it fills in (only for the caller
+                             that actually renders; coalesced callers get text progress)
+    :param layout_callback: optional callable(layout) called once the sort order is known,
+                            with the grid size, pattern and a [col, row, thumbnail_url]
+                            slot per cover, so a client can draw the grid before it is encoded
+    :param large_library: stream tracks and process covers in chunks, allowing up to
+                          LARGE_MAX_COVERS covers instead of MAX_COVERS; switched on
+                          automatically when grid_size_override needs more than MAX_COVERS
+    :param tiles_callback: optional callable(grid_size, cell_size, pattern, get_cell) called
+                           once the sort order is known, where get_cell(index, size) returns
+                           the index-th placed cover; enough to build deepzoom.DeepZoom tiles
+                           before the flat grid is composited
+    :param resampling: one of RESAMPLING_TIERS; 'fast' decodes JPEGs in draft mode and
+                       downsizes with reduce() and a box filter, 'balanced' is Pillow's
+                       bicubic, 'high' is gamma-correct Lanczos
     :return: A PIL Image object with the final collage
     """
+    return _generate_grids(
+        sp, mode, playlist_id, remove_dups, pattern, time_range, (cell_size,), rounded, framed,
+        grid_size_override, progress_callback, cancel_event, tracks, stats, preview_callback, layout_callback,
+        large_library, tiles_callback, resampling,
+    )[cell_size]
+
+
+BUNDLE_CELL_SIZES = (100, 200, 300)
+
+
+def generate_album_grid_bundle(sp, cell_sizes=BUNDLE_CELL_SIZES, mode="playlist", playlist_id=None,
+                               remove_dups=False, pattern="normal", time_range="medium_term",
+                               rounded=False, framed=False, grid_size_override=None,
+                               progress_callback=None, cancel_event=None, tracks=None, stats=None,
+                               preview_callback=None, layout_callback=None, large_library=False,
+                               tiles_callback=None, resampling="balanced"):
+    """
+    Like generate_album_grid, but builds the grid at several cell sizes from a single
+    download and analysis pass. Covers are resampled once to the largest size, and
+    the outputs are composited in parallel.
+    :param cell_sizes: pixel sizes of a grid cell, one output each
+    :return: dict of cell size -> PIL Image
+    """
+    return _generate_grids(
+        sp, mode, playlist_id, remove_dups, pattern, time_range, tuple(sorted(set(cell_sizes))),
+        rounded, framed, grid_size_override, progress_callback, cancel_event, tracks, stats,
+        preview_callback, layout_callback, large_library, tiles_callback, resampling,
+    )
+
+
+def _generate_grids(sp, mode, playlist_id, remove_dups, pattern, time_range, cell_sizes, rounded, framed,
+                    grid_size_override, progress_callback, cancel_event, tracks, stats,
+                    preview_callback, layout_callback, large_library=False, tiles_callback=None,
+                    resampling="balanced"):
+    if resampling not in RESAMPLING_TIERS:
+        raise ValueError(f"Unknown resampling tier {resampling!r}; expected one of {RESAMPLING_TIERS}.")
+
     def report(current, total, message):
         if progress_callback:
             progress_callback(current, total, message)
 
+    if grid_size_override and grid_size_override * grid_size_override > MAX_COVERS:
+        large_library = True
+    if large_library:
+        if grid_size_override and grid_size_override * max(cell_sizes) > LARGE_MAX_OUTPUT_EDGE:
+            raise ValueError(
+                f"A {grid_size_override}\u00d7{grid_size_override} grid of {max(cell_sizes)}px covers is too large; "
+                f"the image may be at most {LARGE_MAX_OUTPUT_EDGE}px wide. Try a smaller grid or cell size."
+            )
+        return _generate_large(sp, mode, playlist_id, remove_dups, pattern, time_range, cell_sizes,
+                               rounded, framed, grid_size_override, progress_callback, cancel_event,
+                               tracks, stats, preview_callback, layout_callback, report, tiles_callback,
+                               resampling)
+
     report(0, 1, "Fetching tracks from Spotify...")
 
-    if mode == 'playlist':
-        tracks = fetch_playlist_tracks(sp, playlist_id)
-    else:
-        tracks = fetch_top_tracks(sp, time_range=time_range)
+    if tracks is None:
+        with timed_stage(stats, "fetch"):
+            if mode == 'playlist':
+                tracks = fetch_playlist_tracks(sp, playlist_id, cancel_event=cancel_event)
+            elif mode == 'saved':
+                tracks = fetch_saved_tracks(sp, cancel_event=cancel_event)
+            else:
+                tracks = fetch_top_tracks(sp, time_range=time_range, cancel_event=cancel_event)
 
     album_entries = get_album_art_from_tracks(tracks)
-    MAX_COVERS = 300
-    album_entries = album_entries[:MAX_COVERS]
     if not album_entries:
         raise ValueError("No album art found.")
 
     total_tracks = len(album_entries)
     report(0, 1, f"Found {total_tracks} tracks.")
 
+    _count(stats, "tracks", total_tracks)
+
+    # Dedup runs over the whole union (e.g. of several playlists) before the cover cap,
+    # so repeats across playlists don't use up the cap.
     if remove_dups:
         album_entries = remove_duplicates(album_entries)
+        _count(stats, "duplicates_dropped", total_tracks - len(album_entries))
+    album_entries = album_entries[:MAX_COVERS]
 
     num_images = len(album_entries)
+    grid_size = _check_grid_size(num_images, grid_size_override)
+    report(0, 1, f"{num_images} unique covers \u2192 {grid_size}\u00d7{grid_size} grid.")
+
+    album_urls = [url for _, url in album_entries[:grid_size * grid_size]]
+
+    publish_layout = None
+    if layout_callback:
+        thumbs = get_thumbnail_urls(tracks)
+
+        def publish_layout(layout):
+            # The layout may be shared with coalesced callers, so map a copy.
+            slots = [[col, row, thumbs.get(url, url)] for col, row, url in layout["slots"]]
+            layout_callback(dict(layout, slots=slots))
+
+    callbacks = {"preview": preview_callback, "layout": publish_layout, "tiles": tiles_callback}
+    rendered_here = []
+
+    def render(shared_report, publish):
+        rendered_here.append(True)
+        return _render_covers(album_urls, remove_dups, pattern, cell_sizes,
+                              rounded, framed, shared_report, cancel_event,
+                              *_publishers(publish, callbacks), resampling)
+
+    # Which side outputs are wanted is part of the key, so the leader always produces
+    # everything its followers asked for; they receive it through the flight.
+    render_key = ("render", tuple(album_urls), remove_dups, pattern, cell_sizes, rounded, framed, resampling,
+                  tuple(bool(cb) for cb in callbacks.values()))
+    grid_images, render_stats = _render_flight.do(
+        render_key, render, progress_callback=progress_callback, cancel_event=cancel_event, callbacks=callbacks,
+    )
+    _merge_render_stats(stats, render_stats, bool(rendered_here))
+    return grid_images
+
+
+def _check_grid_size(num_images, grid_size_override):
     if grid_size_override:
         needed = grid_size_override * grid_size_override
         if num_images < needed:
@@ -225,61 +1412,55 @@ def generate_album_grid(sp, mode="playlist", playlist_id=None, remove_dups=False
                 f"Not enough unique covers for a {grid_size_override}\u00d7{grid_size_override} grid. "
                 f"Found {num_images} but need {needed}. Try a smaller grid size."
             )
-        grid_size = grid_size_override
-    else:
-        grid_size = calculate_grid_size(num_images)
-    report(0, 1, f"{num_images} unique covers \u2192 {grid_size}\u00d7{grid_size} grid.")
+        return grid_size_override
+    return calculate_grid_size(num_images)
 
-    album_urls = [url for _, url in album_entries[:grid_size * grid_size]]
-    total_downloads = len(album_urls)
 
-    images = []
-    colors = []
-    seen_hashes = set()
-    for i, url in enumerate(album_urls):
-        report(i, total_downloads, f"Downloading cover {i + 1} of {total_downloads}...")
-        try:
-            img = download_image(url)
-            if remove_dups:
-                h = image_hash(img)
-                if h in seen_hashes:
-                    continue
-                seen_hashes.add(h)
-            images.append(img)
-            colors.append(get_dominant_color(img))
-        except Exception as e:
-            print(f"Error downloading {url}: {e}")
-
-    report(total_downloads, total_downloads, "Sorting by color...")
-
-    sorted_indices = np.argsort([c[0] for c in colors])
-    images = [images[i] for i in sorted_indices]
-
-    grid_size = calculate_grid_size(len(images))
-    images = images[:grid_size * grid_size]
-
-    report(total_downloads, total_downloads, "Building grid...")
+def _generate_large(sp, mode, playlist_id, remove_dups, pattern, time_range, cell_sizes, rounded, framed,
+                    grid_size_override, progress_callback, cancel_event, tracks, stats,
+                    preview_callback, layout_callback, report, tiles_callback=None, resampling="balanced"):
+    """Large-library generation: pages are folded into an AlbumStore as they arrive and
+    never kept, then covers are rendered by _render_large."""
+    # Read a little past what the largest allowed grid needs, to cover dropped and failed covers.
+    side = grid_size_override or LARGE_MAX_OUTPUT_EDGE // max(cell_sizes)
+    needed = side * side
+    limit = min(LARGE_MAX_COVERS, needed + max(16, needed // 10))
 
-    if pattern == 'diagonal':
-        grid_image = create_diagonal_grid(images, grid_size, cell_size)
-    elif pattern == 'spiral':
-        grid_image = create_spiral_grid(images, grid_size, cell_size)
-    elif pattern == 'checkered':
-        grid_image = create_checkered_grid(images, grid_size, cell_size)
+    store = AlbumStore()
+    report(0, 1, "Fetching tracks from Spotify...")
+    if tracks is not None:
+        store.add_tracks(tracks, remove_dups, limit)
     else:
-        grid_image = create_normal_grid(images, grid_size, cell_size)
+        with timed_stage(stats, "fetch"):
+            for page in iter_track_pages(sp, mode, playlist_id, time_range, cancel_event):
+                if not store.add_tracks(page, remove_dups, limit):
+                    break
+                report(0, 1, f"Fetching tracks from Spotify... {store.tracks} so far")
+    if not store.urls:
+        raise ValueError("No album art found.")
 
-    if rounded:
-        report(total_downloads, total_downloads, "Rounding corners...")
-        radius = max(1, grid_image.width // 20)
-        grid_image = round_image(grid_image, radius)
+    _count(stats, "tracks", store.tracks)
+    _count(stats, "duplicates_dropped", store.duplicates)
+    num_images = len(store.urls)
+    # An automatic grid is held to the output limit; an explicit one was checked up front.
+    grid_size = min(_check_grid_size(num_images, grid_size_override), LARGE_MAX_OUTPUT_EDGE // max(cell_sizes))
+    report(0, 1, f"{num_images} unique covers \u2192 {grid_size}\u00d7{grid_size} grid.")
 
-    if framed:
-        report(total_downloads, total_downloads, "Adding frame...")
-        grid_image = add_frame(grid_image)
+    callbacks = {"preview": preview_callback, "layout": layout_callback, "tiles": tiles_callback}
+    rendered_here = []
 
-    report(total_downloads, total_downloads, "Done!")
-    return grid_image
+    def render(shared_report, publish):
+        rendered_here.append(True)
+        return _render_large(store, grid_size, remove_dups, pattern, cell_sizes, rounded, framed,
+                             shared_report, cancel_event, *_publishers(publish, callbacks), resampling)
+
+    render_key = ("render-large", tuple(store.urls), grid_size, remove_dups, pattern, cell_sizes, rounded, framed,
+                  resampling, tuple(bool(cb) for cb in callbacks.values()))
+    grid_images, render_stats = _render_flight.do(
+        render_key, render, progress_callback=progress_callback, cancel_event=cancel_event, callbacks=callbacks,
+    )
+    _merge_render_stats(stats, render_stats, bool(rendered_here))
+    return grid_images
 
 
 # import spotipy
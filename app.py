@@ -1,21 +1,59 @@
 import os
+import hmac
+import json
+import shutil
 import time
 import tempfile
 import threading
 import uuid
-from flask import Flask, request, redirect, url_for, session, send_file, render_template_string, jsonify
-import spotipy
+import weakref
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from flask import Flask, request, redirect, url_for, session, send_file, render_template, jsonify
+from jinja2 import ChoiceLoader, DictLoader
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import MemoryCacheHandler
 from spotipy.exceptions import SpotifyException
 from dotenv import load_dotenv
-from albumgrids import generate_album_grid
+from PIL import Image, features
+from albumgrids import (
+    generate_album_grid, generate_album_grid_bundle, BUNDLE_CELL_SIZES, LARGE_MAX_GRID_SIZE, LARGE_MAX_OUTPUT_EDGE, RESAMPLING_TIERS, GenerationCancelled, SpotifyRateLimited, new_stats, timed_stage, cover_cache,
+    spotify_governor, PRIORITY_HIGH, PRIORITY_BULK, PRIORITY_LOW, get_spotify_client,
+    fetch_top_tracks, get_album_art_from_tracks, remove_duplicates, warm_cover,
+)
 from flask import send_from_directory
+from metrics import Registry
+from profiling import capture_profile, PROFILE_FILES
+from tracelog import TraceLog
+from sessions import ServerSideSession, ServerSideSessionInterface, MemorySessionStore, SQLiteSessionStore
+from deepzoom import DeepZoom
+from pages import PAGE_TEMPLATES, STATIC_PAGES, PrerenderedPage
+from janitor import ArtifactJanitor
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-me")
 
+# Session data stays server-side and the cookie holds only an opaque id: "memory" (per
+# process), "sqlite" (a file shared by worker processes) or "cookie" (Flask's signed cookie).
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+if SESSION_BACKEND == "memory":
+    app.session_interface = ServerSideSessionInterface(
+        MemorySessionStore(int(os.getenv("SESSION_MAX_ENTRIES", "10000"))))
+elif SESSION_BACKEND == "sqlite":
+    app.session_interface = ServerSideSessionInterface(
+        SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.sqlite3")))
+
+# Page templates are compiled once into the Jinja cache; the ones without per-request
+# variables are rendered and compressed once as well.
+app.jinja_env.loader = ChoiceLoader([DictLoader(PAGE_TEMPLATES), app.jinja_env.loader])
+for _name in PAGE_TEMPLATES:
+    app.jinja_env.get_template(_name)
+static_pages = {name: PrerenderedPage(app.jinja_env.get_template(name).render()) for name in STATIC_PAGES}
+
 IS_PRODUCTION = "RENDER" in os.environ
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "YOUR_CLIENT_ID")
@@ -26,525 +64,529 @@ if IS_PRODUCTION:
 else:
     SPOTIFY_REDIRECT_URI = "http://127.0.0.1:5000/callback"
 
-SCOPE = "playlist-read-private user-top-read"
+SCOPE = "playlist-read-private user-top-read user-library-read"
+
+# One OAuth manager for the whole process. Tokens live in each user's session,
+# so the manager's cache is only scratch space and is never read back.
+sp_oauth = SpotifyOAuth(
+    client_id=SPOTIFY_CLIENT_ID,
+    client_secret=SPOTIFY_CLIENT_SECRET,
+    redirect_uri=SPOTIFY_REDIRECT_URI,
+    scope=SCOPE,
+    cache_handler=MemoryCacheHandler(),
+)
+
+# access_token -> unix time until which it is known to be valid, so page loads
+# and /generate skip validation until the token is close to expiring.
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+_validated_tokens = {}
+_validated_tokens_lock = threading.Lock()
 
 tasks = {}
 TASK_TTL_SECONDS = 600
+# A running task whose progress nobody has polled for this long is assumed
+# abandoned (tab closed, navigated away) and gets cancelled.
+ABANDONED_TASK_SECONDS = 30
+REAPER_INTERVAL_SECONDS = 5
+
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generate")
+_reaper_lock = threading.Lock()
+_reaper_started = False
+
+# Optional warm-up after login: fetch the user's top tracks and pull their
+# covers into the cover cache so the usual first generate is nearly instant.
+PREFETCH_ENABLED = os.getenv("PREFETCH_TOP_TRACKS", "0") == "1"
+PREFETCH_MAX_CONCURRENT = int(os.getenv("PREFETCH_MAX_CONCURRENT", "2"))
+PREFETCH_MAX_COVERS = int(os.getenv("PREFETCH_MAX_COVERS", "100"))
+PREFETCH_TTL_SECONDS = 600
+PREFETCH_TIME_RANGE = "medium_term"
+_prefetch_slots = threading.BoundedSemaphore(PREFETCH_MAX_CONCURRENT)
+prefetched_top_tracks = {}
+
+# Profiling is off unless PROFILE_GENERATIONS=1 (every task) or an admin sends
+# profile=yes along with the ADMIN_TOKEN in the X-Admin-Token header.
+PROFILE_GENERATIONS = os.getenv("PROFILE_GENERATIONS", "0") == "1"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+profiles = {}
+
+# One JSON line per finished generation, written only when TRACE_LOG_PATH is set.
+trace_log = TraceLog(
+    os.getenv("TRACE_LOG_PATH", ""),
+    max_bytes=int(os.getenv("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+    backup_count=int(os.getenv("TRACE_LOG_BACKUPS", "5")),
+)
+
+# The result page shows a downscaled rendition; the full-resolution PNG is only
+# encoded when /download is hit. Unencoded masters are held in memory up to
+# PENDING_MASTER_BYTES, beyond which the oldest are encoded to disk early.
+DISPLAY_MAX_EDGE = int(os.getenv("DISPLAY_MAX_EDGE", "2048"))
+DISPLAY_QUALITY = 85
+# Resampling tier for every generation; see RESAMPLING_TIERS and the benchmark's --resampling.
+RESAMPLING = os.getenv("RESAMPLING", "balanced")
+if RESAMPLING not in RESAMPLING_TIERS:
+    RESAMPLING = "balanced"
+PENDING_MASTER_BYTES = int(os.getenv("PENDING_MASTER_BYTES", str(512 * 1024 * 1024)))
+pending_masters = OrderedDict()
+_pending_masters_lock = threading.Lock()
+
+# Tile pyramids for the deep zoom viewer, keyed by task id. Each is built as soon as
+# a generation's sort order is known and draws its tiles on demand; one that nobody
+# has viewed for TASK_TTL_SECONDS is dropped.
+deepzooms = {}
+
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram(
+    "spotifycovers_stage_seconds", "Time spent in each generation stage.", labels=("stage",))
+GENERATION_SECONDS = metrics.histogram(
+    "spotifycovers_generation_seconds", "Wall time of a generation from start to finished artifact.",
+    labels=("status",))
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "spotifycovers_queue_wait_seconds", "Time a generation waited for a free worker.")
+ENCODED_BYTES = metrics.histogram(
+    "spotifycovers_encoded_bytes", "Size of downloadable grid artifacts (full PNG or zip) when encoded.",
+    buckets=(64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6))
+DISPLAY_BYTES = metrics.histogram(
+    "spotifycovers_display_bytes", "Size of the downscaled preview shown on the result page.",
+    buckets=(16e3, 64e3, 256e3, 1e6, 4e6))
+GENERATIONS = metrics.counter(
+    "spotifycovers_generations_total", "Finished generations by outcome.", labels=("status",))
+DOWNLOADED_BYTES = metrics.counter(
+    "spotifycovers_downloaded_bytes_total", "Cover bytes fetched from the image CDN.")
+PEAK_IMAGE_BYTES = metrics.histogram(
+    "spotifycovers_peak_image_bytes", "Largest amount of decoded image data a generation held at once.",
+    buckets=(1e6, 4e6, 16e6, 64e6, 256e6, 1e9))
+COVER_CACHE_LOOKUPS = metrics.counter(
+    "spotifycovers_cover_cache_lookups_total", "Cover lookups during generations.", labels=("result",))
+DUPLICATES_DROPPED = metrics.counter(
+    "spotifycovers_duplicates_dropped_total", "Covers dropped as duplicates (album id, URL or image hash).")
+DOWNLOAD_FAILURES = metrics.counter(
+    "spotifycovers_download_failures_total", "Cover downloads that failed.")
+COALESCED_RENDERS = metrics.counter(
+    "spotifycovers_coalesced_renders_total", "Generations that shared another request's in-flight render.")
+metrics.gauge("spotifycovers_queue_depth", "Generations waiting for a worker.",
+              lambda: sum(1 for t in list(tasks.values()) if t.get("status") == "queued"))
+metrics.gauge("spotifycovers_active_tasks", "Generations currently running.",
+              lambda: sum(1 for t in list(tasks.values()) if t.get("status") == "running"))
+metrics.gauge("spotifycovers_workers", "Size of the generation worker pool.", lambda: GENERATION_WORKERS)
+metrics.gauge("spotifycovers_cover_cache_bytes", "Bytes held by the cover cache.",
+              lambda: cover_cache.stats()["bytes"])
+metrics.gauge("spotifycovers_pending_master_bytes", "Raw bytes of full-resolution grids not yet encoded.",
+              lambda: sum(e["bytes"] for e in list(pending_masters.values()) if e["image"] is not None))
+metrics.gauge("spotifycovers_spotify_tokens", "Tokens left in the Spotify rate-limit bucket.",
+              lambda: spotify_governor.state()["tokens"])
+ARTIFACTS_REMOVED = metrics.counter(
+    "spotifycovers_artifacts_removed_total", "Artifact files deleted by the janitor.", labels=("reason",))
+
+# Every rendition, PNG and zip is written to ARTIFACT_DIR and tracked by the janitor, which
+# deletes files ARTIFACT_TTL_SECONDS after they were last written or served and, past
+# ARTIFACT_QUOTA_BYTES, the oldest first. It sweeps on the reaper thread.
+artifacts = ArtifactJanitor(
+    os.getenv("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "spotifycovers")),
+    quota_bytes=int(os.getenv("ARTIFACT_QUOTA_BYTES", str(2 * 1024 * 1024 * 1024))),
+    ttl_seconds=int(os.getenv("ARTIFACT_TTL_SECONDS", "3600")),
+    on_remove=lambda path, reason: ARTIFACTS_REMOVED.inc(reason=reason),
+)
+artifacts.sweep()
+metrics.gauge("spotifycovers_artifact_bytes", "Bytes of artifacts on disk.", lambda: artifacts.usage()["bytes"])
+metrics.gauge("spotifycovers_artifact_files", "Artifact files on disk.", lambda: artifacts.usage()["files"])
+metrics.gauge("spotifycovers_artifact_disk_free_bytes", "Free space on the artifact directory's disk.",
+              lambda: artifacts.usage()["disk_free_bytes"])
+
+
+def record_generation_metrics(task, stats, status):
+    for stage, seconds in stats["stages"].items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    GENERATION_SECONDS.observe(time.time() - task["started_at"], status=status)
+    GENERATIONS.inc(status=status)
+    DOWNLOADED_BYTES.inc(stats["bytes_downloaded"])
+    COVER_CACHE_LOOKUPS.inc(stats["cache_hits"], result="hit")
+    COVER_CACHE_LOOKUPS.inc(stats["cache_misses"], result="miss")
+    DUPLICATES_DROPPED.inc(stats["duplicates_dropped"])
+    DOWNLOAD_FAILURES.inc(stats["download_failures"])
+    if stats["coalesced"]:
+        COALESCED_RENDERS.inc()
+    if "encoded_bytes" in stats:
+        ENCODED_BYTES.observe(stats["encoded_bytes"])
+    if "display_bytes" in stats:
+        DISPLAY_BYTES.observe(stats["display_bytes"])
+    if stats["peak_image_bytes"]:
+        PEAK_IMAGE_BYTES.observe(stats["peak_image_bytes"])
+
+
+def build_trace_record(task_id, task, stats, options):
+    lookups = stats["cache_hits"] + stats["cache_misses"]
+    record = {
+        "ts": round(time.time(), 3),
+        "task_id": task_id,
+        "status": task["status"],
+        "mode": options["mode"],
+        "options": {k: v for k, v in options.items() if k != "mode"},
+        "album_count": stats["tracks"],
+        "covers": stats["covers"],
+        "grid_size": stats["grid_size"],
+        "queue_wait_seconds": round(task["started_at"] - task["created_at"], 4),
+        "total_seconds": round(time.time() - task["started_at"], 4),
+        "stages": {stage: round(seconds, 4) for stage, seconds in stats["stages"].items()},
+        "bytes_downloaded": stats["bytes_downloaded"],
+        "peak_image_bytes": stats["peak_image_bytes"],
+        "cache_hits": stats["cache_hits"],
+        "cache_misses": stats["cache_misses"],
+        "cache_hit_ratio": round(stats["cache_hits"] / lookups, 4) if lookups else None,
+        "duplicates_dropped": stats["duplicates_dropped"],
+        "download_failures": stats["download_failures"],
+        "coalesced": stats["coalesced"],
+        # Zips are encoded by the task; a single PNG only on its first download, so it is null here.
+        "artifact_bytes": stats.get("encoded_bytes"),
+        "display_bytes": stats.get("display_bytes"),
+    }
+    if task["status"] != "done":
+        record["error"] = task["message"]
+    return record
+
+
+def ensure_fresh_token(token_info):
+    """Return a valid token_info for the session, refreshing it only when it is about to expire."""
+    now = time.time()
+    with _validated_tokens_lock:
+        valid_until = _validated_tokens.get(token_info.get("access_token"))
+    if valid_until and now < valid_until:
+        return token_info
+
+    validated = sp_oauth.validate_token(token_info)
+    if not validated:
+        validated = sp_oauth.refresh_access_token(token_info["refresh_token"])
+
+    with _validated_tokens_lock:
+        for token in [t for t, until in _validated_tokens.items() if until <= now]:
+            del _validated_tokens[token]
+        _validated_tokens[validated["access_token"]] = validated["expires_at"] - TOKEN_REFRESH_MARGIN_SECONDS
+    return validated
+
+
+def prefetch_top_tracks(access_token, time_range=PREFETCH_TIME_RANGE):
+    sp = get_spotify_client(access_token)
+    tracks = fetch_top_tracks(sp, time_range=time_range, priority=PRIORITY_LOW)
+    prefetched_top_tracks[(access_token, time_range)] = {"tracks": tracks, "fetched_at": time.time()}
+
+    entries = remove_duplicates(get_album_art_from_tracks(tracks))[:PREFETCH_MAX_COVERS]
+    for _, url in entries:
+        try:
+            warm_cover(url)
+        except Exception as e:
+            print(f"Error prefetching {url}: {e}")
+
+
+def schedule_prefetch(access_token):
+    """Start a background warm-up for a freshly logged-in user if the global budget allows it."""
+    if not PREFETCH_ENABLED or not _prefetch_slots.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            prefetch_top_tracks(access_token)
+        except Exception as e:
+            print(f"Error prefetching top tracks: {e}")
+        finally:
+            _prefetch_slots.release()
+
+    threading.Thread(target=run, daemon=True, name="prefetch").start()
+    return True
 
-COMMON_HEAD = """
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <meta name="description" content="Generate beautiful Spotify album cover grids from your playlists or top tracks. Login with Spotify and create your unique collage now!">
-    <meta name="google-site-verification" content="Bb23Njg1oKFgYtGMT3MR_MWG7-MgTFpKymCYPafltpo" />
-    <link rel="icon" href="/favicon.ico" type="image/png">
-    <script async src="https://www.googletagmanager.com/gtag/js?id=G-HYRLRLLH5X"></script>
-    <script>
-      window.dataLayer = window.dataLayer || [];
-      function gtag(){dataLayer.push(arguments);}
-      gtag('js', new Date());
-      gtag('config', 'G-HYRLRLLH5X');
-    </script>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-    <style>
-      :root {
-        --sp-black: #121212;
-        --sp-dark: #181818;
-        --sp-card: #282828;
-        --sp-hover: #333333;
-        --sp-green: #1DB954;
-        --sp-green-light: #1ed760;
-        --sp-white: #FFFFFF;
-        --sp-muted: #B3B3B3;
-        --sp-dim: #535353;
-      }
-      body {
-        font-family: 'Inter', sans-serif;
-        min-height: 100vh; display: flex; flex-direction: column;
-        background: var(--sp-black); color: var(--sp-white);
-        background-image: radial-gradient(ellipse at 50% 0%, rgba(29,185,84,0.06) 0%, transparent 60%);
-      }
-      main { flex: 1; }
-      a { color: var(--sp-green); }
-      a:hover { color: var(--sp-green-light); }
-
-      .navbar {
-        background: rgba(18,18,18,0.8) !important;
-        backdrop-filter: blur(12px); -webkit-backdrop-filter: blur(12px);
-        border-bottom: 1px solid rgba(255,255,255,0.06);
-        font-weight: 600; letter-spacing: 0.02em;
-      }
-      .navbar-brand { font-size: 1.3rem; color: var(--sp-white) !important; }
-      .navbar-brand:hover { color: var(--sp-green) !important; }
-      .nav-link { color: var(--sp-muted) !important; }
-      .nav-link:hover { color: var(--sp-white) !important; }
-
-      footer { font-size: 0.85rem; color: var(--sp-dim); }
-
-      .btn { font-weight: 500; letter-spacing: 0.01em; border-radius: 50px; }
-      .btn-sp {
-        background: var(--sp-green); border: none; color: var(--sp-black);
-        font-weight: 700; padding: 0.7rem 2rem;
-        transition: transform 0.15s, background 0.15s;
-      }
-      .btn-sp:hover {
-        background: var(--sp-green-light); color: var(--sp-black);
-        transform: scale(1.04);
-      }
-      .btn-sp:disabled {
-        background: var(--sp-dim); color: var(--sp-muted);
-        transform: none; cursor: not-allowed; opacity: 0.8;
-      }
-      .btn-sp-outline {
-        background: transparent; border: 1px solid var(--sp-muted); color: var(--sp-white);
-        font-weight: 600; padding: 0.7rem 2rem;
-      }
-      .btn-sp-outline:hover {
-        border-color: var(--sp-white); color: var(--sp-white);
-        transform: scale(1.04);
-      }
-
-      .card {
-        background: rgba(255,255,255,0.05);
-        backdrop-filter: blur(16px); -webkit-backdrop-filter: blur(16px);
-        border: 1px solid rgba(255,255,255,0.08); border-radius: 16px;
-        box-shadow: 0 8px 32px rgba(0,0,0,0.3);
-      }
-      .form-select, .form-control {
-        background: rgba(255,255,255,0.07); border: 1px solid rgba(255,255,255,0.1); color: var(--sp-white);
-        border-radius: 8px;
-      }
-      .form-select:focus, .form-control:focus {
-        background: rgba(255,255,255,0.1); color: var(--sp-white);
-        border-color: var(--sp-green); box-shadow: 0 0 0 2px rgba(29,185,84,0.25);
-      }
-      .form-control::placeholder { color: var(--sp-muted); opacity: 1; }
-      .form-select option { background: var(--sp-card); color: var(--sp-white); }
-      .form-select {
-        cursor: pointer;
-        background-image: url("data:image/svg+xml,%3csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16'%3e%3cpath fill='none' stroke='%23B3B3B3' stroke-linecap='round' stroke-linejoin='round' stroke-width='2' d='m2 5 6 6 6-6'/%3e%3c/svg%3e");
-        background-repeat: no-repeat; background-position: right 0.75rem center; background-size: 16px 12px;
-        padding-right: 2.5rem; appearance: none;
-      }
-      .form-label { color: var(--sp-muted); font-weight: 500; font-size: 0.9rem; margin-bottom: 0.3rem; }
-      .text-muted { color: var(--sp-muted) !important; }
-
-      .navbar-brand, .nav-link, a { cursor: pointer; }
-      .btn { cursor: pointer; }
-      .form-check-input:checked {
-        background-color: var(--sp-green); border-color: var(--sp-green);
-      }
-      .form-check-input:focus {
-        box-shadow: 0 0 0 2px rgba(29,185,84,0.25); border-color: var(--sp-green);
-      }
-
-      .progress {
-        background: rgba(255,255,255,0.08); border-radius: 12px;
-      }
-      .progress-bar {
-        background: var(--sp-green);
-      }
-
-      h1, h2 { color: var(--sp-white); }
-    </style>
-"""
-
-NAVBAR_LOGGED_OUT = """
-    <nav class="navbar navbar-expand-lg navbar-dark">
-      <div class="container">
-        <a class="navbar-brand" href="/">Spotify Covers</a>
-      </div>
-    </nav>
-"""
-
-NAVBAR_LOGGED_IN = """
-    <nav class="navbar navbar-expand-lg navbar-dark">
-      <div class="container">
-        <a class="navbar-brand" href="/">Spotify Covers</a>
-        <button class="navbar-toggler" type="button" data-bs-toggle="collapse" data-bs-target="#navbarNav">
-          <span class="navbar-toggler-icon"></span>
-        </button>
-        <div class="collapse navbar-collapse" id="navbarNav">
-          <ul class="navbar-nav ms-auto">
-            <li class="nav-item"><a class="nav-link" href="/logout">Logout</a></li>
-          </ul>
-        </div>
-      </div>
-    </nav>
-"""
-
-FOOTER = """
-    <footer class="text-center py-3 mt-auto">
-      <p class="mb-0">&copy; 2026 Spotify Covers</p>
-    </footer>
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-"""
+
+def take_prefetched_tracks(access_token, time_range):
+    now = time.time()
+    for key in [k for k, v in list(prefetched_top_tracks.items()) if now - v["fetched_at"] > PREFETCH_TTL_SECONDS]:
+        prefetched_top_tracks.pop(key, None)
+    entry = prefetched_top_tracks.get((access_token, time_range))
+    return entry["tracks"] if entry else None
 
 
 def cleanup_old_temp_file():
     old_path = session.get("generated_image_path")
     if old_path:
-        try:
-            os.unlink(old_path)
-        except OSError:
-            pass
+        artifacts.remove(old_path)
         session.pop("generated_image_path", None)
         session.pop("generated_image_name", None)
+    old_master = session.pop("generated_master_id", None)
+    if old_master:
+        discard_master(old_master)
+    old_bundle = session.pop("generated_bundle_path", None)
+    if old_bundle:
+        artifacts.remove(old_bundle)
+    old_deepzoom = session.pop("generated_deepzoom_id", None)
+    if old_deepzoom:
+        deepzooms.pop(old_deepzoom, None)
+
+
+def task_idle_seconds(task, now):
+    """How long a task has gone unattended: since its last poll while it is queued or
+    running, since it finished otherwise."""
+    if task.get("status") in ("queued", "running"):
+        return now - task.get("last_polled", task.get("created_at", 0))
+    return now - task.get("finished_at", task.get("created_at", 0))
 
 
 def prune_stale_tasks():
     now = time.time()
-    stale = [tid for tid, t in tasks.items() if now - t.get("created_at", 0) > TASK_TTL_SECONDS]
+    # A long large-library render that is still being watched is never pruned mid-run.
+    stale = [tid for tid, t in list(tasks.items()) if task_idle_seconds(t, now) > TASK_TTL_SECONDS]
     for tid in stale:
+        cancel_task(tid)
         task = tasks.pop(tid, None)
         if task and "image_path" in task:
-            try:
-                os.unlink(task["image_path"])
-            except OSError:
-                pass
+            artifacts.remove(task["image_path"])
+        if task and "master_id" in task:
+            discard_master(task["master_id"])
+        if task and "bundle_path" in task:
+            artifacts.remove(task["bundle_path"])
+
+
+def encode_display_rendition(image):
+    """Write a copy of image, at most DISPLAY_MAX_EDGE on its long edge, as WebP (JPEG if
+    this Pillow lacks WebP) to a temp file and return its path."""
+    scale = DISPLAY_MAX_EDGE / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    if features.check("webp"):
+        suffix, options = ".webp", {"format": "WEBP", "quality": DISPLAY_QUALITY, "method": 4}
+    else:
+        suffix, options = ".jpg", {"format": "JPEG", "quality": DISPLAY_QUALITY}
+        image = image.convert("RGB")
+    tmp_file = artifacts.new_file(suffix)
+    image.save(tmp_file, **options)
+    tmp_file.close()
+    artifacts.add(tmp_file.name)
+    return tmp_file.name
+
+
+def stash_master(image):
+    """Hold a full-resolution grid until /download asks for it. Returns its id.
+
+    Coalesced tasks finish with the same image object; they share one entry (counted
+    once, encoded once), which goes when the last of them discards it.
+    """
+    with _pending_masters_lock:
+        for master_id, entry in pending_masters.items():
+            if entry["source"]() is image:
+                entry["refs"] += 1
+                return master_id
+        master_id = str(uuid.uuid4())
+        pending_masters[master_id] = {
+            "image": image,
+            "source": weakref.ref(image),
+            "refs": 1,
+            "path": None,
+            "bytes": image.width * image.height * len(image.getbands()),
+            "lock": threading.Lock(),
+            "created_at": time.time(),
+        }
+        held = sum(e["bytes"] for e in pending_masters.values() if e["image"] is not None)
+        # Oldest first; the new master itself goes to disk too if the older ones
+        # aren't enough to get back under the budget.
+        spill = []
+        for other_id, other in pending_masters.items():
+            if held <= PENDING_MASTER_BYTES:
+                break
+            if other["image"] is not None:
+                spill.append(other_id)
+                held -= other["bytes"]
+    for other_id in spill:
+        master_path(other_id)
+    return master_id
+
+
+def master_path(master_id):
+    """Path of the encoded PNG for a stashed master, encoding it on first use; None if unknown."""
+    entry = pending_masters.get(master_id)
+    if entry is None:
+        return None
+    encoded = False
+    with entry["lock"]:
+        if entry["path"] is None and entry["image"] is not None:
+            start = time.perf_counter()
+            tmp_file = artifacts.new_file(".png")
+            entry["image"].save(tmp_file, "PNG")
+            tmp_file.close()
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="encode_master")
+            ENCODED_BYTES.observe(os.path.getsize(tmp_file.name))
+            entry["path"] = tmp_file.name
+            entry["image"] = None
+            encoded = True
+        path = entry["path"]
+    # Registered outside the lock: adding can evict (and so discard) other masters.
+    if encoded:
+        artifacts.add(path, on_evict=lambda _path: _forget_master(master_id))
+    elif path is not None:
+        artifacts.touch(path)
+    return path
+
+
+def spill_stale_masters():
+    """Encode masters nobody has downloaded within TASK_TTL_SECONDS to disk, where the
+    artifact janitor expires them, instead of holding their pixels indefinitely."""
+    now = time.time()
+    stale = [master_id for master_id, entry in list(pending_masters.items())
+             if entry["image"] is not None and now - entry["created_at"] > TASK_TTL_SECONDS]
+    for master_id in stale:
+        master_path(master_id)
+
+
+def discard_master(master_id):
+    """Release one task's hold on a stashed master, deleting it with the last one."""
+    with _pending_masters_lock:
+        entry = pending_masters.get(master_id)
+        if entry is None:
+            return
+        entry["refs"] -= 1
+        if entry["refs"] > 0:
+            return
+        del pending_masters[master_id]
+    with entry["lock"]:
+        entry["image"] = None
+        if entry["path"]:
+            artifacts.remove(entry["path"])
+
+
+def _forget_master(master_id):
+    """Drop a master whose PNG the artifact janitor deleted, whoever still holds it."""
+    with _pending_masters_lock:
+        entry = pending_masters.pop(master_id, None)
+    if entry is not None:
+        with entry["lock"]:
+            entry["image"] = None
+
+
+def encode_bundle(images, stem):
+    """Encode each {cell_size: image} output as PNG in parallel and store them in one zip."""
+    def encode(size):
+        buf = BytesIO()
+        images[size].save(buf, "PNG")
+        return size, buf.getvalue()
+
+    with ThreadPoolExecutor(max_workers=len(images), thread_name_prefix="encode") as pool:
+        encoded = list(pool.map(encode, sorted(images)))
+    tmp_file = artifacts.new_file(".zip")
+    # PNGs are already deflated, so the archive just stores them.
+    with zipfile.ZipFile(tmp_file, "w", zipfile.ZIP_STORED) as archive:
+        for size, data in encoded:
+            archive.writestr(f"{stem}_{size}px.png", data)
+    tmp_file.close()
+    artifacts.add(tmp_file.name)
+    return tmp_file.name
+
+
+def is_admin_request():
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(supplied, ADMIN_TOKEN)
+
+
+def should_profile():
+    if PROFILE_GENERATIONS:
+        return True
+    return request.form.get("profile") == "yes" and is_admin_request()
+
+
+def prune_stale_profiles():
+    now = time.time()
+    for tid, entry in list(profiles.items()):
+        if now - entry["created_at"] > TASK_TTL_SECONDS:
+            profiles.pop(tid, None)
+            shutil.rmtree(entry["dir"], ignore_errors=True)
+
+
+def prune_stale_deepzooms():
+    now = time.time()
+    for tid, entry in list(deepzooms.items()):
+        if now - entry["last_used"] > TASK_TTL_SECONDS:
+            deepzooms.pop(tid, None)
+
+
+def cancel_task(task_id):
+    """Signal a queued or running task to stop. Returns True if it was still active."""
+    task = tasks.get(task_id)
+    if not task or task.get("status") not in ("queued", "running"):
+        return False
+    cancel_event = task.get("cancel")
+    if cancel_event is not None:
+        cancel_event.set()
+    future = task.get("future")
+    if future is not None and future.cancel():
+        # Never started, so run_generation won't get the chance to record it.
+        task["status"] = "cancelled"
+        task["message"] = "Cancelled."
+    return True
+
+
+def cancel_abandoned_tasks():
+    now = time.time()
+    for tid, task in list(tasks.items()):
+        # API jobs are submitted in bulk and polled at the client's pace; only the TTL ends them.
+        if "owner" in task:
+            continue
+        last_seen = task.get("last_polled", task.get("created_at", 0))
+        if now - last_seen > ABANDONED_TASK_SECONDS:
+            cancel_task(tid)
+
+
+def _reap_forever():
+    while True:
+        time.sleep(REAPER_INTERVAL_SECONDS)
+        try:
+            cancel_abandoned_tasks()
+        except Exception as e:
+            print(f"Error reaping abandoned tasks: {e}")
+        try:
+            spill_stale_masters()
+            artifacts.sweep()
+        except Exception as e:
+            print(f"Error sweeping artifacts: {e}")
+
+
+def ensure_reaper():
+    global _reaper_started
+    with _reaper_lock:
+        if not _reaper_started:
+            threading.Thread(target=_reap_forever, daemon=True, name="task-reaper").start()
+            _reaper_started = True
 
 
 @app.route("/")
 def index():
     if "token_info" in session:
-        sp_oauth = SpotifyOAuth(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET,
-            redirect_uri=SPOTIFY_REDIRECT_URI,
-            scope=SCOPE
-        )
         try:
-            token_info = sp_oauth.validate_token(session["token_info"])
-            if not token_info:
-                token_info = sp_oauth.refresh_access_token(session["token_info"]["refresh_token"])
-            session["token_info"] = token_info
+            token_info = ensure_fresh_token(session["token_info"])
+            if token_info is not session["token_info"]:
+                session["token_info"] = token_info
         except Exception:
             # Refresh token is invalid/expired (e.g. invalid_grant):
             # discard it so the user sees the login screen instead of a broken session.
             session.pop("token_info", None)
 
     if "token_info" not in session:
-        return render_template_string("""
-        <!DOCTYPE html>
-        <html lang="en">
-          <head>
-            <title>Spotify Covers - Album Grid Generator</title>
-            """ + COMMON_HEAD + """
-            <style>
-              .hero-section {
-                display: flex; align-items: center; justify-content: center;
-                min-height: calc(100vh - 120px); padding: 2rem 0;
-              }
-              .hero-content { text-align: center; max-width: 480px; z-index: 2; }
-              .hero-content h1 {
-                font-size: 3rem; font-weight: 800; letter-spacing: -0.02em;
-                margin-bottom: 1rem;
-              }
-              .hero-content .lead {
-                font-size: 1.1rem; color: var(--sp-muted); margin-bottom: 2rem;
-                line-height: 1.6;
-              }
-              .hero-content .btn-sp { font-size: 1.1rem; padding: 0.85rem 3rem; }
-
-              .example-grid {
-                width: 300px; border-radius: 14px; overflow: hidden;
-                background: rgba(255,255,255,0.04);
-                backdrop-filter: blur(12px); -webkit-backdrop-filter: blur(12px);
-                border: 1px solid rgba(255,255,255,0.06);
-                box-shadow: 0 8px 32px rgba(0,0,0,0.3);
-                padding: 8px;
-                transition: transform 0.3s ease;
-              }
-              .example-grid:hover { transform: scale(1.04); }
-              .example-grid img {
-                width: 100%; border-radius: 8px; display: block;
-              }
-              .hero-stack {
-                display: flex; flex-direction: column; gap: 1rem;
-              }
-
-              .hero-side { display: none; }
-              @media (min-width: 992px) {
-                .hero-section { gap: 3rem; }
-                .hero-side { display: flex; }
-                .hero-content { text-align: left; }
-              }
-            </style>
-          </head>
-          <body>
-            """ + NAVBAR_LOGGED_OUT + """
-            <main>
-              <div class="container">
-                <div class="hero-section">
-                  <div class="hero-side hero-stack">
-                    <div class="example-grid">
-                      <img src="/static/Party_Songs_13x13_spiral.png" alt="Spiral pattern grid" loading="lazy" />
-                    </div>
-                    <div class="example-grid">
-                      <img src="/static/Bestest_Songs_40_6x6_diagonal.png" alt="Diagonal pattern grid" loading="lazy" />
-                    </div>
-                  </div>
-                  <div class="hero-content">
-                    <h1>Album Grid Generator</h1>
-                    <p class="lead">Turn your Spotify playlists and top tracks into stunning album cover collages.</p>
-                    <a href="/login" class="btn btn-sp">Login with Spotify</a>
-                  </div>
-                  <div class="hero-side hero-stack">
-                    <div class="example-grid">
-                      <img src="/static/Studying_(instrumentals)_10x10_diagonal.png" alt="Diagonal pattern grid" loading="lazy" />
-                    </div>
-                    <div class="example-grid">
-                      <img src="/static/Good_Songs_2024!_24x24_normal.png" alt="Normal pattern grid" loading="lazy" />
-                    </div>
-                  </div>
-                </div>
-              </div>
-            </main>
-            """ + FOOTER + """
-          </body>
-        </html>
-        """)
-
-    return render_template_string("""
-    <!DOCTYPE html>
-    <html lang="en">
-      <head>
-        <title>Spotify Covers - Generate Grid</title>
-        """ + COMMON_HEAD + """
-        <script type="application/ld+json">
-        {
-          "@context": "https://schema.org",
-          "@type": "WebApplication",
-          "name": "Spotify Covers",
-          "url": "https://spotifycovers-production.up.railway.app/",
-          "description": "Generate stunning Spotify album cover grids from your playlists or top tracks.",
-          "applicationCategory": "Music"
-        }
-        </script>
-        <style>
-          #progress-section { display: none; }
-          #progress-bar-inner {
-            transition: width 0.3s ease;
-            background: linear-gradient(90deg, var(--sp-green), var(--sp-green-light), var(--sp-green));
-            background-size: 200% 100%;
-            animation: shimmer 1.5s ease-in-out infinite;
-          }
-          @keyframes shimmer { 0% { background-position: 200% 0; } 100% { background-position: -200% 0; } }
-          #progress-message { font-size: 0.9rem; color: var(--sp-white); }
-        </style>
-      </head>
-      <body>
-        """ + NAVBAR_LOGGED_IN + """
-        <main>
-          <div class="container py-4">
-            <div class="row justify-content-center">
-              <div class="col-md-5 col-lg-4">
-                <h2 class="text-center mb-4" style="font-weight:700;">Generate Grid</h2>
-                <div class="card shadow-sm">
-                  <div class="card-body p-4">
-                    <form id="grid-form">
-                      <div class="mb-3">
-                        <label class="form-label">Mode</label>
-                        <select name="mode" id="mode-select" class="form-select">
-                          <option value="playlist">Playlist</option>
-                          <option value="top">Top Tracks</option>
-                        </select>
-                      </div>
-
-                      <div class="mb-3" id="playlist-field">
-                        <label class="form-label">Playlist URL or ID</label>
-                        <input type="text" name="playlist_id" class="form-control"
-                               placeholder="https://open.spotify.com/playlist/..." />
-                      </div>
-
-                      <div class="mb-3" id="time-range-field" style="display:none;">
-                        <label class="form-label">Time Range</label>
-                        <select name="time_range" class="form-select">
-                          <option value="short_term">Last 4 Weeks</option>
-                          <option value="medium_term" selected>Last 6 Months</option>
-                          <option value="long_term">All Time</option>
-                        </select>
-                      </div>
-
-                      <div class="mb-3" id="grid-size-field" style="display:none;">
-                        <label class="form-label">Grid Size (optional)</label>
-                        <input type="number" name="grid_size" class="form-control"
-                               placeholder="Auto" min="1" max="50" />
-                        <div style="font-size:0.78rem; color:var(--sp-dim); margin-top:4px;">
-                          Leave blank to auto-size, or set e.g. 10 for a 10&times;10 grid.
-                        </div>
-                      </div>
-
-                      <div class="mb-3">
-                        <label class="form-label">Remove Duplicates</label>
-                        <select name="remove_dups" class="form-select">
-                          <option value="yes" selected>Yes</option>
-                          <option value="no">No</option>
-                        </select>
-                      </div>
-
-                      <div class="mb-3">
-                        <label class="form-label">Pattern</label>
-                        <select name="pattern" class="form-select">
-                          <option value="normal">Normal</option>
-                          <option value="diagonal">Diagonal</option>
-                          <option value="spiral">Spiral</option>
-                          <option value="checkered">Checkered</option>
-                        </select>
-                      </div>
-
-                      <div class="mb-3">
-                        <label class="form-label">Resolution</label>
-                        <select name="cell_size" class="form-select">
-                          <option value="100" selected>Standard (100px)</option>
-                          <option value="200">High (200px)</option>
-                          <option value="300">Ultra (300px)</option>
-                        </select>
-                      </div>
-
-                      <div class="mb-2 form-check">
-                        <input type="checkbox" name="rounded" value="yes" class="form-check-input" id="rounded-check"
-                               style="cursor:pointer; background-color:rgba(255,255,255,0.07); border-color:rgba(255,255,255,0.2);">
-                        <label class="form-check-label" for="rounded-check" style="cursor:pointer; color:var(--sp-muted); font-weight:500; font-size:0.9rem;">
-                          Rounded corners
-                        </label>
-                      </div>
-
-                      <div class="mb-3 form-check">
-                        <input type="checkbox" name="framed" value="yes" class="form-check-input" id="framed-check"
-                               style="cursor:pointer; background-color:rgba(255,255,255,0.07); border-color:rgba(255,255,255,0.2);">
-                        <label class="form-check-label" for="framed-check" style="cursor:pointer; color:var(--sp-muted); font-weight:500; font-size:0.9rem;">
-                          Dark frame border
-                        </label>
-                      </div>
-
-                      <button type="submit" id="submit-btn" class="btn btn-sp w-100 py-2" style="border-radius:8px;">
-                        Generate Grid
-                      </button>
-                    </form>
-
-                    <div id="progress-section" class="mt-4">
-                      <div class="progress" style="height: 24px;">
-                        <div id="progress-bar-inner" class="progress-bar progress-bar-striped progress-bar-animated"
-                             role="progressbar" style="width: 0%;">
-                        </div>
-                      </div>
-                      <p id="progress-message" class="text-muted text-center mt-2">Starting...</p>
-                    </div>
-                  </div>
-                </div>
-              </div>
-            </div>
-          </div>
-        </main>
-        """ + FOOTER + """
-        <script>
-          const modeSelect = document.getElementById('mode-select');
-          const playlistField = document.getElementById('playlist-field');
-          const timeRangeField = document.getElementById('time-range-field');
-          const gridSizeField = document.getElementById('grid-size-field');
-
-          function updateModeFields() {
-            const isTop = modeSelect.value === 'top';
-            playlistField.style.display = isTop ? 'none' : '';
-            timeRangeField.style.display = isTop ? '' : 'none';
-            gridSizeField.style.display = isTop ? '' : 'none';
-          }
-          modeSelect.addEventListener('change', updateModeFields);
-          updateModeFields();
-
-          document.getElementById('grid-form').addEventListener('submit', async (e) => {
-            e.preventDefault();
-            const form = e.target;
-            const btn = document.getElementById('submit-btn');
-            const progressSection = document.getElementById('progress-section');
-            const progressBar = document.getElementById('progress-bar-inner');
-            const progressMsg = document.getElementById('progress-message');
-
-            btn.disabled = true;
-            btn.textContent = 'Starting...';
-            progressSection.style.display = 'block';
-            progressBar.style.width = '2%';
-            progressMsg.textContent = 'Submitting...';
-
-            const formData = new FormData(form);
-            let taskId;
-
-            try {
-              const res = await fetch('/generate', { method: 'POST', body: formData });
-              const data = await res.json();
-              if (data.error) {
-                if (data.expired) { window.location.href = '/login'; return; }
-                throw new Error(data.error);
-              }
-              taskId = data.task_id;
-            } catch (err) {
-              progressMsg.textContent = 'Error: ' + err.message;
-              btn.disabled = false;
-              btn.textContent = 'Generate Grid';
-              return;
-            }
-
-            const poll = setInterval(async () => {
-              try {
-                const res = await fetch('/progress/' + taskId);
-                const data = await res.json();
-                const pct = data.total > 0 ? Math.round((data.current / data.total) * 100) : 0;
-                progressBar.style.width = Math.max(pct, 2) + '%';
-                progressMsg.textContent = data.message;
-
-                if (data.status === 'done') {
-                  clearInterval(poll);
-                  progressBar.style.width = '100%';
-                  progressMsg.textContent = 'Redirecting...';
-                  window.location.href = '/result';
-                } else if (data.status === 'expired') {
-                  clearInterval(poll);
-                  window.location.href = '/login';
-                } else if (data.status === 'error') {
-                  clearInterval(poll);
-                  progressMsg.textContent = 'Error: ' + data.message;
-                  btn.disabled = false;
-                  btn.textContent = 'Generate Grid';
-                }
-              } catch (err) {
-                clearInterval(poll);
-                progressMsg.textContent = 'Connection lost. Please try again.';
-                btn.disabled = false;
-                btn.textContent = 'Generate Grid';
-              }
-            }, 500);
-          });
-        </script>
-      </body>
-    </html>
-    """)
+        return static_pages["landing.html"].response(request, app.response_class)
+
+    return static_pages["generate.html"].response(request, app.response_class)
 
 
 @app.route("/login")
 def login():
-    sp_oauth = SpotifyOAuth(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET,
-        redirect_uri=SPOTIFY_REDIRECT_URI,
-        scope=SCOPE
-    )
     return redirect(sp_oauth.get_authorize_url())
 
 
 @app.route("/callback")
 def callback():
-    sp_oauth = SpotifyOAuth(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET,
-        redirect_uri=SPOTIFY_REDIRECT_URI,
-        scope=SCOPE
-    )
     code = request.args.get('code')
-    token_info = sp_oauth.get_access_token(code, as_dict=True)
+    token_info = sp_oauth.get_access_token(code, as_dict=True, check_cache=False)
 
     if token_info:
+        # Logging in gets a fresh session id, so an id planted before login never ends
+        # up holding the tokens. (A signed-cookie session carries its own data.)
+        if isinstance(session, ServerSideSession):
+            session.regenerate()
         session["token_info"] = token_info
+        schedule_prefetch(token_info["access_token"])
         return redirect(url_for("index"))
     else:
         return "Could not get token"
@@ -560,140 +602,604 @@ def extract_playlist_id(user_input: str) -> str:
     return user_input
 
 
-@app.route("/generate", methods=["POST"])
-def generate():
-    if "token_info" not in session:
-        return jsonify({"error": "Not logged in", "expired": True}), 401
-
-    sp_oauth = SpotifyOAuth(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET,
-        redirect_uri=SPOTIFY_REDIRECT_URI,
-        scope=SCOPE
-    )
-
+MAX_PLAYLISTS = 10
+
+
+def extract_playlist_ids(user_input: str) -> list:
+    """Playlist ids from one or more URLs/IDs separated by commas, spaces or newlines."""
+    ids = []
+    for part in user_input.replace(",", " ").split():
+        playlist_id = extract_playlist_id(part)
+        if playlist_id and playlist_id not in ids:
+            ids.append(playlist_id)
+    return ids
+
+
+def _flag(value, default=False):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("yes", "on", "true", "1")
+
+
+def parse_job(values):
+    """
+    Normalise one generation request, from the web form or a JSON API job, into the
+    options submit_generation takes. Returns (job, error message).
+    """
+    mode = values.get("mode") or "playlist"
+    if mode not in ("playlist", "top", "saved"):
+        return None, f"Unknown mode {mode!r}."
+    playlist_input = values.get("playlist_id") or ""
+    if isinstance(playlist_input, list):
+        playlist_input = ",".join(str(p) for p in playlist_input)
+    playlist_ids = extract_playlist_ids(playlist_input) if mode == "playlist" else []
+    if mode == "playlist" and not playlist_ids:
+        return None, "Playlist jobs need a playlist_id."
+    if len(playlist_ids) > MAX_PLAYLISTS:
+        return None, f"At most {MAX_PLAYLISTS} playlists can be merged into one grid."
+    pattern = values.get("pattern") or "normal"
+    if pattern not in ("normal", "diagonal", "spiral", "checkered"):
+        pattern = "normal"
+    bundle = values.get("cell_size") == "bundle"
     try:
-        token_info = sp_oauth.validate_token(session["token_info"])
-        if not token_info:
-            token_info = sp_oauth.refresh_access_token(session["token_info"]["refresh_token"])
-            session["token_info"] = token_info
-    except Exception:
-        session.pop("token_info", None)
-        return jsonify({"error": "Session expired. Please log in again.", "expired": True}), 401
-
-    mode = request.form.get("mode", "playlist")
-    playlist_id = request.form.get("playlist_id", "").strip()
-    remove_dups = (request.form.get("remove_dups", "yes") == "yes")
-    pattern = request.form.get("pattern", "normal")
-    time_range = request.form.get("time_range", "medium_term")
-    cell_size = int(request.form.get("cell_size", "100"))
+        cell_size = max(BUNDLE_CELL_SIZES) if bundle else int(values.get("cell_size") or 100)
+    except (TypeError, ValueError):
+        cell_size = 100
     if cell_size not in (100, 200, 300):
         cell_size = 100
-    rounded = (request.form.get("rounded", "no") == "yes")
-    framed = (request.form.get("framed", "no") == "yes")
-    grid_size_str = request.form.get("grid_size", "").strip()
-    grid_size_override = int(grid_size_str) if grid_size_str else None
-    if grid_size_override is not None:
-        grid_size_override = max(1, min(50, grid_size_override))
-
-    sp = spotipy.Spotify(auth=token_info["access_token"])
-
-    real_id = None
-    if mode == "playlist" and playlist_id:
-        real_id = extract_playlist_id(playlist_id)
-        try:
-            playlist_info = sp.playlist(real_id)
-            playlist_name = playlist_info['name'].replace(" ", "_")
-        except SpotifyException as e:
-            if e.http_status == 401:
-                session.pop("token_info", None)
-                return jsonify({"error": "Session expired. Please log in again.", "expired": True}), 401
-            return jsonify({"error": "Could not find that playlist. Check the URL/ID."}), 400
-        except Exception:
-            return jsonify({"error": "Could not find that playlist. Check the URL/ID."}), 400
-    else:
-        playlist_name = "top_tracks"
-
-    cleanup_old_temp_file()
-    prune_stale_tasks()
+    grid_size = str(values.get("grid_size") or "").strip()
+    try:
+        grid_size_override = max(1, min(LARGE_MAX_GRID_SIZE, int(grid_size))) if grid_size else None
+    except ValueError:
+        return None, "grid_size must be a whole number."
+    if grid_size_override and grid_size_override * cell_size > LARGE_MAX_OUTPUT_EDGE:
+        return None, (f"A {grid_size_override}\u00d7{grid_size_override} grid of {cell_size}px covers is too large; "
+                      f"at {cell_size}px the largest grid is {LARGE_MAX_OUTPUT_EDGE // cell_size}\u00d7"
+                      f"{LARGE_MAX_OUTPUT_EDGE // cell_size}.")
+    return {
+        "mode": mode,
+        # A single playlist keeps passing a plain id; several are merged into one grid.
+        "playlist_id": (playlist_ids[0] if len(playlist_ids) == 1 else playlist_ids) if playlist_ids else None,
+        "playlist_ids": playlist_ids,
+        "remove_dups": _flag(values.get("remove_dups"), default=True),
+        "pattern": pattern,
+        "time_range": values.get("time_range") or "medium_term",
+        "cell_size": cell_size,
+        "bundle": bundle,
+        "rounded": _flag(values.get("rounded")),
+        "framed": _flag(values.get("framed")),
+        "deepzoom": _flag(values.get("deepzoom")),
+        # Liked Songs can run to thousands of tracks, so it always streams.
+        "large_library": _flag(values.get("large", values.get("large_library"))) or mode == "saved",
+        "grid_size_override": grid_size_override,
+    }, None
+
+
+def grid_name(sp, job, priority=PRIORITY_BULK, cancel_event=None):
+    """
+    File name stem for a job: the playlist name(s), or the mode.
+
+    :param priority: governor priority of the name lookups; PRIORITY_HIGH only when a
+                     request thread is waiting on them
+    """
+    if job["mode"] == "saved":
+        return "liked_songs"
+    if job["mode"] != "playlist":
+        return "top_tracks"
+
+    def lookup(pid):
+        return spotify_governor.call(sp.playlist, pid, fields="name", priority=priority, cancel_event=cancel_event)
+
+    playlist_ids = job["playlist_ids"]
+    with ThreadPoolExecutor(max_workers=len(playlist_ids), thread_name_prefix="lookup") as pool:
+        names = [info['name'].replace(" ", "_") for info in pool.map(lookup, playlist_ids)]
+    return names[0] if len(names) == 1 else f"{names[0]}_and_{len(names) - 1}_more"
+
+
+def submit_generation(sp, job, playlist_name=None, tracks=None, profile=False, owner=None):
+    """
+    Queue one generation on the shared worker pool and return its task id.
+
+    :param job: options from parse_job
+    :param playlist_name: file name stem; looked up on the worker when None
+    :param tracks: prefetched tracks to use instead of fetching them
+    :param owner: who may read the task through the JSON API
+    """
+    mode, pattern, cell_size, bundle = job["mode"], job["pattern"], job["cell_size"], job["bundle"]
+    trace_options = {
+        "mode": mode, "pattern": pattern, "cell_size": cell_size, "remove_dups": job["remove_dups"],
+        "rounded": job["rounded"], "framed": job["framed"], "time_range": job["time_range"] if mode == "top" else None,
+        "grid_size_override": job["grid_size_override"], "prefetched": tracks is not None,
+        "profiled": profile, "bundle": bundle, "large_library": job["large_library"], "deepzoom": job["deepzoom"],
+        "playlists": len(job["playlist_ids"]) if mode == "playlist" else None, "resampling": RESAMPLING,
+        "api": owner is not None,
+    }
 
     task_id = str(uuid.uuid4())
-    tasks[task_id] = {
-        "status": "running",
+    now = time.time()
+    task = {
+        "status": "queued",
         "current": 0,
         "total": 1,
-        "message": "Starting...",
-        "created_at": time.time(),
+        "message": "Waiting for a free worker...",
+        "created_at": now,
+        "last_polled": now,
+        "cancel": threading.Event(),
     }
-
-    session["current_task_id"] = task_id
-    session["playlist_name"] = playlist_name
-    session["pattern"] = pattern
-    session["cell_size"] = cell_size
+    if owner is not None:
+        task["owner"] = owner
+    tasks[task_id] = task
 
     def run_generation():
+        if not profile:
+            return generate_task()
+        with capture_profile(label=f"task {task_id} ({mode}, {pattern}, {cell_size}px)") as captured:
+            generate_task()
+        if captured["dir"]:
+            profiles[task_id] = {"dir": captured["dir"], "created_at": time.time()}
+            task["profile"] = True
+
+    def generate_task():
+        if task["cancel"].is_set():
+            task["status"] = "cancelled"
+            task["message"] = "Cancelled."
+            return
+        task["status"] = "running"
+        task["message"] = "Starting..."
+        task["started_at"] = time.time()
+        QUEUE_WAIT_SECONDS.observe(task["started_at"] - task["created_at"])
+        stats = new_stats()
+
         def on_progress(current, total, message):
-            tasks[task_id]["current"] = current
-            tasks[task_id]["total"] = total
-            tasks[task_id]["message"] = message
+            task["current"] = current
+            task["total"] = total
+            task["message"] = message
+
+        def on_preview(jpeg_bytes):
+            task["preview"] = jpeg_bytes
+            task["preview_version"] = task.get("preview_version", 0) + 1
+
+        def on_layout(layout):
+            task["layout"] = layout
+
+        def on_tiles(grid_size, tile_cell_size, tile_pattern, get_cell):
+            zoom = DeepZoom(grid_size, tile_cell_size, tile_pattern, get_cell)
+            deepzooms[task_id] = {"zoom": zoom, "last_used": time.time()}
+            task["deepzoom"] = True
 
         try:
-            image = generate_album_grid(
+            name = playlist_name if playlist_name is not None else grid_name(sp, job, cancel_event=task["cancel"])
+            options = dict(
                 sp=sp,
                 mode=mode,
-                playlist_id=real_id,
-                remove_dups=remove_dups,
+                playlist_id=job["playlist_id"],
+                remove_dups=job["remove_dups"],
                 pattern=pattern,
-                time_range=time_range,
-                cell_size=cell_size,
-                rounded=rounded,
-                framed=framed,
-                grid_size_override=grid_size_override,
+                time_range=job["time_range"],
+                rounded=job["rounded"],
+                framed=job["framed"],
+                grid_size_override=job["grid_size_override"],
                 progress_callback=on_progress,
+                cancel_event=task["cancel"],
+                tracks=tracks,
+                stats=stats,
+                preview_callback=on_preview,
+                layout_callback=on_layout,
+                large_library=job["large_library"],
+                tiles_callback=on_tiles if job["deepzoom"] else None,
+                resampling=RESAMPLING,
             )
+            if bundle:
+                images = generate_album_grid_bundle(cell_sizes=BUNDLE_CELL_SIZES, **options)
+                image = images[cell_size]
+            else:
+                image = generate_album_grid(cell_size=cell_size, **options)
 
-            if framed:
+            if job["framed"]:
                 grid_size = round(image.width / (cell_size * 1.08))
             else:
                 grid_size = image.width // cell_size
-            final_filename = f"{playlist_name}_{grid_size}x{grid_size}_{pattern}.png"
-
-            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-            image.save(tmp_file, 'PNG')
-            tmp_file.close()
-
-            tasks[task_id]["image_path"] = tmp_file.name
-            tasks[task_id]["image_name"] = final_filename
-            tasks[task_id]["status"] = "done"
-            tasks[task_id]["message"] = "Done!"
+            stem = f"{name}_{grid_size}x{grid_size}_{pattern}"
+            final_filename = f"{stem}.zip" if bundle else f"{stem}.png"
+
+            with timed_stage(stats, "encode"):
+                display_path = encode_display_rendition(image)
+            stats["display_bytes"] = os.path.getsize(display_path)
+
+            task["image_path"] = display_path
+            if bundle:
+                task["message"] = "Encoding all sizes..."
+                with timed_stage(stats, "encode_bundle"):
+                    task["bundle_path"] = encode_bundle(images, stem)
+                stats["encoded_bytes"] = os.path.getsize(task["bundle_path"])
+            else:
+                task["master_id"] = stash_master(image)
+            task["image_name"] = final_filename
+            task["status"] = "done"
+            task["message"] = "Done!"
+        except GenerationCancelled:
+            task["status"] = "cancelled"
+            task["message"] = "Cancelled."
         except SpotifyException as e:
             if e.http_status == 401:
-                tasks[task_id]["status"] = "expired"
-                tasks[task_id]["message"] = "Session expired. Please log in again."
+                task["status"] = "expired"
+                task["message"] = "Session expired. Please log in again."
             else:
-                tasks[task_id]["status"] = "error"
-                tasks[task_id]["message"] = str(e)
+                task["status"] = "error"
+                task["message"] = str(e)
         except Exception as e:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = str(e)
+            task["status"] = "error"
+            task["message"] = str(e)
+        task["finished_at"] = time.time()
+        if task["status"] != "done":
+            deepzooms.pop(task_id, None)
+        record_generation_metrics(task, stats, task["status"])
+        trace_log.write(build_trace_record(task_id, task, stats, trace_options))
+
+    task["future"] = executor.submit(run_generation)
+    ensure_reaper()
+    return task_id
+
+
+@app.route("/generate", methods=["POST"])
+def generate():
+    if "token_info" not in session:
+        return jsonify({"error": "Not logged in", "expired": True}), 401
+
+    try:
+        token_info = ensure_fresh_token(session["token_info"])
+        if token_info is not session["token_info"]:
+            session["token_info"] = token_info
+    except Exception:
+        session.pop("token_info", None)
+        return jsonify({"error": "Session expired. Please log in again.", "expired": True}), 401
+
+    job, error = parse_job(request.form)
+    if error:
+        return jsonify({"error": error}), 400
+
+    sp = get_spotify_client(token_info["access_token"])
+    try:
+        playlist_name = grid_name(sp, job, priority=PRIORITY_HIGH)
+    except SpotifyRateLimited as e:
+        return jsonify({"error": str(e)}), 503
+    except SpotifyException as e:
+        if e.http_status == 401:
+            session.pop("token_info", None)
+            return jsonify({"error": "Session expired. Please log in again.", "expired": True}), 401
+        return jsonify({"error": "Could not find that playlist. Check the URL/ID."}), 400
+    except Exception:
+        return jsonify({"error": "Could not find that playlist. Check the URL/ID."}), 400
 
-    thread = threading.Thread(target=run_generation, daemon=True)
-    thread.start()
+    prefetched_tracks = None
+    if job["mode"] == "top":
+        prefetched_tracks = take_prefetched_tracks(token_info["access_token"], job["time_range"])
+
+    previous_task_id = session.get("current_task_id")
+    if previous_task_id:
+        cancel_task(previous_task_id)
+    cleanup_old_temp_file()
+    prune_stale_tasks()
+    prune_stale_profiles()
+    prune_stale_deepzooms()
+
+    task_id = submit_generation(sp, job, playlist_name=playlist_name, tracks=prefetched_tracks,
+                                profile=should_profile())
+    session["current_task_id"] = task_id
+    session["playlist_name"] = playlist_name
+    session["pattern"] = job["pattern"]
+    session["cell_size"] = job["cell_size"]
 
     return jsonify({"task_id": task_id})
 
 
+MAX_API_JOBS = 50
+# (owner, Idempotency-Key) -> the task a submission started, so a retried request reuses it.
+idempotency_keys = {}
+_idempotency_lock = threading.Lock()
+# access_token -> (Spotify user id, unix time until which it is trusted). Jobs belong to the
+# user, not the token, so they stay reachable after the client refreshes its token.
+API_OWNER_TTL_SECONDS = 3600
+_api_owners = {}
+_api_owners_lock = threading.Lock()
+
+
+def api_token():
+    """Spotify access token for an API call: an Authorization: Bearer header, else the session's."""
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        return auth[len("Bearer "):].strip() or None
+    if "token_info" in session:
+        try:
+            token_info = ensure_fresh_token(session["token_info"])
+        except Exception:
+            session.pop("token_info", None)
+            return None
+        if token_info is not session["token_info"]:
+            session["token_info"] = token_info
+        return token_info["access_token"]
+    return None
+
+
+def api_owner(access_token):
+    """Spotify user id behind an access token; looking it up also checks the token."""
+    now = time.time()
+    with _api_owners_lock:
+        cached = _api_owners.get(access_token)
+        if cached and cached[1] > now:
+            return cached[0]
+    sp = get_spotify_client(access_token)
+    user_id = spotify_governor.call(sp.current_user, priority=PRIORITY_HIGH)["id"]
+    with _api_owners_lock:
+        for token, (_, until) in list(_api_owners.items()):
+            if until <= now:
+                _api_owners.pop(token, None)
+        _api_owners[access_token] = (user_id, now + API_OWNER_TTL_SECONDS)
+    return user_id
+
+
+def api_caller():
+    """(access token, owner, None) for the API caller, or (None, None, error response)."""
+    token = api_token()
+    if token is None:
+        return None, None, (jsonify({"error": "Send a Spotify access token as Authorization: Bearer <token>."}), 401)
+    try:
+        return token, api_owner(token), None
+    except SpotifyRateLimited as e:
+        return None, None, (jsonify({"error": str(e)}), 503)
+    except SpotifyException as e:
+        if e.http_status == 401:
+            return None, None, (jsonify({"error": "Invalid or expired Spotify access token.", "expired": True}), 401)
+        return None, None, (jsonify({"error": "Could not verify the Spotify access token."}), 502)
+
+
+def prune_stale_idempotency_keys():
+    # A key lives exactly as long as the task it started; prune_stale_tasks decides that.
+    with _idempotency_lock:
+        for key, entry in list(idempotency_keys.items()):
+            if entry["task_id"] not in tasks:
+                idempotency_keys.pop(key, None)
+
+
+def api_job_status(task_id, task):
+    payload = {
+        "id": task_id,
+        "status": task["status"],
+        "current": task["current"],
+        "total": task["total"],
+        "message": task["message"],
+        "url": url_for("api_job", task_id=task_id),
+    }
+    if task.get("deepzoom"):
+        payload["deepzoom"] = url_for("deepzoom_viewer", task_id=task_id)
+    if task["status"] == "done":
+        payload["file_name"] = task["image_name"]
+        payload["artifact"] = url_for("api_job_artifact", task_id=task_id)
+        payload["preview"] = url_for("api_job_preview", task_id=task_id)
+    return payload
+
+
+def api_task(task_id, owner):
+    """The owner's task, or None."""
+    task = tasks.get(task_id)
+    if task is None or task.get("owner") != owner:
+        return None
+    return task
+
+
+@app.route("/api/jobs", methods=["POST"])
+def api_submit_jobs():
+    """
+    Queue one job (a JSON object with the form's fields) or several ({"jobs": [...]}).
+    An Idempotency-Key header, or a per-job "idempotency_key", makes retries return the
+    job already started instead of generating again.
+    """
+    token, owner, error = api_caller()
+    if error:
+        return error
+    body = request.get_json(silent=True)
+    specs = body.get("jobs") if isinstance(body, dict) and "jobs" in body else [body]
+    if not isinstance(specs, list) or not specs or body is None:
+        return jsonify({"error": "Expected a job object or {\"jobs\": [...]}."}), 400
+    if len(specs) > MAX_API_JOBS:
+        return jsonify({"error": f"At most {MAX_API_JOBS} jobs per request."}), 400
+
+    prune_stale_tasks()
+    prune_stale_profiles()
+    prune_stale_deepzooms()
+    prune_stale_idempotency_keys()
+    sp = get_spotify_client(token)
+    request_key = request.headers.get("Idempotency-Key")
+    results = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            results.append({"index": index, "error": "Each job must be a JSON object."})
+            continue
+        job, error = parse_job(spec)
+        if error:
+            results.append({"index": index, "error": error})
+            continue
+        key = spec.get("idempotency_key")
+        if key is None and request_key:
+            key = request_key if len(specs) == 1 else f"{request_key}:{index}"
+        fingerprint = json.dumps(job, sort_keys=True)
+        with _idempotency_lock:
+            existing = idempotency_keys.get((owner, key)) if key else None
+            if existing and existing["task_id"] in tasks:
+                if existing["fingerprint"] != fingerprint:
+                    results.append({"index": index, "error": "Idempotency key was already used for a different job."})
+                else:
+                    results.append(dict(api_job_status(existing["task_id"], tasks[existing["task_id"]]),
+                                        index=index, reused=True))
+                continue
+            tracks = None
+            if job["mode"] == "top":
+                tracks = take_prefetched_tracks(token, job["time_range"])
+            task_id = submit_generation(sp, job, tracks=tracks, owner=owner)
+            if key:
+                idempotency_keys[(owner, key)] = {"task_id": task_id, "fingerprint": fingerprint,
+                                                  "created_at": time.time()}
+        results.append(dict(api_job_status(task_id, tasks[task_id]), index=index, reused=False))
+    if all("error" in result for result in results):
+        return jsonify({"error": "No job was accepted.", "jobs": results}), 400
+    return jsonify({"jobs": results}), 202
+
+
+@app.route("/api/jobs")
+def api_jobs():
+    """Status of several of the caller's jobs: /api/jobs?ids=<id>,<id>,..."""
+    _, owner, error = api_caller()
+    if error:
+        return error
+    ids = [i for i in request.args.get("ids", "").split(",") if i][:MAX_API_JOBS]
+    jobs = []
+    for task_id in ids:
+        task = api_task(task_id, owner)
+        if task is None:
+            jobs.append({"id": task_id, "status": "not_found"})
+            continue
+        task["last_polled"] = time.time()
+        jobs.append(api_job_status(task_id, task))
+    return jsonify({"jobs": jobs})
+
+
+@app.route("/api/jobs/<task_id>")
+def api_job(task_id):
+    _, owner, error = api_caller()
+    if error:
+        return error
+    task = api_task(task_id, owner)
+    if task is None:
+        return jsonify({"error": "Job not found"}), 404
+    task["last_polled"] = time.time()
+    return jsonify(api_job_status(task_id, task))
+
+
+@app.route("/api/jobs/<task_id>/preview")
+def api_job_preview(task_id):
+    _, owner, error = api_caller()
+    if error:
+        return error
+    task = api_task(task_id, owner)
+    if task is None or task["status"] != "done" or not os.path.exists(task["image_path"]):
+        return jsonify({"error": "No preview"}), 404
+    artifacts.touch(task["image_path"])
+    return send_file(task["image_path"])
+
+
+@app.route("/api/jobs/<task_id>/artifact")
+def api_job_artifact(task_id):
+    """The full-resolution PNG, or the zip for bundle jobs."""
+    _, owner, error = api_caller()
+    if error:
+        return error
+    task = api_task(task_id, owner)
+    if task is None or task["status"] != "done":
+        return jsonify({"error": "No artifact"}), 404
+    if "bundle_path" in task:
+        path, mimetype = task["bundle_path"], "application/zip"
+        artifacts.touch(path)
+    else:
+        path, mimetype = master_path(task["master_id"]), "image/png"
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": "Artifact expired"}), 410
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=task["image_name"])
+
+
 @app.route("/progress/<task_id>")
 def progress(task_id):
     task = tasks.get(task_id)
     if not task:
         return jsonify({"status": "error", "message": "Task not found", "current": 0, "total": 1})
-    return jsonify({
+    task["last_polled"] = time.time()
+    payload = {
         "status": task["status"],
         "current": task["current"],
         "total": task["total"],
         "message": task["message"],
-    })
+    }
+    if task.get("layout"):
+        payload["layout_ready"] = True
+    if task.get("preview_version"):
+        payload["preview_version"] = task["preview_version"]
+    if task.get("deepzoom"):
+        payload["deepzoom"] = url_for("deepzoom_viewer", task_id=task_id)
+    if task.get("profile"):
+        payload["profile"] = [url_for("profile_file", task_id=task_id, name=name) for name in PROFILE_FILES]
+    return jsonify(payload)
+
+
+@app.route("/progress/<task_id>/preview")
+def progress_preview(task_id):
+    task = tasks.get(task_id)
+    if not task or not task.get("preview"):
+        return jsonify({"error": "No preview yet"}), 404
+    return task["preview"], 200, {"Content-Type": "image/jpeg", "Cache-Control": "no-store"}
+
+
+@app.route("/progress/<task_id>/layout")
+def progress_layout(task_id):
+    task = tasks.get(task_id)
+    if not task or not task.get("layout"):
+        return jsonify({"error": "Layout not ready"}), 404
+    return jsonify(task["layout"])
+
+
+@app.route("/deepzoom/<task_id>.dzi")
+def deepzoom_descriptor(task_id):
+    entry = deepzooms.get(task_id)
+    if not entry:
+        return jsonify({"error": "Deep zoom not found"}), 404
+    entry["last_used"] = time.time()
+    return entry["zoom"].dzi(), 200, {"Content-Type": "application/xml"}
+
+
+@app.route("/deepzoom/<task_id>_files/<int:level>/<int:col>_<int:row>.jpg")
+def deepzoom_tile(task_id, level, col, row):
+    entry = deepzooms.get(task_id)
+    if not entry:
+        return jsonify({"error": "Deep zoom not found"}), 404
+    entry["last_used"] = time.time()
+    tile = entry["zoom"].tile(level, col, row)
+    if tile is None:
+        return jsonify({"error": "No such tile"}), 404
+    return tile, 200, {"Content-Type": "image/jpeg", "Cache-Control": "private, max-age=3600"}
+
+
+@app.route("/deepzoom/<task_id>")
+def deepzoom_viewer(task_id):
+    if task_id not in deepzooms:
+        return redirect(url_for("index"))
+    return render_template("deepzoom.html", dzi_url=url_for("deepzoom_descriptor", task_id=task_id))
+
+
+@app.route("/admin/profile/<task_id>/<name>")
+def profile_file(task_id, name):
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    entry = profiles.get(task_id)
+    if not entry or name not in PROFILE_FILES:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_from_directory(entry["dir"], name, as_attachment=True, download_name=f"{task_id}-{name}")
+
+
+@app.route("/admin/artifacts")
+def artifact_usage():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(artifacts.usage())
+
+
+@app.route("/throttle")
+def throttle():
+    return jsonify(spotify_governor.state())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 
 @app.route("/result")
@@ -708,68 +1214,50 @@ def result():
 
     session["generated_image_path"] = task["image_path"]
     session["generated_image_name"] = task["image_name"]
+    if "master_id" in task:
+        session["generated_master_id"] = task["master_id"]
+    if "bundle_path" in task:
+        session["generated_bundle_path"] = task["bundle_path"]
+    if task_id in deepzooms:
+        session["generated_deepzoom_id"] = task_id
 
     del tasks[task_id]
 
-    return render_template_string("""
-    <!DOCTYPE html>
-    <html lang="en">
-      <head>
-        <title>Your Grid - Spotify Covers</title>
-        """ + COMMON_HEAD + """
-        <style>
-          .result-card {
-            background: none;
-            border: none; border-radius: 20px;
-            overflow: visible;
-          }
-          .result-img {
-            border-radius: 0;
-            box-shadow: 0 4px 24px rgba(0,0,0,0.5);
-            transition: transform 0.2s;
-            background: transparent;
-          }
-          .result-img:hover { transform: scale(1.01); }
-        </style>
-      </head>
-      <body>
-        """ + NAVBAR_LOGGED_IN + """
-        <main>
-          <div class="container py-4">
-            <div class="row justify-content-center">
-              <div class="col-lg-9">
-                <div class="result-card text-center p-4 p-md-5">
-                  <h2 style="font-weight:800; color:var(--sp-white); font-size:1.8rem;" class="mb-2">Your Grid</h2>
-                  <p style="color:var(--sp-muted); font-size:0.95rem;" class="mb-4">Right-click the image to save, or use the button below.</p>
-                  <img src="/preview" alt="album grid" class="result-img img-fluid" style="max-height:75vh;" />
-                  <div class="mt-4 d-flex justify-content-center gap-3 flex-wrap">
-                    <a href="/download" class="btn btn-sp px-4" style="border-radius:8px;" download="{{ filename }}">Download PNG</a>
-                    <a href="/" class="btn btn-sp-outline px-4" style="border-radius:8px;">New Grid</a>
-                  </div>
-                </div>
-              </div>
-            </div>
-          </div>
-        </main>
-        """ + FOOTER + """
-      </body>
-    </html>
-    """, filename=session["generated_image_name"])
+    return render_template("result.html", filename=session["generated_image_name"],
+                           bundle="generated_bundle_path" in session,
+                           deepzoom_url=url_for("deepzoom_viewer", task_id=task_id) if task_id in deepzooms else None)
 
 
 @app.route("/preview")
 def preview():
-    if "generated_image_path" not in session:
+    path = session.get("generated_image_path")
+    if not path or not os.path.exists(path):
         return redirect(url_for("index"))
-    return send_file(session["generated_image_path"], mimetype='image/png')
+    artifacts.touch(path)
+    return send_file(path)
 
 
 @app.route("/download")
 def download():
-    if "generated_image_path" not in session or "generated_image_name" not in session:
+    if "generated_image_name" not in session:
+        return redirect(url_for("index"))
+    if "generated_bundle_path" in session:
+        if not os.path.exists(session["generated_bundle_path"]):
+            return redirect(url_for("index"))
+        artifacts.touch(session["generated_bundle_path"])
+        return send_file(
+            session["generated_bundle_path"],
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=session["generated_image_name"],
+        )
+    if "generated_master_id" not in session:
+        return redirect(url_for("index"))
+    path = master_path(session["generated_master_id"])
+    if path is None:
         return redirect(url_for("index"))
     return send_file(
-        session["generated_image_path"],
+        path,
         mimetype='image/png',
         as_attachment=True,
         download_name=session["generated_image_name"],
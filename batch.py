@@ -0,0 +1,255 @@
+"""
+Headless batch rendering: many grids from one manifest, without the web UI.
+
+The manifest is JSON Lines, one grid per line. A line names its source and may
+override any of the command-line defaults:
+
+    {"name": "party", "playlist_id": "37i9dQZF1DXaXB8fQg7xif", "pattern": "spiral"}
+    {"name": "alice_library", "tracks_file": "exports/alice_saved.json", "cell_size": 200}
+    {"name": "my_top", "mode": "top", "time_range": "long_term", "grid_size": 10}
+    {"name": "merged", "playlist_id": ["37i9dQZF1DXaXB8fQg7xif", "37i9dQZF1DX0XUsuxWHRQd"]}
+
+"tracks_file" is a pre-exported track dump (a list of track items, or a Spotify
+page with "items"), so those grids need no API access at all. Playlist grids
+use SPOTIFY_ACCESS_TOKEN if set, otherwise client credentials from
+SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET; top and saved grids need a user token.
+
+    python batch.py manifest.jsonl --out-dir grids --workers 4
+
+Grids are rendered on a process pool that shares one on-disk cover cache.
+Every finished grid is appended to <out-dir>/batch_state.jsonl, and a rerun
+skips the grids recorded there whose PNG still exists.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+STATE_FILE = "batch_state.jsonl"
+JOB_OPTIONS = ("mode", "playlist_id", "tracks_file", "pattern", "cell_size", "remove_dups",
+               "rounded", "framed", "time_range", "grid_size", "large_library", "resampling")
+
+
+def load_manifest(path, defaults):
+    """Read the manifest into a list of jobs, each with every option filled in."""
+    jobs = []
+    names = set()
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            unknown = set(entry) - set(JOB_OPTIONS) - {"name"}
+            if unknown:
+                raise ValueError(f"{path}:{line_no}: unknown keys {sorted(unknown)}")
+            job = dict(defaults, **entry)
+            if "tracks_file" in entry:
+                job["mode"] = "offline"
+            elif "playlist_id" in entry and "mode" not in entry:
+                job["mode"] = "playlist"
+            if job["mode"] == "playlist" and not job.get("playlist_id"):
+                raise ValueError(f"{path}:{line_no}: playlist jobs need a playlist_id")
+            playlist_id = entry.get("playlist_id")
+            if isinstance(playlist_id, list):
+                playlist_id = "_".join(playlist_id)
+            name = entry.get("name") or playlist_id or os.path.splitext(
+                os.path.basename(entry.get("tracks_file", "")))[0] or f"{job['mode']}_{line_no}"
+            if name in names:
+                raise ValueError(f"{path}:{line_no}: duplicate name {name!r}")
+            names.add(name)
+            job["name"] = name
+            jobs.append(job)
+    return jobs
+
+
+def load_tracks_file(path):
+    with open(path) as f:
+        data = json.load(f)
+    return data["items"] if isinstance(data, dict) else data
+
+
+def read_state(out_dir):
+    """Names of the grids already finished in out_dir, from a previous (maybe interrupted) run."""
+    done = {}
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by the interruption
+                if record.get("status") == "done" and os.path.exists(os.path.join(out_dir, record["file"])):
+                    done[record["name"]] = record
+                else:
+                    done.pop(record.get("name"), None)
+    except FileNotFoundError:
+        pass
+    return done
+
+
+_spotify = None
+
+
+def _init_worker(cache_dir, workers):
+    import albumgrids
+    if cache_dir:
+        albumgrids.cover_cache.disk_dir = cache_dir
+    # Each process has its own governor, so share the API budget out between them.
+    albumgrids.spotify_governor.rate /= workers
+    albumgrids.spotify_governor.burst = max(2, albumgrids.spotify_governor.burst // workers)
+    albumgrids.spotify_governor.reserve = min(albumgrids.spotify_governor.reserve,
+                                              albumgrids.spotify_governor.burst - 1)
+
+
+def _spotify_client():
+    global _spotify
+    if _spotify is None:
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+        from albumgrids import get_spotify_client
+        token = os.getenv("SPOTIFY_ACCESS_TOKEN")
+        if token:
+            _spotify = get_spotify_client(token)
+        elif os.getenv("SPOTIFY_CLIENT_ID") and os.getenv("SPOTIFY_CLIENT_SECRET"):
+            _spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials())
+        else:
+            raise RuntimeError("No Spotify credentials: set SPOTIFY_ACCESS_TOKEN, or SPOTIFY_CLIENT_ID and "
+                               "SPOTIFY_CLIENT_SECRET, or give the job a tracks_file.")
+    return _spotify
+
+
+def render_job(job, out_dir):
+    """Render one manifest job to <out_dir>/<name>.png. Runs in a pool worker."""
+    from albumgrids import generate_album_grid, new_stats, timed_stage
+
+    stats = new_stats()
+    start = time.perf_counter()
+    try:
+        if job["mode"] == "offline":
+            sp, mode, tracks = None, "top", load_tracks_file(job["tracks_file"])
+        else:
+            sp, mode, tracks = _spotify_client(), job["mode"], None
+        image = generate_album_grid(
+            sp, mode=mode, playlist_id=job.get("playlist_id"), remove_dups=job["remove_dups"],
+            pattern=job["pattern"], time_range=job["time_range"], cell_size=job["cell_size"],
+            rounded=job["rounded"], framed=job["framed"], grid_size_override=job.get("grid_size"),
+            tracks=tracks, stats=stats, large_library=job["large_library"], resampling=job["resampling"],
+        )
+        file_name = f"{job['name']}.png"
+        path = os.path.join(out_dir, file_name)
+        with timed_stage(stats, "encode"):
+            image.save(path + ".tmp", "PNG")
+            os.replace(path + ".tmp", path)
+        status, error = "done", None
+    except Exception as e:
+        file_name, status, error = None, "error", str(e)
+    return {
+        "name": job["name"],
+        "status": status,
+        "error": error,
+        "file": file_name,
+        "seconds": round(time.perf_counter() - start, 3),
+        "covers": stats["covers"],
+        "grid_size": stats["grid_size"],
+        "bytes_downloaded": stats["bytes_downloaded"],
+        "cache_hits": stats["cache_hits"],
+        "cache_misses": stats["cache_misses"],
+        "stages": {stage: round(seconds, 4) for stage, seconds in stats["stages"].items()},
+    }
+
+
+def run_batch(jobs, out_dir, workers, cache_dir, log=sys.stderr):
+    os.makedirs(out_dir, exist_ok=True)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    done = read_state(out_dir)
+    pending = [job for job in jobs if job["name"] not in done]
+    print(f"{len(jobs)} grids in manifest, {len(jobs) - len(pending)} already done, "
+          f"{len(pending)} to render on {workers} workers", file=log)
+
+    results = []
+    start = time.perf_counter()
+    with open(os.path.join(out_dir, STATE_FILE), "a") as state, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(cache_dir, workers)) as pool:
+        futures = {pool.submit(render_job, job, out_dir): job for job in pending}
+        for finished, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            state.write(json.dumps(result) + "\n")
+            state.flush()
+            elapsed = time.perf_counter() - start
+            outcome = f"{result['seconds']:.1f}s" if result["status"] == "done" else f"failed: {result['error']}"
+            print(f"[{finished}/{len(pending)}] {result['name']} {outcome} "
+                  f"({finished / elapsed * 60:.1f} grids/min)", file=log)
+    return summarise(results, time.perf_counter() - start, skipped=len(jobs) - len(pending))
+
+
+def summarise(results, elapsed, skipped=0):
+    ok = [r for r in results if r["status"] == "done"]
+    lookups = sum(r["cache_hits"] + r["cache_misses"] for r in results)
+    covers = sum(r["covers"] for r in ok)
+    return {
+        "rendered": len(ok),
+        "failed": len(results) - len(ok),
+        "skipped": skipped,
+        "elapsed_seconds": round(elapsed, 3),
+        "grids_per_minute": round(len(ok) / elapsed * 60, 2) if elapsed else None,
+        "covers_per_second": round(covers / elapsed, 2) if elapsed else None,
+        "bytes_downloaded": sum(r["bytes_downloaded"] for r in results),
+        "cache_hit_ratio": round(sum(r["cache_hits"] for r in results) / lookups, 4) if lookups else None,
+        "failures": {r["name"]: r["error"] for r in results if r["status"] != "done"},
+    }
+
+
+def _on_off(value):
+    return value.strip().lower() in ("on", "yes", "true", "1")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSON Lines file, one grid per line")
+    parser.add_argument("--out-dir", default="batch_output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-dir", default=None,
+                        help="shared on-disk cover cache (default: <out-dir>/.covers)")
+    parser.add_argument("--mode", default="playlist", choices=("playlist", "top", "saved"))
+    parser.add_argument("--pattern", default="normal", choices=("normal", "diagonal", "spiral", "checkered"))
+    parser.add_argument("--cell-size", type=int, default=100)
+    parser.add_argument("--time-range", default="medium_term", choices=("short_term", "medium_term", "long_term"))
+    parser.add_argument("--remove-dups", type=_on_off, default=True)
+    parser.add_argument("--rounded", action="store_true")
+    parser.add_argument("--framed", action="store_true")
+    parser.add_argument("--large-library", action="store_true")
+    parser.add_argument("--resampling", default="balanced", choices=("fast", "balanced", "high"))
+    parser.add_argument("--output", help="write the JSON summary here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    defaults = {
+        "mode": args.mode, "pattern": args.pattern, "cell_size": args.cell_size, "time_range": args.time_range,
+        "remove_dups": args.remove_dups, "rounded": args.rounded, "framed": args.framed,
+        "large_library": args.large_library, "resampling": args.resampling,
+    }
+    jobs = load_manifest(args.manifest, defaults)
+    cache_dir = args.cache_dir or os.path.join(args.out_dir, ".covers")
+    summary = run_batch(jobs, args.out_dir, max(1, args.workers), cache_dir)
+    print(f"{summary['rendered']} rendered, {summary['failed']} failed, {summary['skipped']} skipped in "
+          f"{summary['elapsed_seconds']:.1f}s ({summary['grids_per_minute']} grids/min)", file=sys.stderr)
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
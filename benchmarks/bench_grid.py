@@ -0,0 +1,219 @@
+"""
+Offline benchmark for generate_album_grid.
+
+Runs a matrix of grid sizes, cell sizes, patterns and dedup settings against
+the local fake Spotify API and image CDN, each case in a fresh process so
+caches start cold and peak RSS belongs to that case alone.
+
+    python -m benchmarks.bench_grid --grid-sizes 5,10,17 --cell-sizes 100,300 \\
+        --patterns normal,spiral --dedup on,off --resampling fast,balanced,high \\
+        --latency-ms 20 --output bench.json
+    python -m benchmarks.bench_grid --compare old.json new.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+def run_case(case, fake_config):
+    """Run one generation in this (fresh) process and return its measurements."""
+    from benchmarks.fakes import FakeImageCDN, FakeSpotifyAPI, fake_spotify_client, playlist_id_for
+    from albumgrids import generate_album_grid, new_stats, timed_stage
+
+    tracemalloc.start()
+    with FakeImageCDN(**fake_config["cdn"]) as cdn, FakeSpotifyAPI(cdn, **fake_config["api"]) as api:
+        sp = fake_spotify_client(api)
+        total_tracks = case["grid_size"] ** 2
+        dup_pct = fake_config["dup_pct"] if case["dedup"] else 0
+        if dup_pct:
+            total_tracks = int(total_tracks / (1 - dup_pct / 100.0)) + 1
+        playlist_id = playlist_id_for(total_tracks, dup_pct)
+        # Render every cover up front so the fake CDN's own JPEG encoding stays out of the timings.
+        for album_index in range(total_tracks):
+            cdn.image_bytes(album_index, 640)
+
+        stats = new_stats()
+        start = time.perf_counter()
+        image = generate_album_grid(
+            sp, mode="playlist", playlist_id=playlist_id, remove_dups=case["dedup"],
+            pattern=case["pattern"], cell_size=case["cell_size"],
+            rounded=case.get("rounded", False), framed=case.get("framed", False),
+            large_library=case.get("large_library", False), resampling=case.get("resampling", "balanced"),
+            stats=stats,
+        )
+        with timed_stage(stats, "encode"):
+            buf = BytesIO()
+            image.save(buf, "PNG")
+        total_seconds = time.perf_counter() - start
+
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "total_seconds": total_seconds,
+            "stages": stats["stages"],
+            "bytes_downloaded": stats["bytes_downloaded"],
+            "duplicates_dropped": stats["duplicates_dropped"],
+            "download_failures": stats["download_failures"],
+            "output_size": list(image.size),
+            "output_bytes": buf.tell(),
+            "cdn_requests": cdn.requests,
+            "cdn_bytes": cdn.bytes_served,
+            "api_requests": api.requests,
+            # ru_maxrss is KiB on Linux, bytes on macOS.
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 1024 * 1024),
+            "tracemalloc_peak_mb": traced_peak / (1024 * 1024),
+            # Pillow pixel buffers are invisible to tracemalloc, so the pipeline counts them itself.
+            "peak_image_mb": stats["peak_image_bytes"] / (1024 * 1024),
+        }
+
+
+def _run_isolated(case, fake_config):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (case, fake_config))
+
+
+def _summarise(case, runs):
+    stages = sorted({s for r in runs for s in r["stages"]})
+    return {
+        **case,
+        "repeats": len(runs),
+        "median_seconds": statistics.median(r["total_seconds"] for r in runs),
+        "stage_median_seconds": {s: statistics.median(r["stages"].get(s, 0.0) for r in runs) for s in stages},
+        # Time spent resizing covers: the cell-size thumbnails plus compositing them.
+        "resample_seconds": statistics.median(
+            r["stages"].get("thumbnail", 0.0) + r["stages"].get("composite", 0.0) for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "tracemalloc_peak_mb": max(r["tracemalloc_peak_mb"] for r in runs),
+        "peak_image_mb": max(r["peak_image_mb"] for r in runs),
+        "output_size": runs[0]["output_size"],
+        "output_bytes": runs[0]["output_bytes"],
+        "cdn_requests": runs[0]["cdn_requests"],
+        "api_requests": runs[0]["api_requests"],
+        "runs": runs,
+    }
+
+
+def build_matrix(args):
+    cases = []
+    for grid_size, cell_size, pattern, dedup, resampling in itertools.product(
+            args.grid_sizes, args.cell_sizes, args.patterns, args.dedup, args.resampling):
+        cases.append({"grid_size": grid_size, "cell_size": cell_size, "pattern": pattern, "dedup": dedup,
+                      "resampling": resampling, "large_library": args.large_library})
+    return cases
+
+
+def run_benchmark(args):
+    fake_config = {
+        "cdn": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                "error_rate": args.error_rate, "image_size": args.image_size, "seed": args.seed},
+        "api": {"latency_ms": args.api_latency_ms},
+        "dup_pct": args.dup_pct,
+    }
+    results = []
+    for case in build_matrix(args):
+        runs = [_run_isolated(case, fake_config) for _ in range(args.repeat)]
+        summary = _summarise(case, runs)
+        results.append(summary)
+        print(f"{case['grid_size']:>3}x{case['grid_size']:<3} cell={case['cell_size']:<4} "
+              f"{case['pattern']:<10} dedup={'on ' if case['dedup'] else 'off'} {case['resampling']:<8} "
+              f"{summary['median_seconds']:7.3f}s  resample={summary['resample_seconds']:6.3f}s  "
+              f"rss={summary['peak_rss_mb']:7.1f}MB", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pillow": __import__("PIL").__version__,
+            "numpy": __import__("numpy").__version__,
+            "fakes": fake_config,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def _case_key(result):
+    # Results from before resampling tiers existed ran what is now "balanced".
+    return tuple(result[k] for k in ("grid_size", "cell_size", "pattern", "dedup")) + (
+        result.get("resampling", "balanced"),)
+
+
+def compare(baseline_path, candidate_path):
+    with open(baseline_path) as f:
+        baseline = {_case_key(r): r for r in json.load(f)["results"]}
+    with open(candidate_path) as f:
+        candidate = json.load(f)["results"]
+    lines = []
+    for result in candidate:
+        base = baseline.get(_case_key(result))
+        if base is None:
+            continue
+        delta = (result["median_seconds"] - base["median_seconds"]) / base["median_seconds"] * 100
+        rss_delta = result["peak_rss_mb"] - base["peak_rss_mb"]
+        grid, cell, pattern, dedup, resampling = _case_key(result)
+        lines.append(f"{grid:>3}x{grid:<3} cell={cell:<4} {pattern:<10} dedup={'on ' if dedup else 'off'} {resampling:<8} "
+                     f"{base['median_seconds']:7.3f}s -> {result['median_seconds']:7.3f}s ({delta:+6.1f}%)  "
+                     f"rss {rss_delta:+7.1f}MB")
+    return "\n".join(lines)
+
+
+def _csv(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def _on_off(value):
+    return value.strip().lower() in ("on", "yes", "true", "1")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid-sizes", type=_csv(int), default=[5, 10, 17])
+    parser.add_argument("--cell-sizes", type=_csv(int), default=[100, 300])
+    parser.add_argument("--patterns", type=_csv(str), default=["normal", "spiral"])
+    parser.add_argument("--dedup", type=_csv(_on_off), default=[True, False])
+    parser.add_argument("--resampling", type=_csv(str), default=["balanced"],
+                        help="comma-separated resampling tiers to compare (fast, balanced, high)")
+    parser.add_argument("--dup-pct", type=int, default=10, help="percentage of repeated albums when dedup is on")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, default=None, help="force every cover to this many pixels")
+    parser.add_argument("--api-latency-ms", type=float, default=30)
+    parser.add_argument("--large-library", action="store_true",
+                        help="use the streaming, chunked large-library pipeline for every case")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="print per-case deltas between two result files and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        print(compare(*args.compare))
+        return 0
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
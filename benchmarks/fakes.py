@@ -0,0 +1,286 @@
+"""
+Local stand-ins for the Spotify Web API and the album art CDN, so
+generate_album_grid and app.py can be measured without network access.
+
+Playlist ids encode their contents as "bench<tracks>[d<dup_pct>][v<variant>]"
+(Spotipy only accepts base62 ids): dup_pct is the percentage of tracks that
+repeat an earlier album, and playlists with different variants share no albums.
+Every album has 640/300/64px images served by FakeImageCDN.
+"""
+
+import colorsys
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image, ImageDraw
+
+IMAGE_VARIANTS = (640, 300, 64)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class _FakeService:
+    """Runs a ThreadingHTTPServer on 127.0.0.1 in a daemon thread."""
+
+    def __init__(self, handler_class):
+        self._server = _QuietServer(("127.0.0.1", 0), handler_class)
+        self._server.service = self
+        self._thread = None
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type, extra_headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, extra_headers=None):
+        self._send(status, json.dumps(payload).encode(), "application/json", extra_headers)
+
+
+class FakeImageCDN(_FakeService):
+    """
+    Serves deterministic JPEG covers at /img/<album>/<size>.
+
+    :param latency_ms: mean added latency per request
+    :param jitter_ms: uniform +/- jitter around latency_ms
+    :param error_rate: fraction of requests answered with HTTP 500
+    :param image_size: overrides the pixel size of every served image
+    :param seed: seeds latency, errors and cover colours for reproducible runs
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, image_size=None, seed=0):
+        super().__init__(_CDNHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.image_size = image_size
+        self.seed = seed
+        self.bytes_served = 0
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._images = {}
+        self._images_lock = threading.Lock()
+
+    def image_url(self, album_index, size=640):
+        return f"{self.url}/img/{album_index}/{size}"
+
+    def next_delay_and_error(self):
+        with self._rng_lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            fail = self._rng.random() < self.error_rate
+        return max(0.0, (self.latency_ms + jitter) / 1000.0), fail
+
+    def image_bytes(self, album_index, size):
+        size = self.image_size or size
+        key = (album_index, size)
+        with self._images_lock:
+            data = self._images.get(key)
+        if data is None:
+            data = render_cover(album_index, size, self.seed)
+            with self._images_lock:
+                self._images[key] = data
+        return data
+
+
+def render_cover(album_index, size, seed=0):
+    """A JPEG whose hue varies by album and whose structure keeps dHashes distinct."""
+    rng = random.Random(seed * 1_000_003 + album_index)
+    hue = rng.random()
+    r, g, b = (int(c * 255) for c in colorsys.hsv_to_rgb(hue, 0.6 + rng.random() * 0.4, 0.5 + rng.random() * 0.5))
+    img = Image.new("RGB", (size, size), (r, g, b))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x0, y0 = rng.randrange(size), rng.randrange(size)
+        x1, y1 = x0 + rng.randrange(size // 2 + 1), y0 + rng.randrange(size // 2 + 1)
+        shade = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x0, y0, x1, y1], fill=shade)
+    buf = BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class _CDNHandler(_Handler):
+    def do_GET(self):
+        cdn = self.server.service
+        cdn.count_request()
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "img":
+            return self._send(404, b"not found", "text/plain")
+        delay, fail = cdn.next_delay_and_error()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self._send(500, b"upstream error", "text/plain")
+        data = cdn.image_bytes(int(parts[1]), int(parts[2]))
+        with cdn._count_lock:
+            cdn.bytes_served += len(data)
+        self._send(200, data, "image/jpeg")
+
+
+class FakeSpotifyAPI(_FakeService):
+    """
+    Answers the Web API endpoints the app uses: playlist, playlist items and
+    the current user's top tracks. Point a Spotipy client at it with
+    `sp.prefix = api.prefix`.
+
+    :param cdn: FakeImageCDN whose URLs go into album images
+    :param top_tracks: number of top tracks the fake user has
+    :param saved_tracks: number of Liked Songs the fake user has
+    :param latency_ms: added latency per API call
+    :param rate_limit_every: answer every Nth call with 429 + Retry-After (0 disables)
+    """
+
+    def __init__(self, cdn, top_tracks=100, latency_ms=0, rate_limit_every=0, retry_after=1, saved_tracks=1000):
+        super().__init__(_APIHandler)
+        self.cdn = cdn
+        self.top_tracks = top_tracks
+        self.saved_tracks = saved_tracks
+        self.latency_ms = latency_ms
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+
+    @property
+    def prefix(self):
+        return f"{self.url}/v1/"
+
+    def track_item(self, album_index, wrapped):
+        track = {
+            "id": f"track{album_index}",
+            "name": f"Track {album_index}",
+            "album": {
+                "id": f"album{album_index}",
+                "name": f"Album {album_index}",
+                "images": [
+                    {"url": self.cdn.image_url(album_index, size), "width": size, "height": size}
+                    for size in IMAGE_VARIANTS
+                ],
+            },
+        }
+        return {"track": track} if wrapped else track
+
+    def album_indices(self, total, dup_pct, seed_key):
+        """Album index for each track; dup_pct% of tracks reuse an earlier album."""
+        rng = random.Random(f"{self.cdn.seed}:{seed_key}")
+        indices = []
+        for i in range(total):
+            if indices and rng.random() * 100 < dup_pct:
+                indices.append(rng.choice(indices))
+            else:
+                indices.append(i)
+        return indices
+
+
+VARIANT_STRIDE = 1_000_000
+
+
+def playlist_id_for(total, dup_pct=0, variant=0):
+    playlist_id = f"bench{total}"
+    if dup_pct:
+        playlist_id += f"d{dup_pct}"
+    if variant:
+        playlist_id += f"v{variant}"
+    return playlist_id
+
+
+def parse_playlist_id(playlist_id):
+    match = re.fullmatch(r"bench(\d+)(?:d(\d+))?(?:v(\d+))?", playlist_id)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2) or 0), int(match.group(3) or 0)
+
+
+class _APIHandler(_Handler):
+    def do_GET(self):
+        api = self.server.service
+        api.count_request()
+        if api.latency_ms:
+            time.sleep(api.latency_ms / 1000.0)
+        if api.rate_limit_every and api.requests % api.rate_limit_every == 0:
+            return self._send_json(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                                   {"Retry-After": str(api.retry_after)})
+
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", 20))
+
+        if parts[:2] == ["v1", "playlists"] and len(parts) in (3, 4):
+            spec = parse_playlist_id(parts[2])
+            if spec is None:
+                return self._send_json(404, {"error": {"status": 404, "message": "Not found."}})
+            total, dup_pct, variant = spec
+            if len(parts) == 3:
+                return self._send_json(200, {"id": parts[2], "name": f"Bench {total}"})
+            indices = [variant * VARIANT_STRIDE + i for i in api.album_indices(total, dup_pct, parts[2])]
+            items = [api.track_item(i, wrapped=True) for i in indices[offset:offset + limit]]
+            return self._send_json(200, {"items": items, "total": total, "offset": offset, "limit": limit})
+
+        if parts == ["v1", "me", "top", "tracks"]:
+            indices = api.album_indices(api.top_tracks, 0, "top")
+            items = [api.track_item(i, wrapped=False) for i in indices[offset:offset + limit]]
+            return self._send_json(200, {"items": items, "total": api.top_tracks, "offset": offset, "limit": limit})
+
+        if parts == ["v1", "me", "tracks"]:
+            indices = api.album_indices(api.saved_tracks, 0, "saved")
+            items = [api.track_item(i, wrapped=True) for i in indices[offset:offset + limit]]
+            return self._send_json(200, {"items": items, "total": api.saved_tracks, "offset": offset, "limit": limit})
+
+        if parts == ["v1", "me"]:
+            return self._send_json(200, {"id": "bench-user", "display_name": "Bench User"})
+
+        self._send_json(404, {"error": {"status": 404, "message": "Not found."}})
+
+
+def fake_spotify_client(api, token="bench-token"):
+    """A pooled Spotipy client (as the app builds them) aimed at the fake API."""
+    from albumgrids import get_spotify_client
+    sp = get_spotify_client(token)
+    sp.prefix = api.prefix
+    return sp
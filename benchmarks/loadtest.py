@@ -0,0 +1,273 @@
+"""
+Concurrent-user load test for app.py.
+
+Serves the real Flask app on a local threaded server, points it at the fake
+Spotify API and image CDN, and drives it with simulated logged-in users that
+each repeat the browser's cycle: POST /generate, poll /progress until done,
+GET /result, then GET /preview.
+
+    python -m benchmarks.loadtest --users 20 --duration 60 --grid-size 10 --output load.json
+
+Reports throughput, per-route latency percentiles, and a time series of
+thread count, RSS and queued/running tasks.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+
+import requests
+from werkzeug.serving import make_server
+
+from benchmarks.fakes import FakeImageCDN, FakeSpotifyAPI, playlist_id_for
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak, which is the best portable figure.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def session_cookie_for(flask_app, token_info):
+    """Build the cookie a browser would hold after /callback, via the app's own session interface."""
+    from flask import session
+    with flask_app.test_request_context("/"):
+        session["token_info"] = token_info
+        response = flask_app.response_class()
+        flask_app.session_interface.save_session(flask_app, session, response)
+    cookie = SimpleCookie()
+    for header in response.headers.getlist("Set-Cookie"):
+        cookie.load(header)
+    return {name: morsel.value for name, morsel in cookie.items()}
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, route, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.errors[route] += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[route].append(elapsed)
+            if response.status_code >= 400:
+                self.errors[route] += 1
+        return response
+
+    def summary(self):
+        def pct(sorted_values, p):
+            return sorted_values[min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))]
+
+        report = {}
+        with self._lock:
+            for route, values in self.samples.items():
+                values = sorted(values)
+                report[route] = {
+                    "count": len(values),
+                    "errors": self.errors[route],
+                    "mean_ms": statistics.fmean(values) * 1000,
+                    "p50_ms": pct(values, 50) * 1000,
+                    "p90_ms": pct(values, 90) * 1000,
+                    "p99_ms": pct(values, 99) * 1000,
+                    "max_ms": values[-1] * 1000,
+                }
+        return report
+
+
+class SimulatedUser(threading.Thread):
+    def __init__(self, base_url, cookies, playlist_id, recorder, stop_at, poll_interval):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.http = requests.Session()
+        host = base_url.split("//", 1)[1].split(":")[0]
+        for name, value in cookies.items():
+            # Same (domain, path, name) the jar will use for the app's own Set-Cookie,
+            # so later session updates replace this cookie rather than shadowing it.
+            self.http.cookies.set(name, value, domain=host, path="/")
+        self.playlist_id = playlist_id
+        self.recorder = recorder
+        self.stop_at = stop_at
+        self.poll_interval = poll_interval
+        self.completed = []
+        self.failed = 0
+
+    def run_cycle(self):
+        start = time.perf_counter()
+        response = self.recorder.timed("/generate", self.http.post, f"{self.base_url}/generate", data={
+            "mode": "playlist", "playlist_id": self.playlist_id, "remove_dups": "yes",
+            "pattern": "normal", "cell_size": "100",
+        })
+        task_id = response.json().get("task_id")
+        if not task_id:
+            return False
+        while time.time() < self.stop_at + 120:
+            time.sleep(self.poll_interval)
+            status = self.recorder.timed("/progress", self.http.get, f"{self.base_url}/progress/{task_id}").json()
+            if status["status"] == "done":
+                break
+            if status["status"] in ("error", "expired", "cancelled"):
+                return False
+        self.recorder.timed("/result", self.http.get, f"{self.base_url}/result", allow_redirects=False)
+        preview = self.recorder.timed("/preview", self.http.get, f"{self.base_url}/preview", allow_redirects=False)
+        if preview.status_code != 200:
+            return False
+        self.completed.append(time.perf_counter() - start)
+        return True
+
+    def run(self):
+        while time.time() < self.stop_at:
+            try:
+                if not self.run_cycle():
+                    self.failed += 1
+            except (requests.RequestException, ValueError):
+                self.failed += 1
+
+
+def sample_process(flask_module, samples, stop, interval):
+    start = time.time()
+    while not stop.is_set():
+        statuses = [t.get("status") for t in list(flask_module.tasks.values())]
+        samples.append({
+            "t": round(time.time() - start, 2),
+            "threads": threading.active_count(),
+            "rss_mb": round(current_rss_mb(), 1),
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+        })
+        stop.wait(interval)
+
+
+def run_load_test(args):
+    import albumgrids
+    import app as flask_module
+
+    with FakeImageCDN(latency_ms=args.cdn_latency_ms, jitter_ms=args.cdn_jitter_ms,
+                      error_rate=args.cdn_error_rate, image_size=args.image_size, seed=args.seed) as cdn, \
+            FakeSpotifyAPI(cdn, latency_ms=args.api_latency_ms) as api:
+        # Aim every client the app builds at the fake API.
+        real_get_client = albumgrids.get_spotify_client
+
+        def get_fake_client(access_token):
+            sp = real_get_client(access_token)
+            sp.prefix = api.prefix
+            return sp
+
+        flask_module.get_spotify_client = get_fake_client
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, flask_module.app, threaded=True)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        now = int(time.time())
+        stop_at = time.time() + args.duration
+        recorder = LatencyRecorder()
+        users = []
+        for i in range(args.users):
+            token_info = {
+                "access_token": f"load-user-{i}", "refresh_token": "unused", "token_type": "Bearer",
+                "expires_in": 3600, "expires_at": now + 3600, "scope": flask_module.SCOPE,
+            }
+            variant = 0 if args.shared_playlist else i + 1
+            playlist_id = playlist_id_for(args.grid_size ** 2, variant=variant)
+            users.append(SimulatedUser(base_url, session_cookie_for(flask_module.app, token_info),
+                                       playlist_id, recorder, stop_at, args.poll_interval))
+
+        samples, stop_sampling = [], threading.Event()
+        sampler = threading.Thread(target=sample_process,
+                                   args=(flask_module, samples, stop_sampling, args.sample_interval), daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        for user in users:
+            user.start()
+            time.sleep(args.ramp_up / max(1, args.users))
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - started
+        stop_sampling.set()
+        sampler.join()
+        server.shutdown()
+        flask_module.get_spotify_client = real_get_client
+
+    cycles = [c for u in users for c in u.completed]
+    requests_total = sum(r["count"] for r in recorder.summary().values())
+    return {
+        "config": vars(args),
+        "elapsed_seconds": elapsed,
+        "completed_cycles": len(cycles),
+        "failed_cycles": sum(u.failed for u in users),
+        "cycles_per_second": len(cycles) / elapsed if elapsed else 0,
+        "requests_per_second": requests_total / elapsed if elapsed else 0,
+        "cycle_p50_seconds": statistics.median(cycles) if cycles else None,
+        "cycle_max_seconds": max(cycles) if cycles else None,
+        "routes": recorder.summary(),
+        "peak_threads": max((s["threads"] for s in samples), default=0),
+        "peak_rss_mb": max((s["rss_mb"] for s in samples), default=0),
+        "cdn_requests": cdn.requests,
+        "api_requests": api.requests,
+        "timeline": samples,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="simulated logged-in sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep starting new cycles")
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds over which users start")
+    parser.add_argument("--grid-size", type=int, default=8)
+    parser.add_argument("--shared-playlist", action="store_true",
+                        help="every user generates the same playlist instead of a private one")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="matches the page's 500ms poll")
+    parser.add_argument("--cdn-latency-ms", type=float, default=20)
+    parser.add_argument("--cdn-jitter-ms", type=float, default=5)
+    parser.add_argument("--cdn-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-latency-ms", type=float, default=30)
+    parser.add_argument("--image-size", type=int, default=None)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_load_test(args)
+    print(f"{report['completed_cycles']} cycles in {report['elapsed_seconds']:.1f}s "
+          f"({report['cycles_per_second']:.2f}/s, {report['requests_per_second']:.1f} req/s), "
+          f"{report['failed_cycles']} failed, peak {report['peak_threads']} threads / {report['peak_rss_mb']:.0f}MB RSS",
+          file=sys.stderr)
+    for route, stats in sorted(report["routes"].items()):
+        print(f"  {route:<10} n={stats['count']:<6} p50={stats['p50_ms']:8.1f}ms p90={stats['p90_ms']:8.1f}ms "
+              f"p99={stats['p99_ms']:8.1f}ms errors={stats['errors']}", file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
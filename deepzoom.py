@@ -0,0 +1,148 @@
+# deepzoom.py
+"""
+Deep Zoom (DZI) tile pyramid for a grid, rendered straight from its sorted
+cover thumbnails rather than from a finished flat image. Tiles are drawn on
+first request and cached, so a huge grid can be browsed as soon as its
+covers have been analysed, and only the tiles in view are ever produced.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+from albumgrids import grid_positions
+
+TILE_SIZE = 254
+TILE_OVERLAP = 1
+TILE_QUALITY = 85
+# Below this many pixels per cell, a level is scaled from one cached overview
+# instead of resizing thousands of covers per tile.
+MIN_CELL_PIXELS = 8
+OVERVIEW_MAX_PIXELS = 4096
+TILE_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class DeepZoom:
+    """
+    :param grid_size: cells per side
+    :param cell_size: full-resolution pixels per cell
+    :param pattern: grid pattern, as for grid_positions
+    :param get_cell: callable(index, size) returning the PIL image of the index-th
+                     placed cover; size is a hint for decoders that can scale cheaply
+    """
+
+    def __init__(self, grid_size, cell_size, pattern, get_cell, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                 cache_bytes=TILE_CACHE_BYTES):
+        self.grid_size = grid_size
+        self.cell_size = cell_size
+        self.get_cell = get_cell
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.cache_bytes = cache_bytes
+        self.width = self.height = grid_size * cell_size
+        self.max_level = math.ceil(math.log2(max(self.width, 1)))
+        self._cells = {}
+        for index, (col, row) in enumerate(grid_positions(pattern, grid_size)):
+            self._cells[(col, row)] = index
+        self._tiles = OrderedDict()
+        self._tile_bytes = 0
+        self._lock = threading.Lock()
+        self._overview = None
+        self._overview_lock = threading.Lock()
+
+        # First level whose cells are big enough to draw individually.
+        self.detail_level = self.max_level
+        while self.detail_level > 0 and self._cell_pixels(self.detail_level - 1) >= MIN_CELL_PIXELS:
+            self.detail_level -= 1
+
+    def dzi(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="jpg" Overlap="{self.overlap}" TileSize="{self.tile_size}">'
+            f'<Size Width="{self.width}" Height="{self.height}"/></Image>'
+        )
+
+    def level_size(self, level):
+        scale = 2 ** (self.max_level - level)
+        return math.ceil(self.width / scale), math.ceil(self.height / scale)
+
+    def tile_count(self, level):
+        w, h = self.level_size(level)
+        return math.ceil(w / self.tile_size), math.ceil(h / self.tile_size)
+
+    def tile(self, level, col, row):
+        """JPEG bytes of one tile, or None if it is outside the pyramid."""
+        if not 0 <= level <= self.max_level:
+            return None
+        cols, rows = self.tile_count(level)
+        if not (0 <= col < cols and 0 <= row < rows):
+            return None
+        key = (level, col, row)
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                return data
+
+        w, h = self.level_size(level)
+        x0 = max(0, col * self.tile_size - self.overlap)
+        y0 = max(0, row * self.tile_size - self.overlap)
+        x1 = min(w, (col + 1) * self.tile_size + self.overlap)
+        y1 = min(h, (row + 1) * self.tile_size + self.overlap)
+        if level >= self.detail_level:
+            image = self._render_region(level, x0, y0, x1, y1)
+        else:
+            image = self._from_overview(level, x0, y0, x1, y1)
+        buf = BytesIO()
+        image.save(buf, "JPEG", quality=TILE_QUALITY)
+        data = buf.getvalue()
+
+        with self._lock:
+            if key not in self._tiles:
+                self._tiles[key] = data
+                self._tile_bytes += len(data)
+                while self._tile_bytes > self.cache_bytes and len(self._tiles) > 1:
+                    _, evicted = self._tiles.popitem(last=False)
+                    self._tile_bytes -= len(evicted)
+        return data
+
+    def composite(self):
+        """The full-resolution flat grid, for when a PNG download is wanted."""
+        return self._render_region(self.max_level, 0, 0, self.width, self.height)
+
+    def _cell_pixels(self, level):
+        return self.cell_size / 2 ** (self.max_level - level)
+
+    def _render_region(self, level, x0, y0, x1, y1):
+        region = Image.new("RGB", (x1 - x0, y1 - y0))
+        cell = self._cell_pixels(level)
+        first_col, last_col = int(x0 // cell), min(self.grid_size - 1, int((x1 - 1) // cell))
+        first_row, last_row = int(y0 // cell), min(self.grid_size - 1, int((y1 - 1) // cell))
+        for row in range(first_row, last_row + 1):
+            top, bottom = round(row * cell), round((row + 1) * cell)
+            for col in range(first_col, last_col + 1):
+                index = self._cells.get((col, row))
+                if index is None:
+                    continue
+                left, right = round(col * cell), round((col + 1) * cell)
+                size = (max(1, right - left), max(1, bottom - top))
+                img = self.get_cell(index, size)
+                region.paste(img.convert("RGB").resize(size, reducing_gap=2.0), (left - x0, top - y0))
+        return region
+
+    def _from_overview(self, level, x0, y0, x1, y1):
+        with self._overview_lock:
+            if self._overview is None:
+                overview_level = self.detail_level
+                while overview_level > 0 and max(self.level_size(overview_level)) > OVERVIEW_MAX_PIXELS:
+                    overview_level -= 1
+                w, h = self.level_size(overview_level)
+                self._overview = (overview_level, self._render_region(overview_level, 0, 0, w, h))
+        overview_level, overview = self._overview
+        scale = 2 ** (overview_level - level)
+        box = (x0 * scale, y0 * scale, min(overview.width, x1 * scale), min(overview.height, y1 * scale))
+        return overview.resize((x1 - x0, y1 - y0), Image.BILINEAR, box=box)
@@ -0,0 +1,141 @@
+# janitor.py
+"""
+Expiry index and disk quota for generated artifacts (display renditions, full
+PNGs, zip bundles). Every file is registered when it is written; a periodic
+sweep deletes the ones past their lifetime, and whenever the total goes over
+the quota the oldest are deleted first, so files handed to a session that
+never comes back can't pile up in the temp directory.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class ArtifactJanitor:
+    """
+    :param directory: where artifacts are written; files already there (left by an
+                      earlier run) are adopted by modification time
+    :param quota_bytes: most bytes of artifacts kept at once
+    :param ttl_seconds: how long an artifact lives after it was last written or served
+    :param on_remove: optional callable(path, reason) for each file the janitor deletes,
+                      reason being "expired" or "quota"
+    """
+
+    def __init__(self, directory, quota_bytes, ttl_seconds, on_remove=None):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.on_remove = on_remove
+        # path -> {"bytes", "expires", "on_evict"}, oldest first. Every entry has the
+        # same lifetime, so this is also expiry order.
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.removed = {"expired": 0, "quota": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._adopt_existing()
+
+    def _adopt_existing(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        for mtime, path, size in sorted(found):
+            self._entries[path] = {"bytes": size, "expires": mtime + self.ttl_seconds, "on_evict": None}
+            self._bytes += size
+
+    def new_file(self, suffix):
+        """An open, not-yet-registered temp file in the artifact directory; add() it once written."""
+        return tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=self.directory)
+
+    def add(self, path, on_evict=None):
+        """
+        Start tracking a finished file, then enforce the quota.
+
+        :param on_evict: optional callable(path) run after the janitor deletes this file
+                         (not when the owner calls remove), so the owner can forget it
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= old["bytes"]
+            self._entries[path] = {"bytes": size, "expires": time.time() + self.ttl_seconds,
+                                   "on_evict": on_evict}
+            self._bytes += size
+        self._evict(over_quota_only=True)
+
+    def touch(self, path):
+        """Restart an artifact's lifetime because it is still being used."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                entry["expires"] = time.time() + self.ttl_seconds
+                self._entries.move_to_end(path)
+
+    def remove(self, path):
+        """Delete an artifact whose owner no longer needs it."""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry["bytes"]
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def sweep(self):
+        """Delete expired artifacts, then the oldest until under the quota. Returns how many went."""
+        return self._evict(over_quota_only=False)
+
+    def _evict(self, over_quota_only):
+        victims = []
+        now = time.time()
+        with self._lock:
+            while self._entries:
+                path, entry = next(iter(self._entries.items()))
+                if not over_quota_only and entry["expires"] <= now:
+                    reason = "expired"
+                elif self._bytes > self.quota_bytes and len(self._entries) > 1:
+                    # The newest file is kept even if it alone is over the quota.
+                    reason = "quota"
+                else:
+                    break
+                del self._entries[path]
+                self._bytes -= entry["bytes"]
+                self.removed[reason] += 1
+                victims.append((path, entry, reason))
+        for path, entry, reason in victims:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            if entry["on_evict"] is not None:
+                entry["on_evict"](path)
+            if self.on_remove is not None:
+                self.on_remove(path, reason)
+        return len(victims)
+
+    def usage(self):
+        with self._lock:
+            files, held = len(self._entries), self._bytes
+        disk = shutil.disk_usage(self.directory)
+        return {
+            "directory": self.directory,
+            "files": files,
+            "bytes": held,
+            "quota_bytes": self.quota_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "removed_expired": self.removed["expired"],
+            "removed_quota": self.removed["quota"],
+            "disk_free_bytes": disk.free,
+            "disk_total_bytes": disk.total,
+        }
@@ -0,0 +1,651 @@
+# pages.py
+"""
+HTML for the web UI as Jinja templates, served through a DictLoader so each is
+parsed and compiled once per process. Pages with no per-request variables are
+also rendered once and kept pre-compressed, so serving them is a dictionary
+lookup plus a byte copy.
+"""
+
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # optional: without it pages are offered as gzip only
+    brotli = None
+
+COMMON_HEAD = """
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <meta name="description" content="Generate beautiful Spotify album cover grids from your playlists or top tracks. Login with Spotify and create your unique collage now!">
+    <meta name="google-site-verification" content="Bb23Njg1oKFgYtGMT3MR_MWG7-MgTFpKymCYPafltpo" />
+    <link rel="icon" href="/favicon.ico" type="image/png">
+    <script async src="https://www.googletagmanager.com/gtag/js?id=G-HYRLRLLH5X"></script>
+    <script>
+      window.dataLayer = window.dataLayer || [];
+      function gtag(){dataLayer.push(arguments);}
+      gtag('js', new Date());
+      gtag('config', 'G-HYRLRLLH5X');
+    </script>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">
+    <style>
+      :root {
+        --sp-black: #121212;
+        --sp-dark: #181818;
+        --sp-card: #282828;
+        --sp-hover: #333333;
+        --sp-green: #1DB954;
+        --sp-green-light: #1ed760;
+        --sp-white: #FFFFFF;
+        --sp-muted: #B3B3B3;
+        --sp-dim: #535353;
+      }
+      body {
+        font-family: 'Inter', sans-serif;
+        min-height: 100vh; display: flex; flex-direction: column;
+        background: var(--sp-black); color: var(--sp-white);
+        background-image: radial-gradient(ellipse at 50% 0%, rgba(29,185,84,0.06) 0%, transparent 60%);
+      }
+      main { flex: 1; }
+      a { color: var(--sp-green); }
+      a:hover { color: var(--sp-green-light); }
+
+      .navbar {
+        background: rgba(18,18,18,0.8) !important;
+        backdrop-filter: blur(12px); -webkit-backdrop-filter: blur(12px);
+        border-bottom: 1px solid rgba(255,255,255,0.06);
+        font-weight: 600; letter-spacing: 0.02em;
+      }
+      .navbar-brand { font-size: 1.3rem; color: var(--sp-white) !important; }
+      .navbar-brand:hover { color: var(--sp-green) !important; }
+      .nav-link { color: var(--sp-muted) !important; }
+      .nav-link:hover { color: var(--sp-white) !important; }
+
+      footer { font-size: 0.85rem; color: var(--sp-dim); }
+
+      .btn { font-weight: 500; letter-spacing: 0.01em; border-radius: 50px; }
+      .btn-sp {
+        background: var(--sp-green); border: none; color: var(--sp-black);
+        font-weight: 700; padding: 0.7rem 2rem;
+        transition: transform 0.15s, background 0.15s;
+      }
+      .btn-sp:hover {
+        background: var(--sp-green-light); color: var(--sp-black);
+        transform: scale(1.04);
+      }
+      .btn-sp:disabled {
+        background: var(--sp-dim); color: var(--sp-muted);
+        transform: none; cursor: not-allowed; opacity: 0.8;
+      }
+      .btn-sp-outline {
+        background: transparent; border: 1px solid var(--sp-muted); color: var(--sp-white);
+        font-weight: 600; padding: 0.7rem 2rem;
+      }
+      .btn-sp-outline:hover {
+        border-color: var(--sp-white); color: var(--sp-white);
+        transform: scale(1.04);
+      }
+
+      .card {
+        background: rgba(255,255,255,0.05);
+        backdrop-filter: blur(16px); -webkit-backdrop-filter: blur(16px);
+        border: 1px solid rgba(255,255,255,0.08); border-radius: 16px;
+        box-shadow: 0 8px 32px rgba(0,0,0,0.3);
+      }
+      .form-select, .form-control {
+        background: rgba(255,255,255,0.07); border: 1px solid rgba(255,255,255,0.1); color: var(--sp-white);
+        border-radius: 8px;
+      }
+      .form-select:focus, .form-control:focus {
+        background: rgba(255,255,255,0.1); color: var(--sp-white);
+        border-color: var(--sp-green); box-shadow: 0 0 0 2px rgba(29,185,84,0.25);
+      }
+      .form-control::placeholder { color: var(--sp-muted); opacity: 1; }
+      .form-select option { background: var(--sp-card); color: var(--sp-white); }
+      .form-select {
+        cursor: pointer;
+        background-image: url("data:image/svg+xml,%3csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16'%3e%3cpath fill='none' stroke='%23B3B3B3' stroke-linecap='round' stroke-linejoin='round' stroke-width='2' d='m2 5 6 6 6-6'/%3e%3c/svg%3e");
+        background-repeat: no-repeat; background-position: right 0.75rem center; background-size: 16px 12px;
+        padding-right: 2.5rem; appearance: none;
+      }
+      .form-label { color: var(--sp-muted); font-weight: 500; font-size: 0.9rem; margin-bottom: 0.3rem; }
+      .text-muted { color: var(--sp-muted) !important; }
+
+      .navbar-brand, .nav-link, a { cursor: pointer; }
+      .btn { cursor: pointer; }
+      .form-check-input:checked {
+        background-color: var(--sp-green); border-color: var(--sp-green);
+      }
+      .form-check-input:focus {
+        box-shadow: 0 0 0 2px rgba(29,185,84,0.25); border-color: var(--sp-green);
+      }
+
+      .progress {
+        background: rgba(255,255,255,0.08); border-radius: 12px;
+      }
+      .progress-bar {
+        background: var(--sp-green);
+      }
+
+      h1, h2 { color: var(--sp-white); }
+    </style>
+"""
+
+NAVBAR_LOGGED_OUT = """
+    <nav class="navbar navbar-expand-lg navbar-dark">
+      <div class="container">
+        <a class="navbar-brand" href="/">Spotify Covers</a>
+      </div>
+    </nav>
+"""
+
+NAVBAR_LOGGED_IN = """
+    <nav class="navbar navbar-expand-lg navbar-dark">
+      <div class="container">
+        <a class="navbar-brand" href="/">Spotify Covers</a>
+        <button class="navbar-toggler" type="button" data-bs-toggle="collapse" data-bs-target="#navbarNav">
+          <span class="navbar-toggler-icon"></span>
+        </button>
+        <div class="collapse navbar-collapse" id="navbarNav">
+          <ul class="navbar-nav ms-auto">
+            <li class="nav-item"><a class="nav-link" href="/logout">Logout</a></li>
+          </ul>
+        </div>
+      </div>
+    </nav>
+"""
+
+FOOTER = """
+    <footer class="text-center py-3 mt-auto">
+      <p class="mb-0">&copy; 2026 Spotify Covers</p>
+    </footer>
+    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
+"""
+
+LANDING_PAGE = """
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <title>Spotify Covers - Album Grid Generator</title>
+    """ + COMMON_HEAD + """
+    <style>
+      .hero-section {
+        display: flex; align-items: center; justify-content: center;
+        min-height: calc(100vh - 120px); padding: 2rem 0;
+      }
+      .hero-content { text-align: center; max-width: 480px; z-index: 2; }
+      .hero-content h1 {
+        font-size: 3rem; font-weight: 800; letter-spacing: -0.02em;
+        margin-bottom: 1rem;
+      }
+      .hero-content .lead {
+        font-size: 1.1rem; color: var(--sp-muted); margin-bottom: 2rem;
+        line-height: 1.6;
+      }
+      .hero-content .btn-sp { font-size: 1.1rem; padding: 0.85rem 3rem; }
+
+      .example-grid {
+        width: 300px; border-radius: 14px; overflow: hidden;
+        background: rgba(255,255,255,0.04);
+        backdrop-filter: blur(12px); -webkit-backdrop-filter: blur(12px);
+        border: 1px solid rgba(255,255,255,0.06);
+        box-shadow: 0 8px 32px rgba(0,0,0,0.3);
+        padding: 8px;
+        transition: transform 0.3s ease;
+      }
+      .example-grid:hover { transform: scale(1.04); }
+      .example-grid img {
+        width: 100%; border-radius: 8px; display: block;
+      }
+      .hero-stack {
+        display: flex; flex-direction: column; gap: 1rem;
+      }
+
+      .hero-side { display: none; }
+      @media (min-width: 992px) {
+        .hero-section { gap: 3rem; }
+        .hero-side { display: flex; }
+        .hero-content { text-align: left; }
+      }
+    </style>
+  </head>
+  <body>
+    """ + NAVBAR_LOGGED_OUT + """
+    <main>
+      <div class="container">
+        <div class="hero-section">
+          <div class="hero-side hero-stack">
+            <div class="example-grid">
+              <img src="/static/Party_Songs_13x13_spiral.png" alt="Spiral pattern grid" loading="lazy" />
+            </div>
+            <div class="example-grid">
+              <img src="/static/Bestest_Songs_40_6x6_diagonal.png" alt="Diagonal pattern grid" loading="lazy" />
+            </div>
+          </div>
+          <div class="hero-content">
+            <h1>Album Grid Generator</h1>
+            <p class="lead">Turn your Spotify playlists and top tracks into stunning album cover collages.</p>
+            <a href="/login" class="btn btn-sp">Login with Spotify</a>
+          </div>
+          <div class="hero-side hero-stack">
+            <div class="example-grid">
+              <img src="/static/Studying_(instrumentals)_10x10_diagonal.png" alt="Diagonal pattern grid" loading="lazy" />
+            </div>
+            <div class="example-grid">
+              <img src="/static/Good_Songs_2024!_24x24_normal.png" alt="Normal pattern grid" loading="lazy" />
+            </div>
+          </div>
+        </div>
+      </div>
+    </main>
+    """ + FOOTER + """
+  </body>
+</html>
+"""
+
+GENERATE_PAGE = """
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <title>Spotify Covers - Generate Grid</title>
+    """ + COMMON_HEAD + """
+    <script type="application/ld+json">
+    {
+      "@context": "https://schema.org",
+      "@type": "WebApplication",
+      "name": "Spotify Covers",
+      "url": "https://spotifycovers-production.up.railway.app/",
+      "description": "Generate stunning Spotify album cover grids from your playlists or top tracks.",
+      "applicationCategory": "Music"
+    }
+    </script>
+    <style>
+      #progress-section { display: none; }
+      #progress-bar-inner {
+        transition: width 0.3s ease;
+        background: linear-gradient(90deg, var(--sp-green), var(--sp-green-light), var(--sp-green));
+        background-size: 200% 100%;
+        animation: shimmer 1.5s ease-in-out infinite;
+      }
+      @keyframes shimmer { 0% { background-position: 200% 0; } 100% { background-position: -200% 0; } }
+      #progress-message { font-size: 0.9rem; color: var(--sp-white); }
+      #progress-preview {
+        display: none; width: 100%; margin-top: 1rem; border-radius: 6px;
+        image-rendering: pixelated; background: #121212;
+      }
+      #layout-preview { display: none; width: 100%; margin-top: 1rem; border-radius: 6px; background: #121212; }
+    </style>
+  </head>
+  <body>
+    """ + NAVBAR_LOGGED_IN + """
+    <main>
+      <div class="container py-4">
+        <div class="row justify-content-center">
+          <div class="col-md-5 col-lg-4">
+            <h2 class="text-center mb-4" style="font-weight:700;">Generate Grid</h2>
+            <div class="card shadow-sm">
+              <div class="card-body p-4">
+                <form id="grid-form">
+                  <div class="mb-3">
+                    <label class="form-label">Mode</label>
+                    <select name="mode" id="mode-select" class="form-select">
+                      <option value="playlist">Playlist</option>
+                      <option value="top">Top Tracks</option>
+                      <option value="saved">Liked Songs</option>
+                    </select>
+                  </div>
+
+                  <div class="mb-3" id="playlist-field">
+                    <label class="form-label">Playlist URL or ID</label>
+                    <input type="text" name="playlist_id" class="form-control"
+                           placeholder="https://open.spotify.com/playlist/..." />
+                    <div class="form-text text-muted">Separate several with commas to merge them into one grid.</div>
+                  </div>
+
+                  <div class="mb-3" id="time-range-field" style="display:none;">
+                    <label class="form-label">Time Range</label>
+                    <select name="time_range" class="form-select">
+                      <option value="short_term">Last 4 Weeks</option>
+                      <option value="medium_term" selected>Last 6 Months</option>
+                      <option value="long_term">All Time</option>
+                    </select>
+                  </div>
+
+                  <div class="mb-3" id="grid-size-field" style="display:none;">
+                    <label class="form-label">Grid Size (optional)</label>
+                    <input type="number" name="grid_size" class="form-control"
+                           placeholder="Auto" min="1" max="100" />
+                    <div style="font-size:0.78rem; color:var(--sp-dim); margin-top:4px;">
+                      Leave blank to auto-size, or set e.g. 10 for a 10&times;10 grid.
+                      Grids above 17&times;17 use large-library mode; the largest is 100&times;100
+                      at 100px, 50&times;50 at 200px and 33&times;33 at 300px.
+                    </div>
+                  </div>
+
+                  <div class="mb-3">
+                    <label class="form-label">Remove Duplicates</label>
+                    <select name="remove_dups" class="form-select">
+                      <option value="yes" selected>Yes</option>
+                      <option value="no">No</option>
+                    </select>
+                  </div>
+
+                  <div class="mb-3">
+                    <label class="form-label">Pattern</label>
+                    <select name="pattern" class="form-select">
+                      <option value="normal">Normal</option>
+                      <option value="diagonal">Diagonal</option>
+                      <option value="spiral">Spiral</option>
+                      <option value="checkered">Checkered</option>
+                    </select>
+                  </div>
+
+                  <div class="mb-3">
+                    <label class="form-label">Resolution</label>
+                    <select name="cell_size" class="form-select">
+                      <option value="100" selected>Standard (100px)</option>
+                      <option value="200">High (200px)</option>
+                      <option value="300">Ultra (300px)</option>
+                      <option value="bundle">All three (100/200/300px, zip)</option>
+                    </select>
+                  </div>
+
+                  <div class="mb-2 form-check">
+                    <input type="checkbox" name="large" value="yes" class="form-check-input" id="large-check"
+                           style="cursor:pointer; background-color:rgba(255,255,255,0.07); border-color:rgba(255,255,255,0.2);">
+                    <label class="form-check-label" for="large-check" style="cursor:pointer; color:var(--sp-muted); font-weight:500; font-size:0.9rem;">
+                      Large library (up to 10,000 covers)
+                    </label>
+                  </div>
+
+                  <div class="mb-2 form-check">
+                    <input type="checkbox" name="deepzoom" value="yes" class="form-check-input" id="deepzoom-check"
+                           style="cursor:pointer; background-color:rgba(255,255,255,0.07); border-color:rgba(255,255,255,0.2);">
+                    <label class="form-check-label" for="deepzoom-check" style="cursor:pointer; color:var(--sp-muted); font-weight:500; font-size:0.9rem;">
+                      Zoomable viewer (open before the PNG is ready)
+                    </label>
+                  </div>
+
+                  <div class="mb-2 form-check">
+                    <input type="checkbox" name="rounded" value="yes" class="form-check-input" id="rounded-check"
+                           style="cursor:pointer; background-color:rgba(255,255,255,0.07); border-color:rgba(255,255,255,0.2);">
+                    <label class="form-check-label" for="rounded-check" style="cursor:pointer; color:var(--sp-muted); font-weight:500; font-size:0.9rem;">
+                      Rounded corners
+                    </label>
+                  </div>
+
+                  <div class="mb-3 form-check">
+                    <input type="checkbox" name="framed" value="yes" class="form-check-input" id="framed-check"
+                           style="cursor:pointer; background-color:rgba(255,255,255,0.07); border-color:rgba(255,255,255,0.2);">
+                    <label class="form-check-label" for="framed-check" style="cursor:pointer; color:var(--sp-muted); font-weight:500; font-size:0.9rem;">
+                      Dark frame border
+                    </label>
+                  </div>
+
+                  <button type="submit" id="submit-btn" class="btn btn-sp w-100 py-2" style="border-radius:8px;">
+                    Generate Grid
+                  </button>
+                </form>
+
+                <div id="progress-section" class="mt-4">
+                  <div class="progress" style="height: 24px;">
+                    <div id="progress-bar-inner" class="progress-bar progress-bar-striped progress-bar-animated"
+                         role="progressbar" style="width: 0%;">
+                    </div>
+                  </div>
+                  <p id="progress-message" class="text-muted text-center mt-2">Starting...</p>
+                  <p class="text-center"><a id="deepzoom-link" href="#" target="_blank" style="display:none;">Open the zoomable view now</a></p>
+                  <img id="progress-preview" alt="grid preview" />
+                  <canvas id="layout-preview" width="512" height="512"></canvas>
+                </div>
+              </div>
+            </div>
+          </div>
+        </div>
+      </div>
+    </main>
+    """ + FOOTER + """
+    <script>
+      const modeSelect = document.getElementById('mode-select');
+      const playlistField = document.getElementById('playlist-field');
+      const timeRangeField = document.getElementById('time-range-field');
+      const gridSizeField = document.getElementById('grid-size-field');
+
+      function updateModeFields() {
+        const isTop = modeSelect.value === 'top';
+        const isPlaylist = modeSelect.value === 'playlist';
+        playlistField.style.display = isPlaylist ? '' : 'none';
+        timeRangeField.style.display = isTop ? '' : 'none';
+        gridSizeField.style.display = isPlaylist ? 'none' : '';
+      }
+      modeSelect.addEventListener('change', updateModeFields);
+      updateModeFields();
+
+      // Draw the final arrangement from Spotify's 64px thumbnails while the server encodes.
+      async function drawLayout(taskId, canvas) {
+        const res = await fetch('/progress/' + taskId + '/layout');
+        if (!res.ok) return false;
+        const layout = await res.json();
+        const cell = Math.floor(512 / layout.grid_size) || 1;
+        canvas.width = canvas.height = cell * layout.grid_size;
+        const ctx = canvas.getContext('2d');
+        layout.slots.forEach(([col, row, url]) => {
+          const img = new Image();
+          img.onload = () => ctx.drawImage(img, col * cell, row * cell, cell, cell);
+          img.src = url;
+        });
+        return true;
+      }
+
+      document.getElementById('grid-form').addEventListener('submit', async (e) => {
+        e.preventDefault();
+        const form = e.target;
+        const btn = document.getElementById('submit-btn');
+        const progressSection = document.getElementById('progress-section');
+        const progressBar = document.getElementById('progress-bar-inner');
+        const progressMsg = document.getElementById('progress-message');
+        const progressPreview = document.getElementById('progress-preview');
+        const layoutPreview = document.getElementById('layout-preview');
+        const deepzoomLink = document.getElementById('deepzoom-link');
+        let previewVersion = 0;
+        let layoutRequested = false;
+
+        btn.disabled = true;
+        btn.textContent = 'Starting...';
+        progressSection.style.display = 'block';
+        progressBar.style.width = '2%';
+        progressMsg.textContent = 'Submitting...';
+
+        const formData = new FormData(form);
+        let taskId;
+
+        try {
+          const res = await fetch('/generate', { method: 'POST', body: formData });
+          const data = await res.json();
+          if (data.error) {
+            if (data.expired) { window.location.href = '/login'; return; }
+            throw new Error(data.error);
+          }
+          taskId = data.task_id;
+        } catch (err) {
+          progressMsg.textContent = 'Error: ' + err.message;
+          btn.disabled = false;
+          btn.textContent = 'Generate Grid';
+          return;
+        }
+
+        const poll = setInterval(async () => {
+          try {
+            const res = await fetch('/progress/' + taskId);
+            const data = await res.json();
+            const pct = data.total > 0 ? Math.round((data.current / data.total) * 100) : 0;
+            progressBar.style.width = Math.max(pct, 2) + '%';
+            progressMsg.textContent = data.message;
+            if (data.layout_ready && !layoutRequested) {
+              layoutRequested = true;
+              if (await drawLayout(taskId, layoutPreview)) {
+                progressPreview.style.display = 'none';
+                layoutPreview.style.display = 'block';
+              }
+            }
+            if (data.deepzoom && deepzoomLink.style.display === 'none') {
+              deepzoomLink.href = data.deepzoom;
+              deepzoomLink.style.display = '';
+            }
+            if (!layoutRequested && data.preview_version && data.preview_version !== previewVersion) {
+              previewVersion = data.preview_version;
+              progressPreview.src = '/progress/' + taskId + '/preview?v=' + previewVersion;
+              progressPreview.style.display = 'block';
+            }
+
+            if (data.status === 'done') {
+              clearInterval(poll);
+              progressBar.style.width = '100%';
+              progressMsg.textContent = 'Redirecting...';
+              window.location.href = '/result';
+            } else if (data.status === 'expired') {
+              clearInterval(poll);
+              window.location.href = '/login';
+            } else if (data.status === 'error' || data.status === 'cancelled') {
+              clearInterval(poll);
+              progressMsg.textContent = 'Error: ' + data.message;
+              btn.disabled = false;
+              btn.textContent = 'Generate Grid';
+            }
+          } catch (err) {
+            clearInterval(poll);
+            progressMsg.textContent = 'Connection lost. Please try again.';
+            btn.disabled = false;
+            btn.textContent = 'Generate Grid';
+          }
+        }, 500);
+      });
+    </script>
+  </body>
+</html>
+"""
+
+DEEPZOOM_PAGE = """
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <title>Zoomable Grid - Spotify Covers</title>
+    """ + COMMON_HEAD + """
+    <style>
+      #viewer { width: 100%; height: calc(100vh - 140px); background: var(--sp-black); border-radius: 12px; }
+    </style>
+  </head>
+  <body>
+    """ + NAVBAR_LOGGED_IN + """
+    <main>
+      <div class="container-fluid py-3">
+        <div id="viewer"></div>
+      </div>
+    </main>
+    """ + FOOTER + """
+    <script src="https://cdn.jsdelivr.net/npm/openseadragon@4.1/build/openseadragon/openseadragon.min.js"></script>
+    <script>
+      OpenSeadragon({
+        id: 'viewer',
+        prefixUrl: 'https://cdn.jsdelivr.net/npm/openseadragon@4.1/build/openseadragon/images/',
+        tileSources: {{ dzi_url|tojson }},
+        showNavigator: true,
+        maxZoomPixelRatio: 2,
+      });
+    </script>
+  </body>
+</html>
+"""
+
+RESULT_PAGE = """
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <title>Your Grid - Spotify Covers</title>
+    """ + COMMON_HEAD + """
+    <style>
+      .result-card {
+        background: none;
+        border: none; border-radius: 20px;
+        overflow: visible;
+      }
+      .result-img {
+        border-radius: 0;
+        box-shadow: 0 4px 24px rgba(0,0,0,0.5);
+        transition: transform 0.2s;
+        background: transparent;
+      }
+      .result-img:hover { transform: scale(1.01); }
+    </style>
+  </head>
+  <body>
+    """ + NAVBAR_LOGGED_IN + """
+    <main>
+      <div class="container py-4">
+        <div class="row justify-content-center">
+          <div class="col-lg-9">
+            <div class="result-card text-center p-4 p-md-5">
+              <h2 style="font-weight:800; color:var(--sp-white); font-size:1.8rem;" class="mb-2">Your Grid</h2>
+              <p style="color:var(--sp-muted); font-size:0.95rem;" class="mb-4">This is a preview; the button below downloads the full-resolution PNG.</p>
+              <img src="/preview" alt="album grid" class="result-img img-fluid" style="max-height:75vh;" />
+              <div class="mt-4 d-flex justify-content-center gap-3 flex-wrap">
+                <a href="/download" class="btn btn-sp px-4" style="border-radius:8px;" download="{{ filename }}">{{ "Download ZIP (100/200/300px)" if bundle else "Download PNG" }}</a>
+                {% if deepzoom_url %}
+                <a href="{{ deepzoom_url }}" class="btn btn-sp-outline px-4" style="border-radius:8px;">Zoomable View</a>
+                {% endif %}
+                <a href="/" class="btn btn-sp-outline px-4" style="border-radius:8px;">New Grid</a>
+              </div>
+            </div>
+          </div>
+        </div>
+      </div>
+    </main>
+    """ + FOOTER + """
+  </body>
+</html>
+"""
+
+PAGE_TEMPLATES = {
+    "landing.html": LANDING_PAGE,
+    "generate.html": GENERATE_PAGE,
+    "deepzoom.html": DEEPZOOM_PAGE,
+    "result.html": RESULT_PAGE,
+}
+# Pages that render identically for every request.
+STATIC_PAGES = ("landing.html", "generate.html")
+
+
+class PrerenderedPage:
+    """
+    One fully rendered page with its gzip (and, if available, brotli) encodings and
+    an ETag, so a request costs a header check and a copy of the stored bytes.
+    """
+
+    def __init__(self, html):
+        self.identity = html.encode("utf-8")
+        self.encodings = {"gzip": gzip.compress(self.identity, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(self.identity, quality=11)
+        self.etag = hashlib.sha1(self.identity).hexdigest()[:20]
+
+    def response(self, request, response_class):
+        """
+        :param request: the current request, for Accept-Encoding and If-None-Match
+        :param response_class: the app's response class
+        """
+        # The same URL serves other pages to other sessions, so caches must revalidate every time.
+        headers = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding, Cookie"}
+        if request.if_none_match.contains_weak(self.etag):
+            response = response_class(status=304, headers=headers)
+            response.set_etag(self.etag, weak=True)
+            return response
+        body = self.identity
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and request.accept_encodings[encoding]:
+                body = self.encodings[encoding]
+                headers["Content-Encoding"] = encoding
+                break
+        response = response_class(body, mimetype="text/html", headers=headers)
+        response.set_etag(self.etag, weak=True)
+        return response
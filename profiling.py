@@ -0,0 +1,78 @@
+# profiling.py
+"""
+Opt-in profiling of a single generation: a cProfile of the worker thread and
+a tracemalloc peak snapshot. Results are written to a per-task directory for
+an operator to download.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_FILES = ("cprofile.pstats", "cprofile.txt", "tracemalloc.txt")
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 40
+
+# cProfile (3.12+) and tracemalloc are both process-wide, so one capture runs at a time.
+_capture_lock = threading.Lock()
+
+
+@contextmanager
+def capture_profile(label=""):
+    """
+    Profile the enclosed block on the current thread. Yields a dict that holds
+    the output directory under "dir" once the block has finished, or None if
+    another capture was already running.
+    """
+    result = {"dir": None}
+    if not _capture_lock.acquire(blocking=False):
+        yield result
+        return
+    try:
+        profiler = cProfile.Profile()
+        # Leave an existing tracemalloc session (e.g. a benchmark's) alone.
+        traced = not tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.start(25)
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            snapshot = peak = None
+            if traced:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            result["dir"] = _write_profile(profiler, snapshot, peak, elapsed, label)
+    finally:
+        _capture_lock.release()
+
+
+def _write_profile(profiler, snapshot, peak, elapsed, label):
+    out_dir = tempfile.mkdtemp(prefix="profile-")
+    profiler.dump_stats(os.path.join(out_dir, "cprofile.pstats"))
+
+    text = io.StringIO()
+    text.write(f"{label}\nwall time: {elapsed:.3f}s\n\n")
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    with open(os.path.join(out_dir, "cprofile.txt"), "w") as f:
+        f.write(text.getvalue())
+
+    with open(os.path.join(out_dir, "tracemalloc.txt"), "w") as f:
+        if snapshot is None:
+            f.write("tracemalloc was already tracing for someone else; no allocation snapshot taken.\n")
+        else:
+            f.write(f"{label}\npeak traced memory: {peak / (1024 * 1024):.1f} MiB\n"
+                    "(Python allocations only; Pillow pixel buffers are not traced)\n\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+    return out_dir
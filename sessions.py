@@ -0,0 +1,181 @@
+# sessions.py
+"""
+Server-side Flask sessions. The cookie carries only an opaque random id; the
+session data (Spotify tokens, task ids, temp paths) stays on the server in a
+pluggable store, so polling requests send a few dozen bytes of cookie and
+nothing has to be signed or re-serialised unless the session changed.
+
+MemorySessionStore is a per-process LRU. SQLiteSessionStore keeps sessions in
+a local database file that several worker processes can share.
+"""
+
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.regenerate_sid = False
+
+    def regenerate(self):
+        """
+        Move the session to a new id when it is saved, deleting the old one from the
+        store. Call it when the session gains privileges (login), so an id planted in
+        the browser or seen beforehand no longer leads to the session's data.
+        """
+        self.regenerate_sid = True
+        self.modified = True
+
+
+class MemorySessionStore:
+    """LRU of session dicts, bounded by entry count, with per-entry expiry."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return json.loads(data)
+
+    def set(self, sid, data, ttl):
+        # Stored serialised, so callers can't share mutable state through the store.
+        with self._lock:
+            self._entries[sid] = (json.dumps(data), time.time() + ttl)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite file, one connection per thread; expired rows are purged periodically."""
+
+    PURGE_EVERY_WRITES = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions "
+                         "(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            # WAL lets worker processes read while another one writes.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, sid, data, ttl):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                         (sid, json.dumps(data), now + ttl))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY_WRITES == 0:
+                conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    def delete(self, sid):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Keeps session data in store and only an opaque id in the cookie. Sessions live for
+    the app's PERMANENT_SESSION_LIFETIME after they were last written.
+    """
+
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def _new_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return self.session_class(data, sid=sid)
+        return self.session_class(sid=self._new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.regenerate_sid:
+            if not session.new:
+                self.store.delete(session.sid)
+            session.sid = self._new_sid()
+            session.new = True
+            session.regenerate_sid = False
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+        if not session.modified:
+            return
+        ttl = app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, dict(session), ttl)
+        response.vary.add("Cookie")
+        # The id never changes, so the cookie only needs sending when it is new
+        # (or, for a permanent session, to push its expiry forward).
+        if not (session.new or session.permanent):
+            return
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
@@ -1,6 +1,8 @@
 import os
+import json
 import time
 import tempfile
+from io import BytesIO
 import pytest
 from PIL import Image
 from albumgrids import (
@@ -15,6 +17,14 @@ from albumgrids import (
 from app import extract_playlist_id, cleanup_old_temp_file, prune_stale_tasks, tasks, app
 
 
+@pytest.fixture(autouse=True)
+def _trace_log_in_tmp(monkeypatch, tmp_path):
+    # Generations run by the tests must never append to a trace log in the checkout.
+    import app as app_module
+    from tracelog import TraceLog
+    monkeypatch.setattr(app_module, "trace_log", TraceLog(str(tmp_path / "generation_trace.jsonl")))
+
+
 # --- calculate_grid_size ---
 
 class TestCalculateGridSize:
@@ -59,6 +69,12 @@ class TestExtractPlaylistId:
         url = "  https://open.spotify.com/playlist/1l4roHQ43lYI3J9zbxExFf?si=abc  "
         assert extract_playlist_id(url) == "1l4roHQ43lYI3J9zbxExFf"
 
+    def test_several_ids(self):
+        from app import extract_playlist_ids
+        text = "https://open.spotify.com/playlist/aaa?si=x, bbb\nhttps://open.spotify.com/playlist/aaa ccc"
+        assert extract_playlist_ids(text) == ["aaa", "bbb", "ccc"]
+        assert extract_playlist_ids(" , ") == []
+
 
 # --- remove_duplicates ---
 
@@ -180,6 +196,27 @@ class TestCreateNormalGrid:
         assert rounded.getpixel((100, 100)) == (255, 0, 0, 255)
         assert rounded.getpixel((0, 0)) == (0, 0, 0, 0)  # corner is transparent
 
+    def test_region_only_rounding_and_frame_match_full_masks(self):
+        import random
+        from PIL import ImageDraw
+        from albumgrids import round_image, add_frame
+        rng = random.Random(7)
+        img = Image.frombytes("RGB", (230, 170), rng.randbytes(230 * 170 * 3))
+        mask = Image.new("L", img.size, 0)
+        ImageDraw.Draw(mask).rounded_rectangle([0, 0, 229, 169], radius=31, fill=255)
+        expected = Image.new("RGBA", img.size, (0, 0, 0, 0))
+        expected.paste(img, mask=mask)
+        rounded = round_image(img, 31)
+        assert rounded.tobytes() == expected.tobytes()
+
+        framed = add_frame(rounded)
+        pad = 9
+        assert framed.size == (230 + 2 * pad, 170 + 2 * pad)
+        assert framed.getpixel((0, 0)) == (0, 0, 0, 0)
+        assert framed.getpixel((pad // 2, 100)) == (18, 18, 18, 255)
+        assert framed.getpixel((pad, pad)) == (18, 18, 18, 255)  # inner corner shows the frame
+        assert framed.getpixel((pad + 100, pad + 80)) == rounded.getpixel((100, 80))
+
 
 class TestCreateDiagonalGrid:
     def test_dimensions(self):
@@ -325,6 +362,19 @@ class TestPruneStaleTasks:
         assert fresh_id in tasks
         del tasks[fresh_id]
 
+    def test_keeps_long_running_task_that_is_polled(self):
+        now = time.time()
+        tasks["long-render"] = {"status": "running", "created_at": now - 9999, "last_polled": now,
+                                "current": 0, "total": 1, "message": "rendering"}
+        tasks["unwatched"] = {"status": "running", "created_at": now - 9999, "last_polled": now - 9999,
+                              "current": 0, "total": 1, "message": "rendering"}
+        tasks["just-finished"] = {"status": "done", "created_at": now - 9999, "finished_at": now,
+                                  "current": 1, "total": 1, "message": "Done!"}
+        prune_stale_tasks()
+        assert "long-render" in tasks and "just-finished" in tasks
+        assert "unwatched" not in tasks
+        del tasks["long-render"], tasks["just-finished"]
+
     def test_deletes_stale_temp_file(self):
         tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
         tmp.write(b"fake")
@@ -340,3 +390,1547 @@ class TestPruneStaleTasks:
         prune_stale_tasks()
         assert not os.path.exists(tmp.name)
         assert stale_id not in tasks
+
+
+# --- Cancellation ---
+
+def _fake_playlist_client(n):
+    from unittest.mock import MagicMock
+    sp = MagicMock()
+    sp.playlist_items.return_value = {
+        "items": [
+            {"track": {"album": {"id": f"a{i}", "images": [{"url": f"http://fake/{i}.jpg"}]}}}
+            for i in range(n)
+        ]
+    }
+    return sp
+
+
+class TestCancellation:
+    def test_cancel_before_start(self):
+        import threading
+        from albumgrids import generate_album_grid, GenerationCancelled
+        cancel = threading.Event()
+        cancel.set()
+        sp = _fake_playlist_client(4)
+        with pytest.raises(GenerationCancelled):
+            generate_album_grid(sp, mode="playlist", playlist_id="test", cancel_event=cancel)
+        sp.playlist_items.assert_not_called()
+
+    def test_cancel_between_downloads(self, monkeypatch):
+        import threading
+        import albumgrids
+        cancel = threading.Event()
+        downloaded = []
+
+        def fake_download(url, stats=None):
+            downloaded.append(url)
+            if len(downloaded) == 2:
+                cancel.set()
+            return Image.new("RGB", (10, 10), (255, 0, 0))
+
+        monkeypatch.setattr(albumgrids, "download_image", fake_download)
+        with pytest.raises(albumgrids.GenerationCancelled):
+            albumgrids.generate_album_grid(_fake_playlist_client(9), mode="playlist",
+                                           playlist_id="test", cancel_event=cancel)
+        assert len(downloaded) == 2
+
+
+class TestCancelTask:
+    def test_cancel_running_task_sets_event(self):
+        import threading
+        from app import cancel_task
+        tasks["running-task"] = {
+            "status": "running", "created_at": time.time(), "cancel": threading.Event(),
+            "current": 0, "total": 1, "message": "",
+        }
+        assert cancel_task("running-task")
+        assert tasks["running-task"]["cancel"].is_set()
+        del tasks["running-task"]
+
+    def test_cancel_finished_task_is_noop(self):
+        from app import cancel_task
+        tasks["finished-task"] = {"status": "done", "created_at": time.time(),
+                                  "current": 1, "total": 1, "message": "Done!"}
+        assert not cancel_task("finished-task")
+        del tasks["finished-task"]
+
+    def test_abandoned_task_cancelled(self):
+        import threading
+        from app import cancel_abandoned_tasks, ABANDONED_TASK_SECONDS
+        now = time.time()
+        tasks["abandoned"] = {
+            "status": "running", "created_at": now, "last_polled": now - ABANDONED_TASK_SECONDS - 1,
+            "cancel": threading.Event(), "current": 0, "total": 1, "message": "",
+        }
+        tasks["watched"] = {
+            "status": "running", "created_at": now, "last_polled": now,
+            "cancel": threading.Event(), "current": 0, "total": 1, "message": "",
+        }
+        cancel_abandoned_tasks()
+        assert tasks["abandoned"]["cancel"].is_set()
+        assert not tasks["watched"]["cancel"].is_set()
+        del tasks["abandoned"]
+        del tasks["watched"]
+
+    def test_progress_poll_refreshes_last_polled(self):
+        tasks["polled"] = {"status": "running", "created_at": 0, "last_polled": 0,
+                           "current": 0, "total": 1, "message": ""}
+        with app.test_client() as client:
+            client.get("/progress/polled")
+        assert tasks["polled"]["last_polled"] > 0
+        del tasks["polled"]
+
+
+# --- Single-flight coalescing ---
+
+class TestSingleFlight:
+    def _run_concurrently(self, flight, key, fn, n, **kwargs):
+        import threading
+        results = [None] * n
+        errors = [None] * n
+
+        def worker(i):
+            try:
+                results[i] = flight.do(key, fn, **kwargs)
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        return threads, results, errors
+
+    def test_concurrent_calls_share_one_execution(self):
+        import threading
+        from albumgrids import SingleFlight
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn(report):
+            calls.append(1)
+            release.wait(5)
+            return "cover-bytes"
+
+        threads, results, errors = self._run_concurrently(flight, "url", fn, 5)
+        time.sleep(0.2)
+        release.set()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert results == ["cover-bytes"] * 5
+        assert flight.in_flight() == 0
+
+    def test_errors_are_shared(self):
+        from albumgrids import SingleFlight
+        flight = SingleFlight()
+
+        def fn(report):
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            flight.do("k", fn)
+        assert flight.in_flight() == 0
+
+    def test_progress_fans_out_to_followers(self):
+        import threading
+        from albumgrids import SingleFlight
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        leader_msgs, follower_msgs = [], []
+
+        def fn(report):
+            report(1, 2, "half")
+            started.set()
+            release.wait(5)
+            report(2, 2, "done")
+            return 42
+
+        leader = threading.Thread(target=flight.do, args=("k", fn),
+                                  kwargs={"progress_callback": lambda c, t, m: leader_msgs.append(m)})
+        leader.start()
+        started.wait(5)
+        follower_result = []
+        follower = threading.Thread(target=lambda: follower_result.append(
+            flight.do("k", fn, progress_callback=lambda c, t, m: follower_msgs.append(m))))
+        follower.start()
+        time.sleep(0.2)
+        release.set()
+        leader.join()
+        follower.join()
+        assert leader_msgs == ["half", "done"]
+        assert follower_msgs == ["half", "done"]
+        assert follower_result == [42]
+
+    def test_coalesced_renders_deliver_layout_and_tiles(self, monkeypatch):
+        import threading
+        import albumgrids
+        release = threading.Event()
+
+        def slow_download(url, stats=None):
+            release.wait(5)
+            return Image.new("RGB", (10, 10), (int(url[-5]) * 40, 0, 0))
+
+        monkeypatch.setattr(albumgrids, "download_image", slow_download)
+        tracks = [{"album": {"id": f"c{i}", "images": [{"url": f"http://cdn/c{i}.jpg"}]}} for i in range(4)]
+        outputs = {name: {"layout": [], "tiles": [], "stats": albumgrids.new_stats()} for name in "ABC"}
+
+        def run(name, deepzoom):
+            out = outputs[name]
+            albumgrids.generate_album_grid(
+                None, mode="top", tracks=tracks, cell_size=10, remove_dups=False, stats=out["stats"],
+                layout_callback=out["layout"].append,
+                tiles_callback=(lambda *args: out["tiles"].append(args)) if deepzoom else None)
+
+        threads = [threading.Thread(target=run, args=(name, name != "A")) for name in "ABC"]
+        for t in threads:
+            t.start()
+        time.sleep(0.3)
+        release.set()
+        for t in threads:
+            t.join()
+        assert [len(outputs[n]["layout"]) for n in "ABC"] == [1, 1, 1]
+        assert outputs["A"]["tiles"] == []
+        assert len(outputs["B"]["tiles"]) == 1 and len(outputs["C"]["tiles"]) == 1
+        assert outputs["A"]["stats"]["coalesced"] is False
+        assert sorted(outputs[n]["stats"]["coalesced"] for n in "BC") == [False, True]
+
+    def test_page_errors_are_not_shared_across_clients(self):
+        import threading
+        from unittest.mock import MagicMock
+        from albumgrids import iter_playlist_pages
+        from spotipy.exceptions import SpotifyException
+        started, release = threading.Event(), threading.Event()
+
+        def expired(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            raise SpotifyException(401, -1, "The access token expired")
+
+        stale, fresh = MagicMock(), MagicMock()
+        stale.playlist_items.side_effect = expired
+        fresh.playlist_items.return_value = {"items": [{"track": "t"}]}
+        outcome = {}
+
+        def run(name, sp):
+            try:
+                outcome[name] = [page for page in iter_playlist_pages(sp, "shared")]
+            except SpotifyException as e:
+                outcome[name] = e.http_status
+
+        leader = threading.Thread(target=run, args=("stale", stale))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=run, args=("fresh", fresh))
+        follower.start()
+        time.sleep(0.2)
+        release.set()
+        leader.join()
+        follower.join()
+        assert outcome == {"stale": 401, "fresh": [[{"track": "t"}]]}
+
+    def test_follower_does_not_recount_leader_work(self, monkeypatch):
+        import threading
+        import albumgrids
+        release = threading.Event()
+
+        def slow_download(url, stats=None):
+            release.wait(5)
+            albumgrids._count(stats, "bytes_downloaded", 100)
+            albumgrids._count(stats, "cache_misses")
+            return Image.new("RGB", (10, 10))
+
+        monkeypatch.setattr(albumgrids, "download_image", slow_download)
+        tracks = [{"album": {"id": f"d{i}", "images": [{"url": f"http://cdn/d{i}.jpg"}]}} for i in range(4)]
+        runs = [albumgrids.new_stats() for _ in range(2)]
+        threads = [threading.Thread(target=albumgrids.generate_album_grid, args=(None,),
+                                    kwargs={"mode": "top", "tracks": tracks, "cell_size": 10, "stats": stats})
+                   for stats in runs]
+        for t in threads:
+            t.start()
+        time.sleep(0.3)
+        release.set()
+        for t in threads:
+            t.join()
+        leader, follower = sorted(runs, key=lambda stats: stats["coalesced"])
+        assert (leader["bytes_downloaded"], leader["cache_misses"]) == (400, 4) and leader["stages"]
+        assert follower["coalesced"] and (follower["covers"], follower["grid_size"]) == (4, 2)
+        assert (follower["bytes_downloaded"], follower["cache_misses"], follower["stages"]) == (0, 0, {})
+
+    def test_follower_takes_over_when_leader_cancelled(self):
+        import threading
+        from albumgrids import SingleFlight, GenerationCancelled
+        flight = SingleFlight()
+        leader_cancel = threading.Event()
+        started = threading.Event()
+        calls = []
+
+        def fn(report):
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                while not leader_cancel.is_set():
+                    time.sleep(0.01)
+                raise GenerationCancelled("Generation cancelled.")
+            return "rendered"
+
+        leader_errors = []
+
+        def lead():
+            try:
+                flight.do("k", fn, cancel_event=leader_cancel)
+            except GenerationCancelled as e:
+                leader_errors.append(e)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(5)
+        follower_result = []
+        follower = threading.Thread(target=lambda: follower_result.append(flight.do("k", fn)))
+        follower.start()
+        time.sleep(0.2)
+        leader_cancel.set()
+        leader.join()
+        follower.join()
+        assert len(leader_errors) == 1
+        assert follower_result == ["rendered"]
+        assert len(calls) == 2
+
+
+# --- Spotify rate-limit governor ---
+
+def _rate_limited_error(retry_after=None):
+    from spotipy.exceptions import SpotifyException
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+    return SpotifyException(429, -1, "rate limited", headers=headers)
+
+
+class TestRateGovernor:
+    def test_call_passes_through(self):
+        from albumgrids import RateGovernor
+        gov = RateGovernor(rate=100, burst=5, reserve=1)
+        assert gov.call(lambda x, y=0: x + y, 2, y=3) == 5
+        assert gov.state()["calls"] == 1
+
+    def test_retries_after_429_honouring_retry_after(self):
+        from albumgrids import RateGovernor
+        gov = RateGovernor(rate=1000, burst=5, reserve=1)
+        attempts = []
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise _rate_limited_error(retry_after=0.2)
+            return "ok"
+
+        assert gov.call(flaky) == "ok"
+        assert attempts[1] - attempts[0] >= 0.19
+        assert gov.state()["rate_limited_responses"] == 1
+
+    def test_gives_up_with_friendly_error(self):
+        from albumgrids import RateGovernor, SpotifyRateLimited
+        gov = RateGovernor(rate=1000, burst=5, reserve=1, max_retries=1)
+
+        def always_limited():
+            raise _rate_limited_error(retry_after=0)
+
+        with pytest.raises(SpotifyRateLimited) as exc:
+            gov.call(always_limited)
+        assert "rate limiting" in str(exc.value)
+
+    def test_other_errors_are_not_retried(self):
+        from spotipy.exceptions import SpotifyException
+        from albumgrids import RateGovernor
+        gov = RateGovernor(rate=1000, burst=5, reserve=1)
+        calls = []
+
+        def not_found():
+            calls.append(1)
+            raise SpotifyException(404, -1, "not found")
+
+        with pytest.raises(SpotifyException):
+            gov.call(not_found)
+        assert len(calls) == 1
+
+    def test_high_priority_can_use_reserve(self):
+        from albumgrids import RateGovernor, PRIORITY_HIGH, PRIORITY_BULK
+        gov = RateGovernor(rate=0.001, burst=3, reserve=2)
+        gov.acquire(PRIORITY_BULK)
+        start = time.monotonic()
+        gov.acquire(PRIORITY_HIGH)
+        gov.acquire(PRIORITY_HIGH)
+        assert time.monotonic() - start < 0.1
+
+    def test_bulk_waits_when_only_reserve_left(self):
+        import threading
+        from albumgrids import RateGovernor, PRIORITY_BULK, GenerationCancelled
+        gov = RateGovernor(rate=0.001, burst=3, reserve=2)
+        gov.acquire(PRIORITY_BULK)
+        cancel = threading.Event()
+        threading.Timer(0.2, cancel.set).start()
+        with pytest.raises(GenerationCancelled):
+            gov.acquire(PRIORITY_BULK, cancel_event=cancel)
+        assert gov.state()["waiting"] == {"high": 0, "bulk": 0, "low": 0}
+
+    def test_throttle_route(self):
+        with app.test_client() as client:
+            data = client.get("/throttle").get_json()
+        assert {"tokens", "blocked_for_seconds", "waiting"} <= set(data)
+
+
+# --- OAuth manager and client reuse ---
+
+class TestTokenAndClientReuse:
+    def test_fresh_token_validated_once(self, monkeypatch):
+        import app as app_module
+        calls = []
+        token = {"access_token": "tok-fresh", "refresh_token": "r", "expires_at": int(time.time()) + 3600}
+
+        def fake_validate(token_info):
+            calls.append(token_info)
+            return token_info
+
+        monkeypatch.setattr(app_module.sp_oauth, "validate_token", fake_validate)
+        assert app_module.ensure_fresh_token(token) is token
+        assert app_module.ensure_fresh_token(token) is token
+        assert len(calls) == 1
+
+    def test_expiring_token_is_refreshed(self, monkeypatch):
+        import app as app_module
+        token = {"access_token": "tok-old", "refresh_token": "r", "expires_at": int(time.time()) + 10}
+        new_token = {"access_token": "tok-new", "refresh_token": "r", "expires_at": int(time.time()) + 3600}
+        monkeypatch.setattr(app_module.sp_oauth, "validate_token", lambda t: None)
+        monkeypatch.setattr(app_module.sp_oauth, "refresh_access_token", lambda r: new_token)
+        assert app_module.ensure_fresh_token(token) is new_token
+
+    def test_clients_reused_per_token(self):
+        from albumgrids import get_spotify_client
+        a = get_spotify_client("token-a")
+        assert get_spotify_client("token-a") is a
+        b = get_spotify_client("token-b")
+        assert b is not a
+        assert a._session is b._session
+
+
+# --- Cover cache and post-login prefetch ---
+
+def _png_bytes(color=(255, 0, 0), size=(10, 10)):
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class TestCoverCache:
+    def test_evicts_least_recently_used_over_budget(self):
+        from albumgrids import CoverCache
+        cache = CoverCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        cache.get("a")
+        cache.put("c", b"1234")
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["bytes"] == 8
+
+    def test_features_survive_with_entry(self):
+        from albumgrids import CoverCache
+        cache = CoverCache(max_bytes=100)
+        cache.put("a", b"x")
+        cache.set_features("a", color=(0.5, 1, 1))
+        assert cache.features("a")["color"] == (0.5, 1, 1)
+        assert cache.features("missing") == {}
+
+    def test_download_image_served_from_cache(self, monkeypatch):
+        import albumgrids
+        fetched = []
+
+        def fake_fetch(url):
+            fetched.append(url)
+            return _png_bytes()
+
+        monkeypatch.setattr(albumgrids, "fetch_image_bytes", fake_fetch)
+        monkeypatch.setattr(albumgrids, "cover_cache", albumgrids.CoverCache(1024 * 1024))
+        albumgrids.download_image("http://cdn/x.jpg")
+        img = albumgrids.download_image("http://cdn/x.jpg")
+        assert img.size == (10, 10)
+        assert fetched == ["http://cdn/x.jpg"]
+
+
+class TestPrefetch:
+    def test_low_priority_yields_to_bulk(self):
+        import threading
+        from albumgrids import RateGovernor, PRIORITY_BULK, PRIORITY_LOW, GenerationCancelled
+        gov = RateGovernor(rate=0.001, burst=3, reserve=0)
+        gov._waiting[PRIORITY_BULK] = 1
+        cancel = threading.Event()
+        threading.Timer(0.2, cancel.set).start()
+        with pytest.raises(GenerationCancelled):
+            gov.acquire(PRIORITY_LOW, cancel_event=cancel)
+
+    def test_prefetch_warms_tracks_and_covers(self, monkeypatch):
+        from unittest.mock import MagicMock
+        import albumgrids
+        import app as app_module
+        sp = MagicMock()
+        sp.current_user_top_tracks.return_value = {
+            "items": [{"album": {"id": f"a{i}", "images": [{"url": f"http://cdn/{i}.jpg"}]}} for i in range(3)]
+        }
+        monkeypatch.setattr(app_module, "get_spotify_client", lambda token: sp)
+        monkeypatch.setattr(albumgrids, "fetch_image_bytes", lambda url: _png_bytes())
+        monkeypatch.setattr(albumgrids, "cover_cache", albumgrids.CoverCache(1024 * 1024))
+
+        app_module.prefetch_top_tracks("tok-prefetch")
+
+        tracks = app_module.take_prefetched_tracks("tok-prefetch", "medium_term")
+        assert len(tracks) == 3
+        assert "color" in albumgrids.cover_cache.features("http://cdn/0.jpg")
+        assert "hash" in albumgrids.cover_cache.features("http://cdn/2.jpg")
+        app_module.prefetched_top_tracks.clear()
+
+    def test_generate_uses_given_tracks(self, monkeypatch):
+        from unittest.mock import MagicMock
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (10, 10)))
+        sp = MagicMock()
+        tracks = [{"album": {"id": f"t{i}", "images": [{"url": f"http://cdn/t{i}.jpg"}]}} for i in range(4)]
+        grid = albumgrids.generate_album_grid(sp, mode="top", tracks=tracks, cell_size=10)
+        assert grid.size == (20, 20)
+        sp.current_user_top_tracks.assert_not_called()
+
+    def test_schedule_prefetch_disabled_by_default(self):
+        import app as app_module
+        assert app_module.schedule_prefetch("tok") is False
+
+
+# --- Offline fakes used by the benchmarks ---
+
+class TestBenchmarkFakes:
+    def test_generate_against_fake_services(self):
+        from albumgrids import generate_album_grid, new_stats
+        from benchmarks.fakes import FakeImageCDN, FakeSpotifyAPI, fake_spotify_client, playlist_id_for
+        with FakeImageCDN(image_size=64) as cdn, FakeSpotifyAPI(cdn) as api:
+            sp = fake_spotify_client(api, token="fake-services-test")
+            stats = new_stats()
+            grid = generate_album_grid(sp, mode="playlist", playlist_id=playlist_id_for(9),
+                                       cell_size=20, stats=stats)
+        assert grid.size == (60, 60)
+        assert cdn.requests == 9
+        assert {"fetch", "download", "composite"} <= set(stats["stages"])
+        assert stats["bytes_downloaded"] == cdn.bytes_served
+
+    def test_fake_cdn_error_rate(self):
+        import requests
+        from benchmarks.fakes import FakeImageCDN
+        with FakeImageCDN(error_rate=1.0) as cdn:
+            assert requests.get(cdn.image_url(1, 64)).status_code == 500
+
+    def test_failed_download_is_not_cached(self, monkeypatch, tmp_path):
+        import requests
+        import albumgrids
+        from benchmarks.fakes import FakeImageCDN
+        monkeypatch.setattr(albumgrids, "cover_cache", albumgrids.CoverCache(1024 * 1024, disk_dir=str(tmp_path)))
+        with FakeImageCDN(error_rate=1.0) as cdn:
+            url = cdn.image_url(1, 64)
+            with pytest.raises(requests.HTTPError):
+                albumgrids.download_image(url)
+            assert albumgrids.cover_cache.get(url) is None and os.listdir(tmp_path) == []
+            cdn.error_rate = 0.0
+            assert albumgrids.download_image(url).size == (64, 64)
+            assert albumgrids.download_image(url).size == (64, 64)
+        assert cdn.requests == 2
+
+    def test_cached_error_page_is_refetched(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "cover_cache", albumgrids.CoverCache(1024 * 1024))
+        albumgrids.cover_cache.put("http://cdn/bad.jpg", b"upstream error")
+        monkeypatch.setattr(albumgrids, "fetch_image_bytes", lambda url: _png_bytes())
+        assert albumgrids.download_image("http://cdn/bad.jpg").size == (10, 10)
+
+    def test_duplicate_albums_in_fake_playlist(self):
+        from benchmarks.fakes import FakeImageCDN, FakeSpotifyAPI
+        with FakeImageCDN() as cdn, FakeSpotifyAPI(cdn) as api:
+            indices = api.album_indices(200, 25, "dups")
+        assert len(indices) == 200
+        assert len(set(indices)) < 200
+
+    def test_load_test_smoke(self, monkeypatch, tmp_path):
+        import app as app_module
+        from tracelog import TraceLog
+        from benchmarks.loadtest import parse_args, run_load_test
+        monkeypatch.setattr(app_module, "trace_log", TraceLog(str(tmp_path / "trace.jsonl")))
+        report = run_load_test(parse_args([
+            "--users", "2", "--duration", "1", "--ramp-up", "0", "--grid-size", "2",
+            "--cdn-latency-ms", "0", "--cdn-jitter-ms", "0", "--api-latency-ms", "0",
+            "--poll-interval", "0.05", "--image-size", "64",
+        ]))
+        assert report["completed_cycles"] > 0
+        assert report["failed_cycles"] == 0
+        assert {"/generate", "/progress", "/result", "/preview"} <= set(report["routes"])
+        assert report["routes"]["/generate"]["p50_ms"] > 0
+
+
+# --- Stage timing and /metrics ---
+
+class TestMetrics:
+    def test_counter_and_histogram_render(self):
+        from metrics import Registry
+        registry = Registry()
+        counter = registry.counter("things_total", "Things.", labels=("kind",))
+        hist = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        hist.observe(0.05)
+        hist.observe(0.5)
+        text = registry.render()
+        assert 'things_total{kind="a"} 3' in text
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+        assert "latency_seconds_count 2" in text
+        assert "# TYPE latency_seconds histogram" in text
+
+    def test_counter_rejects_wrong_labels(self):
+        from metrics import Counter
+        with pytest.raises(ValueError):
+            Counter("x_total", "X.", labels=("a",)).inc(b="1")
+
+    def test_generation_stats(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (10, 10)))
+        tracks = [{"album": {"id": f"s{i % 5}", "images": [{"url": f"http://cdn/s{i % 5}.jpg"}]}} for i in range(8)]
+        stats = albumgrids.new_stats()
+        albumgrids.generate_album_grid(None, mode="top", tracks=tracks, remove_dups=True,
+                                       cell_size=10, stats=stats)
+        assert stats["tracks"] == 8
+        # 3 repeated album ids, then identical blank images collapse to one hash.
+        assert stats["duplicates_dropped"] == 3 + 3
+        assert stats["grid_size"] == 1
+        assert {"download", "sort", "composite", "hash"} <= set(stats["stages"])
+
+    def test_metrics_endpoint(self):
+        with app.test_client() as client:
+            response = client.get("/metrics")
+        body = response.get_data(as_text=True)
+        assert response.content_type.startswith("text/plain")
+        assert "spotifycovers_queue_depth" in body
+        assert "spotifycovers_active_tasks" in body
+
+
+# --- Opt-in profiling ---
+
+class TestProfiling:
+    def test_capture_writes_profile_files(self):
+        import shutil
+        from profiling import capture_profile, PROFILE_FILES
+        with capture_profile(label="unit") as captured:
+            sum(i * i for i in range(10000))
+        try:
+            assert sorted(os.listdir(captured["dir"])) == sorted(PROFILE_FILES)
+            with open(os.path.join(captured["dir"], "tracemalloc.txt")) as f:
+                assert "peak traced memory" in f.read()
+        finally:
+            shutil.rmtree(captured["dir"])
+
+    def test_overlapping_capture_is_skipped(self):
+        import shutil
+        from profiling import capture_profile
+        with capture_profile() as outer:
+            with capture_profile() as inner:
+                pass
+            assert inner["dir"] is None
+        shutil.rmtree(outer["dir"])
+
+    def test_profile_flag_requires_admin_token(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+        with app.test_request_context("/generate", method="POST", data={"profile": "yes"}):
+            assert not app_module.should_profile()
+        with app.test_request_context("/generate", method="POST", data={"profile": "yes"},
+                                      headers={"X-Admin-Token": "secret"}):
+            assert app_module.should_profile()
+
+    def test_profile_download_is_admin_only(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+        with app.test_client() as client:
+            assert client.get("/admin/profile/x/cprofile.txt").status_code == 403
+            assert client.get("/admin/profile/x/cprofile.txt",
+                              headers={"X-Admin-Token": "secret"}).status_code == 404
+
+
+# --- JSONL trace log ---
+
+class TestTraceLog:
+    def test_writes_one_line_per_record(self, tmp_path):
+        from tracelog import TraceLog
+        path = tmp_path / "trace.jsonl"
+        log = TraceLog(str(path))
+        log.write({"task_id": "a", "stages": {"download": 1.5}})
+        log.write({"task_id": "b"})
+        log.close()
+        lines = path.read_text().splitlines()
+        assert [json.loads(line)["task_id"] for line in lines] == ["a", "b"]
+
+    def test_rotates_by_size(self, tmp_path):
+        from tracelog import TraceLog
+        path = tmp_path / "trace.jsonl"
+        log = TraceLog(str(path), max_bytes=200, backup_count=2)
+        for i in range(20):
+            log.write({"task_id": f"task-{i}", "padding": "x" * 40})
+        log.close()
+        assert (tmp_path / "trace.jsonl.1").exists()
+        assert not (tmp_path / "trace.jsonl.3").exists()
+
+    def test_full_queue_drops_instead_of_blocking(self, tmp_path, monkeypatch):
+        from tracelog import TraceLog
+        log = TraceLog(str(tmp_path / "trace.jsonl"), queue_size=1)
+        # No writer thread, so nothing drains the queue.
+        monkeypatch.setattr(log, "_ensure_started", lambda: None)
+        assert log.write({"n": 1})
+        assert not log.write({"n": 2})
+        assert log.dropped == 1
+
+    def test_disabled_with_empty_path(self):
+        from tracelog import TraceLog
+        assert TraceLog("").write({"n": 1}) is False
+
+    def test_trace_record_fields(self):
+        from albumgrids import new_stats
+        from app import build_trace_record
+        stats = new_stats()
+        stats.update(tracks=12, covers=9, grid_size=3, cache_hits=3, cache_misses=9, encoded_bytes=1234,
+                     display_bytes=456)
+        stats["stages"]["download"] = 0.5
+        task = {"status": "done", "message": "Done!", "created_at": 100.0, "started_at": 101.0}
+        record = build_trace_record("t1", task, stats, {"mode": "playlist", "pattern": "normal"})
+        assert record["album_count"] == 12
+        assert record["cache_hit_ratio"] == 0.25
+        assert record["artifact_bytes"] == 1234
+        assert record["display_bytes"] == 456
+        assert record["options"] == {"pattern": "normal"}
+        assert "error" not in record
+
+    def test_artifact_size_recorded_when_png_is_encoded(self):
+        import app as app_module
+        before = app_module.ENCODED_BYTES.count()
+        master_id = app_module.stash_master(Image.new("RGB", (8, 8)))
+        assert app_module.ENCODED_BYTES.count() == before
+        app_module.master_path(master_id)
+        assert app_module.ENCODED_BYTES.count() == before + 1
+        app_module.discard_master(master_id)
+
+
+# --- Progressive preview ---
+
+class TestProgressivePreview:
+    def test_publishes_rate_limited_jpegs(self):
+        from albumgrids import ProgressivePreview
+        published = []
+        preview = ProgressivePreview(4, published.append, max_pixels=64, interval=60)
+        for i in range(16):
+            preview.add(i, Image.new("RGB", (640, 640), (i * 10, 0, 0)))
+        # The first cover publishes; the rest fall inside the interval.
+        assert len(published) == 1
+        snapshot = Image.open(BytesIO(published[0]))
+        assert snapshot.format == "JPEG"
+        assert snapshot.size == (64, 64)
+
+    def test_composite_is_downscaled_and_forced(self):
+        from albumgrids import ProgressivePreview
+        published = []
+        preview = ProgressivePreview(3, published.append, max_pixels=60, interval=60)
+        preview.add(0, Image.new("RGB", (64, 64), "red"))
+        preview.show_composite(Image.new("RGB", (300, 300), "blue"))
+        assert len(published) == 2
+        snapshot = Image.open(BytesIO(published[-1]))
+        assert snapshot.size == (60, 60)
+        assert snapshot.getpixel((30, 30))[2] > 200
+
+    def test_generation_publishes_previews(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (64, 64)))
+        published = []
+        stats = albumgrids.new_stats()
+        albumgrids.generate_album_grid(_fake_playlist_client(4), playlist_id="p", cell_size=10,
+                                       stats=stats, preview_callback=published.append)
+        assert len(published) >= 2
+        assert "preview" in stats["stages"]
+
+    def test_preview_route(self):
+        from app import tasks
+        tasks["preview-task"] = {"status": "running", "current": 1, "total": 4, "message": "",
+                                 "preview": b"jpeg", "preview_version": 3}
+        try:
+            with app.test_client() as client:
+                assert client.get("/progress/preview-task").get_json()["preview_version"] == 3
+                response = client.get("/progress/preview-task/preview")
+                assert response.data == b"jpeg"
+                assert response.content_type == "image/jpeg"
+                assert client.get("/progress/missing/preview").status_code == 404
+        finally:
+            tasks.pop("preview-task", None)
+
+
+# --- Client-side layout preview ---
+
+class TestLayout:
+    def test_positions_cover_each_pattern(self):
+        from albumgrids import grid_positions
+        assert list(grid_positions("normal", 2)) == [(0, 0), (1, 0), (0, 1), (1, 1)]
+        assert list(grid_positions("diagonal", 2)) == [(0, 0), (1, 0), (0, 1), (1, 1)]
+        assert list(grid_positions("checkered", 3)) == [(0, 0), (2, 0), (1, 1), (0, 2), (2, 2)]
+        spiral = list(grid_positions("spiral", 3))
+        assert spiral[:4] == [(0, 0), (1, 0), (2, 0), (2, 1)]
+        assert spiral[-1] == (1, 1)
+        assert len(set(spiral)) == 9
+
+    def test_layout_uses_thumbnail_urls(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (10, 10)))
+        tracks = [{"album": {"id": f"a{i}", "images": [
+            {"url": f"http://cdn/{i}-640.jpg", "width": 640},
+            {"url": f"http://cdn/{i}-64.jpg", "width": 64},
+        ]}} for i in range(4)]
+        layouts = []
+        albumgrids.generate_album_grid(None, mode="top", tracks=tracks, pattern="spiral",
+                                       cell_size=10, layout_callback=layouts.append)
+        layout, = layouts
+        assert layout["grid_size"] == 2
+        assert layout["pattern"] == "spiral"
+        assert [slot[:2] for slot in layout["slots"]] == [[0, 0], [1, 0], [1, 1], [0, 1]]
+        assert sorted(slot[2] for slot in layout["slots"]) == [f"http://cdn/{i}-64.jpg" for i in range(4)]
+
+    def test_layout_route(self):
+        from app import tasks
+        layout = {"grid_size": 1, "cell_size": 100, "pattern": "normal", "slots": [[0, 0, "http://cdn/a.jpg"]]}
+        tasks["layout-task"] = {"status": "running", "current": 1, "total": 1, "message": "", "layout": layout}
+        try:
+            with app.test_client() as client:
+                assert client.get("/progress/layout-task").get_json()["layout_ready"] is True
+                assert client.get("/progress/layout-task/layout").get_json() == layout
+                assert client.get("/progress/missing/layout").status_code == 404
+        finally:
+            tasks.pop("layout-task", None)
+
+
+# --- Display rendition and lazily encoded master ---
+
+class TestDisplayRendition:
+    def test_rendition_is_downscaled(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "DISPLAY_MAX_EDGE", 100)
+        path = app_module.encode_display_rendition(Image.new("RGBA", (400, 200), (255, 0, 0, 255)))
+        try:
+            with Image.open(path) as rendition:
+                assert rendition.size == (100, 50)
+                assert rendition.format in ("WEBP", "JPEG")
+        finally:
+            os.unlink(path)
+
+    def test_master_is_encoded_on_first_download(self):
+        import app as app_module
+        master_id = app_module.stash_master(Image.new("RGB", (30, 30), "blue"))
+        assert app_module.pending_masters[master_id]["path"] is None
+        path = app_module.master_path(master_id)
+        assert path.endswith(".png") and os.path.exists(path)
+        assert app_module.master_path(master_id) == path
+        assert app_module.pending_masters[master_id]["image"] is None
+        app_module.discard_master(master_id)
+        assert not os.path.exists(path)
+        assert app_module.master_path(master_id) is None
+
+    def test_oldest_masters_spill_over_budget(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "PENDING_MASTER_BYTES", 30 * 30 * 3)
+        first = app_module.stash_master(Image.new("RGB", (30, 30)))
+        second = app_module.stash_master(Image.new("RGB", (30, 30)))
+        try:
+            assert app_module.pending_masters[first]["path"] is not None
+            assert app_module.pending_masters[second]["path"] is None
+        finally:
+            app_module.discard_master(first)
+            app_module.discard_master(second)
+
+    def test_oversized_master_goes_straight_to_disk(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "PENDING_MASTER_BYTES", 1000)
+        master_id = app_module.stash_master(Image.new("RGB", (100, 100)))
+        try:
+            assert app_module.pending_masters[master_id]["image"] is None
+            assert os.path.exists(app_module.pending_masters[master_id]["path"])
+        finally:
+            app_module.discard_master(master_id)
+
+    def test_coalesced_tasks_share_one_master(self):
+        import app as app_module
+        image = Image.new("RGB", (30, 30))
+        first, second = app_module.stash_master(image), app_module.stash_master(image)
+        assert first == second and app_module.pending_masters[first]["refs"] == 2
+        path = app_module.master_path(first)
+        app_module.discard_master(first)
+        assert app_module.master_path(second) == path and os.path.exists(path)
+        app_module.discard_master(second)
+        assert second not in app_module.pending_masters and not os.path.exists(path)
+
+    def test_preview_and_download_routes(self):
+        import app as app_module
+        from flask import session as flask_session
+        display_path = app_module.encode_display_rendition(Image.new("RGB", (20, 20), "red"))
+        master_id = app_module.stash_master(Image.new("RGB", (20, 20), "red"))
+        with app.test_request_context():
+            flask_session["generated_image_path"] = display_path
+            flask_session["generated_image_name"] = "grid.png"
+            flask_session["generated_master_id"] = master_id
+            preview = app_module.preview()
+            assert preview.mimetype in ("image/webp", "image/jpeg")
+            preview.close()
+            download = app_module.download()
+            download.direct_passthrough = False
+            assert download.mimetype == "image/png"
+            assert Image.open(BytesIO(download.get_data())).size == (20, 20)
+            download.close()
+            app_module.cleanup_old_temp_file()
+        assert master_id not in app_module.pending_masters
+        assert not os.path.exists(display_path)
+
+
+# --- Multi-resolution bundle ---
+
+class TestBundle:
+    def test_one_pass_builds_every_size(self, monkeypatch):
+        import albumgrids
+        downloads = []
+
+        def fake_download(url, stats=None):
+            downloads.append(url)
+            return Image.new("RGB", (640, 640), (len(downloads) * 20, 0, 0))
+
+        monkeypatch.setattr(albumgrids, "download_image", fake_download)
+        stats = albumgrids.new_stats()
+        images = albumgrids.generate_album_grid_bundle(
+            _fake_playlist_client(4), cell_sizes=(30, 10, 20), playlist_id="p", framed=True, stats=stats)
+        assert sorted(images) == [10, 20, 30]
+        assert len(downloads) == 4
+        assert images[10].width < images[20].width < images[30].width
+        assert stats["covers"] == 4 and stats["grid_size"] == 2
+        assert {"thumbnail", "composite", "frame"} <= set(stats["stages"])
+
+    def test_single_size_matches_generate_album_grid(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image",
+                            lambda url, stats=None: Image.new("RGB", (64, 64), (int(url[-5]) * 50, 0, 0)))
+        single = albumgrids.generate_album_grid(_fake_playlist_client(4), playlist_id="p", cell_size=10)
+        bundle = albumgrids.generate_album_grid_bundle(_fake_playlist_client(4), cell_sizes=(10,), playlist_id="p")
+        assert bundle[10].tobytes() == single.tobytes()
+
+    def test_encode_bundle_zips_each_size(self):
+        import zipfile
+        from app import encode_bundle
+        path = encode_bundle({100: Image.new("RGB", (200, 200)), 200: Image.new("RGB", (400, 400))}, "grid_2x2_normal")
+        try:
+            with zipfile.ZipFile(path) as archive:
+                assert archive.namelist() == ["grid_2x2_normal_100px.png", "grid_2x2_normal_200px.png"]
+                assert Image.open(BytesIO(archive.read("grid_2x2_normal_200px.png"))).size == (400, 400)
+        finally:
+            os.unlink(path)
+
+
+# --- Large-library mode ---
+
+def _album_tracks(n, wrapped=False):
+    items = []
+    for i in range(n):
+        album = {"id": f"L{i}", "images": [{"url": f"http://cdn/L{i}-640.jpg", "width": 640},
+                                            {"url": f"http://cdn/L{i}-64.jpg", "width": 64}]}
+        items.append({"track": {"album": album}} if wrapped else {"album": album})
+    return items
+
+
+class TestLargeLibrary:
+    def test_store_dedups_and_stops_at_limit(self):
+        from albumgrids import AlbumStore
+        store = AlbumStore()
+        page = _album_tracks(3) + _album_tracks(2)
+        assert store.add_tracks(page, remove_dups=True, limit=10)
+        assert store.urls == [f"http://cdn/L{i}-640.jpg" for i in range(3)]
+        assert store.thumb_urls[0] == "http://cdn/L0-64.jpg"
+        assert (store.tracks, store.duplicates) == (5, 2)
+        assert not store.add_tracks(_album_tracks(20)[3:], limit=10)
+        assert len(store.urls) == 10
+
+    def test_grid_override_beyond_normal_cap(self, monkeypatch):
+        import albumgrids
+
+        def fake_download(url, stats=None):
+            index = int(url.split("/L")[1].split("-")[0])
+            if index % 50 == 7:
+                raise IOError("cdn error")
+            return Image.new("RGB", (32, 32), (index % 256, (index * 7) % 256, 90))
+
+        monkeypatch.setattr(albumgrids, "download_image", fake_download)
+        stats = albumgrids.new_stats()
+        layouts = []
+        image = albumgrids.generate_album_grid(
+            None, mode="top", tracks=_album_tracks(400), cell_size=4, grid_size_override=18,
+            stats=stats, layout_callback=layouts.append)
+        assert image.size == (72, 72)
+        assert stats["covers"] == 324 and stats["grid_size"] == 18
+        assert stats["download_failures"] > 0
+        assert "thumbnail" in stats["stages"]
+        assert len(layouts[0]["slots"]) == 324
+        assert layouts[0]["slots"][0][2].endswith("-64.jpg")
+
+    def test_saved_tracks_are_streamed(self, monkeypatch):
+        import albumgrids
+        from unittest.mock import MagicMock
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (8, 8)))
+        library = _album_tracks(200, wrapped=True)
+        sp = MagicMock()
+        sp.current_user_saved_tracks.side_effect = lambda limit, offset: {"items": library[offset:offset + limit]}
+        image = albumgrids.generate_album_grid(sp, mode="saved", cell_size=4, grid_size_override=2,
+                                               large_library=True)
+        assert image.size == (8, 8)
+        # Four covers plus slack fit in the first page, so later pages are never requested.
+        assert sp.current_user_saved_tracks.call_count == 1
+
+    def test_output_edge_is_limited(self, monkeypatch):
+        import albumgrids
+        import app as app_module
+        monkeypatch.setattr(albumgrids, "LARGE_MAX_OUTPUT_EDGE", 40)
+        monkeypatch.setattr(app_module, "LARGE_MAX_OUTPUT_EDGE", 40)
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (8, 8)))
+        with pytest.raises(ValueError, match="too large"):
+            albumgrids.generate_album_grid(None, mode="top", tracks=_album_tracks(100), cell_size=10,
+                                           grid_size_override=5, large_library=True)
+        # Left to size itself, the grid shrinks to fit instead of growing to 10x10.
+        stats = albumgrids.new_stats()
+        image = albumgrids.generate_album_grid(None, mode="top", tracks=_album_tracks(100), cell_size=10,
+                                               large_library=True, stats=stats)
+        assert image.size == (40, 40) and stats["grid_size"] == 4
+        job, error = app_module.parse_job({"mode": "top", "grid_size": "5", "cell_size": "100"})
+        assert job is None and "too large" in error
+        assert app_module.parse_job({"mode": "top", "cell_size": "100"})[1] is None
+
+
+# --- Per-task image memory ---
+
+class TestImageMemory:
+    def test_peak_stays_within_budget(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image",
+                            lambda url, stats=None: Image.new("RGB", (640, 640), (int(url.split("/")[-1][:-4]) * 2, 0, 0)))
+        stats = albumgrids.new_stats()
+        albumgrids.generate_album_grid(_fake_playlist_client(99), playlist_id="p", cell_size=50, stats=stats)
+        full_res = 99 * 640 * 640 * 3
+        # 99 50px thumbnails, one live 640px decode and the 450px grid itself.
+        budget = 99 * 50 * 50 * 3 + 640 * 640 * 3 + 450 * 450 * 3
+        assert 0 < stats["peak_image_bytes"] <= budget
+        assert stats["peak_image_bytes"] < full_res / 20
+
+    def test_large_mode_reports_peak(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.new("RGB", (640, 640)))
+        stats = albumgrids.new_stats()
+        albumgrids.generate_album_grid(None, mode="top", tracks=_album_tracks(16), cell_size=10,
+                                       large_library=True, stats=stats)
+        workers = albumgrids.LARGE_DOWNLOAD_WORKERS
+        assert 640 * 640 * 3 <= stats["peak_image_bytes"] <= workers * 640 * 640 * 3 + 16 * 10 * 10 * 3 + 40 * 40 * 3 + 16 * 1024
+
+
+# --- Deep zoom tiles ---
+
+class TestDeepZoom:
+    def _zoom(self, grid_size=4, cell_size=100, pattern="normal", calls=None, **kwargs):
+        from deepzoom import DeepZoom
+        colors = [((i * 40) % 256, (i * 15) % 256, 200) for i in range(grid_size * grid_size)]
+
+        def get_cell(index, size):
+            if calls is not None:
+                calls.append(index)
+            return Image.new("RGB", (cell_size, cell_size), colors[index])
+        return DeepZoom(grid_size, cell_size, pattern, get_cell, **kwargs), colors
+
+    def test_descriptor_and_levels(self):
+        zoom, _ = self._zoom()
+        assert 'TileSize="254"' in zoom.dzi() and 'Overlap="1"' in zoom.dzi()
+        assert 'Width="400" Height="400"' in zoom.dzi()
+        assert zoom.max_level == 9
+        assert zoom.level_size(9) == (400, 400)
+        assert zoom.level_size(0) == (1, 1)
+        assert zoom.tile_count(9) == (2, 2)
+
+    def test_tiles_carry_overlap_and_match_the_grid(self):
+        zoom, colors = self._zoom()
+        with Image.open(BytesIO(zoom.tile(9, 0, 0))) as tile:
+            assert tile.size == (255, 255)
+            assert max(abs(a - b) for a, b in zip(tile.getpixel((50, 50)), colors[0])) < 8
+        with Image.open(BytesIO(zoom.tile(9, 1, 1))) as tile:
+            assert tile.size == (147, 147)
+            assert max(abs(a - b) for a, b in zip(tile.getpixel((100, 100)), colors[15])) < 8
+        assert zoom.tile(9, 2, 0) is None
+        assert zoom.tile(10, 0, 0) is None
+
+    def test_tiles_follow_the_pattern(self):
+        zoom, colors = self._zoom(grid_size=2, pattern="spiral")
+        # The spiral's last cover lands bottom-left.
+        with Image.open(BytesIO(zoom.tile(zoom.max_level, 0, 0))) as tile:
+            assert max(abs(a - b) for a, b in zip(tile.getpixel((40, 150)), colors[3])) < 8
+
+    def test_tiles_are_cached_and_only_touch_visible_cells(self):
+        calls = []
+        zoom, _ = self._zoom(grid_size=10, calls=calls)
+        zoom.tile(zoom.max_level, 0, 0)
+        assert sorted(set(calls)) == [c + r * 10 for r in range(3) for c in range(3)]
+        calls.clear()
+        zoom.tile(zoom.max_level, 0, 0)
+        assert calls == []
+
+    def test_low_levels_reuse_one_overview(self):
+        calls = []
+        zoom, _ = self._zoom(grid_size=8, cell_size=64, calls=calls)
+        for level in range(zoom.detail_level):
+            assert zoom.tile(level, 0, 0)
+        assert len(calls) == 64
+
+    def test_tiles_callback_runs_before_composite(self, monkeypatch):
+        import albumgrids
+        monkeypatch.setattr(albumgrids, "download_image",
+                            lambda url, stats=None: Image.new("RGB", (20, 20), (int(url[-5]) * 50, 0, 0)))
+        tracks = [{"album": {"id": f"a{i}", "images": [{"url": f"http://cdn/{i}.jpg", "width": 640}]}}
+                  for i in range(4)]
+        seen = []
+        albumgrids.generate_album_grid(None, mode="top", tracks=tracks, cell_size=10,
+                                       tiles_callback=lambda *args: seen.append(args))
+        (grid_size, cell_size, pattern, get_cell), = seen
+        assert (grid_size, cell_size, pattern) == (2, 10, "normal")
+        assert get_cell(0, (10, 10)).size == (10, 10)
+
+    def test_routes(self):
+        import app as app_module
+        zoom, _ = self._zoom(grid_size=2)
+        app_module.deepzooms["zoom-task"] = {"zoom": zoom, "last_used": time.time()}
+        try:
+            with app.test_client() as client:
+                res = client.get("/deepzoom/zoom-task.dzi")
+                assert res.status_code == 200 and b"deepzoom/2008" in res.data
+                res = client.get(f"/deepzoom/zoom-task_files/{zoom.max_level}/0_0.jpg")
+                assert res.status_code == 200 and res.mimetype == "image/jpeg"
+                assert client.get(f"/deepzoom/zoom-task_files/{zoom.max_level}/5_0.jpg").status_code == 404
+                assert b"openseadragon" in client.get("/deepzoom/zoom-task").data
+                assert client.get("/deepzoom/missing.dzi").status_code == 404
+        finally:
+            app_module.deepzooms.pop("zoom-task", None)
+
+
+# --- Batch CLI ---
+
+class TestBatch:
+    def _write_dump(self, path, cdn, indices):
+        items = [{"track": {"album": {"id": f"album{i}", "images": [{"url": cdn.image_url(i, 64), "width": 64}]}}}
+                 for i in indices]
+        path.write_text(json.dumps({"items": items}))
+        return str(path)
+
+    def test_manifest_fills_defaults(self, tmp_path):
+        from batch import load_manifest
+        manifest = tmp_path / "manifest.jsonl"
+        manifest.write_text('{"playlist_id": "abc", "pattern": "spiral"}\n\n'
+                            '{"name": "mine", "tracks_file": "dump.json"}\n')
+        jobs = load_manifest(str(manifest), {"mode": "top", "pattern": "normal"})
+        assert jobs[0] == {"mode": "playlist", "pattern": "spiral", "playlist_id": "abc", "name": "abc"}
+        assert jobs[1]["mode"] == "offline" and jobs[1]["name"] == "mine"
+        manifest.write_text('{"name": "a", "tracks_file": "x.json"}\n{"name": "a", "tracks_file": "y.json"}\n')
+        with pytest.raises(ValueError):
+            load_manifest(str(manifest), {"mode": "top"})
+
+    def test_offline_batch_resumes_and_shares_covers(self, tmp_path):
+        from batch import load_manifest, run_batch
+        from benchmarks.fakes import FakeImageCDN
+        defaults = {"mode": "playlist", "pattern": "normal", "cell_size": 20, "time_range": "medium_term",
+                    "remove_dups": False, "rounded": False, "framed": False, "large_library": False,
+                    "resampling": "fast"}
+        out_dir, cache_dir = str(tmp_path / "out"), str(tmp_path / "covers")
+        log = open(os.devnull, "w")
+        with FakeImageCDN(image_size=64) as cdn:
+            first = self._write_dump(tmp_path / "first.json", cdn, range(4))
+            second = self._write_dump(tmp_path / "second.json", cdn, range(2, 6))
+            manifest = tmp_path / "manifest.jsonl"
+            manifest.write_text(json.dumps({"tracks_file": first}) + "\n")
+            summary = run_batch(load_manifest(str(manifest), defaults), out_dir, 2, cache_dir, log=log)
+            assert summary["rendered"] == 1 and summary["failed"] == 0
+            assert cdn.requests == 4
+
+            # Rerun with a second grid: the first is skipped and the covers they share come from disk.
+            manifest.write_text(json.dumps({"tracks_file": first}) + "\n" + json.dumps({"tracks_file": second}) + "\n")
+            summary = run_batch(load_manifest(str(manifest), defaults), out_dir, 2, cache_dir, log=log)
+            assert summary["skipped"] == 1 and summary["rendered"] == 1
+            assert cdn.requests == 6
+        log.close()
+        with Image.open(os.path.join(out_dir, "second.png")) as grid:
+            assert grid.size == (40, 40)
+        assert len(os.listdir(cache_dir)) == 6
+
+    def test_disk_tier_of_cover_cache(self, tmp_path):
+        from albumgrids import CoverCache
+        CoverCache(1024, disk_dir=str(tmp_path)).put("http://cdn/a.jpg", b"cover")
+        fresh = CoverCache(1024, disk_dir=str(tmp_path))
+        assert fresh.get("http://cdn/a.jpg")["data"] == b"cover"
+        assert fresh.get("http://cdn/b.jpg") is None
+        assert fresh.stats()["hits"] == 1 and fresh.stats()["misses"] == 1
+
+
+# --- Several playlists in one grid ---
+
+class _SlowPlaylists:
+    """Stand-in Spotify client whose playlists page slowly, recording how many are in flight."""
+
+    def __init__(self, playlists, delay=0.05):
+        import threading
+        self.playlists = playlists
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def playlist_items(self, playlist_id, offset=0, limit=100):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        albums = self.playlists[playlist_id][offset:offset + limit]
+        return {"items": [{"track": {"album": {"id": f"a{i}", "images": [{"url": f"http://fake/{i}.jpg"}]}}}
+                          for i in albums]}
+
+
+class TestMultiPlaylist:
+    def test_pages_are_fetched_concurrently_and_merged_in_order(self):
+        from albumgrids import fetch_playlist_tracks
+        sp = _SlowPlaylists({"p1": list(range(150)), "p2": list(range(150, 160)), "p3": [0, 1]})
+        start = time.perf_counter()
+        tracks = fetch_playlist_tracks(sp, ["p1", "p2", "p3"])
+        assert sp.peak == 3
+        # Four page requests, but p1's two pages are the critical path.
+        assert time.perf_counter() - start < 4 * sp.delay
+        ids = [item["track"]["album"]["id"] for item in tracks]
+        assert ids == [f"a{i}" for i in list(range(160)) + [0, 1]]
+
+    def test_dedup_and_cap_apply_across_the_union(self, monkeypatch):
+        import albumgrids
+        import random
+        # Noise, so the perceptual hash tells every album apart.
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.frombytes(
+            "RGB", (10, 10), random.Random(url).randbytes(300)))
+        monkeypatch.setattr(albumgrids, "MAX_COVERS", 9)
+        sp = _SlowPlaylists({"p1": list(range(6)), "p2": list(range(3, 12))}, delay=0)
+        stats = albumgrids.new_stats()
+        grid = albumgrids.generate_album_grid(sp, mode="playlist", playlist_id=["p1", "p2"], remove_dups=True,
+                                              cell_size=10, stats=stats)
+        assert stats["tracks"] == 15
+        assert stats["duplicates_dropped"] == 3
+        assert grid.size == (30, 30)
+
+    def test_error_in_one_playlist_propagates(self):
+        from albumgrids import fetch_playlist_tracks
+        sp = _SlowPlaylists({"p1": list(range(3))}, delay=0)
+        with pytest.raises(KeyError):
+            fetch_playlist_tracks(sp, ["p1", "missing"])
+
+
+# --- Resampling tiers ---
+
+class TestResampling:
+    def test_tiers_hit_the_requested_size(self):
+        from albumgrids import resample, RESAMPLING_TIERS
+        img = Image.new("RGB", (640, 640), (10, 200, 30))
+        for tier in RESAMPLING_TIERS:
+            out = resample(img, (300, 300), tier)
+            assert out.size == (300, 300) and out.mode == "RGB"
+            assert max(abs(a - b) for a, b in zip(out.getpixel((150, 150)), (10, 200, 30))) <= 1
+
+    def test_high_tier_averages_in_linear_light(self):
+        from albumgrids import resample
+        checker = Image.new("L", (64, 64))
+        checker.putdata([255 * ((x + y) % 2) for y in range(64) for x in range(64)])
+        checker = checker.convert("RGB")
+        # Half-on pixels are 50% light, which sRGB encodes near 188, not 128.
+        assert abs(resample(checker, (8, 8), "high").getpixel((4, 4))[0] - 188) <= 2
+        assert abs(resample(checker, (8, 8), "fast").getpixel((4, 4))[0] - 128) <= 1
+
+    def test_fast_tier_drafts_jpeg_decodes(self, monkeypatch):
+        import albumgrids
+        buf = BytesIO()
+        Image.new("RGB", (640, 640), "red").save(buf, "JPEG")
+        sizes = []
+        real_features = albumgrids.cover_features
+
+        def features(url, img, with_hash=False, stats=None):
+            sizes.append(img.size)
+            return real_features(url, img, with_hash, stats)
+        monkeypatch.setattr(albumgrids, "download_image", lambda url, stats=None: Image.open(BytesIO(buf.getvalue())))
+        monkeypatch.setattr(albumgrids, "cover_features", features)
+        tracks = [{"album": {"id": f"r{i}", "images": [{"url": f"http://cdn/draft{i}.jpg"}]}} for i in range(4)]
+        grid = albumgrids.generate_album_grid(None, mode="top", tracks=tracks, cell_size=100, resampling="fast")
+        assert grid.size == (200, 200)
+        assert sizes == [(160, 160)] * 4
+        with pytest.raises(ValueError):
+            albumgrids.generate_album_grid(None, mode="top", tracks=tracks, resampling="nope")
+
+
+# --- Server-side sessions ---
+
+def _session_app(store):
+    from flask import Flask, session
+    from sessions import ServerSideSessionInterface
+    test_app = Flask("session_test")
+    test_app.session_interface = ServerSideSessionInterface(store)
+
+    @test_app.route("/set/<value>")
+    def set_value(value):
+        session["token_info"] = {"access_token": value, "refresh_token": "r" * 200}
+        return "ok"
+
+    @test_app.route("/get")
+    def get_value():
+        return session.get("token_info", {}).get("access_token", "")
+
+    @test_app.route("/clear")
+    def clear():
+        session.clear()
+        return "ok"
+
+    return test_app
+
+
+class TestSessions:
+    def test_cookie_holds_only_an_opaque_id(self):
+        from sessions import MemorySessionStore
+        store = MemorySessionStore()
+        with _session_app(store).test_client() as client:
+            res = client.get("/set/abc")
+            cookie = res.headers["Set-Cookie"]
+            assert "abc" not in cookie and "rrrr" not in cookie
+            assert len(cookie.split(";")[0]) < 60
+            assert client.get("/get").data == b"abc"
+            # Reads and unchanged sessions send no cookie back.
+            assert "Set-Cookie" not in client.get("/get").headers
+            client.get("/set/def")
+            assert len(store) == 1
+            client.get("/clear")
+            assert len(store) == 0
+            assert client.get("/get").data == b""
+
+    def test_login_rotates_the_session_id(self, monkeypatch):
+        import app as app_module
+        from sessions import MemorySessionStore, ServerSideSessionInterface
+        store = MemorySessionStore()
+        monkeypatch.setattr(app, "session_interface", ServerSideSessionInterface(store))
+        monkeypatch.setattr(app_module.sp_oauth, "get_access_token",
+                            lambda code, as_dict, check_cache: {"access_token": "tok"})
+        monkeypatch.setattr(app_module, "schedule_prefetch", lambda token: None)
+        planted = "planted-by-someone-else"
+        store.set(planted, {"visited": True}, ttl=60)
+        with app.test_client() as client:
+            client.set_cookie("localhost", "session", planted)
+            res = client.get("/callback?code=c")
+            assert res.status_code == 302
+            rotated = res.headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+        assert rotated != planted
+        assert store.get(planted) is None
+        assert store.get(rotated)["token_info"] == {"access_token": "tok"}
+
+    def test_memory_store_is_an_lru_with_expiry(self):
+        from sessions import MemorySessionStore
+        store = MemorySessionStore(max_entries=2)
+        store.set("a", {"n": 1}, ttl=60)
+        store.set("b", {"n": 2}, ttl=60)
+        store.get("a")
+        store.set("c", {"n": 3}, ttl=60)
+        assert store.get("b") is None and store.get("a") == {"n": 1}
+        store.set("d", {"n": 4}, ttl=-1)
+        assert store.get("d") is None
+
+    def test_sqlite_store_is_shared_between_workers(self, tmp_path):
+        from sessions import SQLiteSessionStore
+        path = str(tmp_path / "sessions.sqlite3")
+        first, second = _session_app(SQLiteSessionStore(path)), _session_app(SQLiteSessionStore(path))
+        with first.test_client() as client:
+            sid = client.get("/set/shared").headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+        with second.test_client() as client:
+            client.set_cookie("localhost", "session", sid)
+            assert client.get("/get").data == b"shared"
+
+
+# --- Precompiled and pre-rendered pages ---
+
+class TestPages:
+    def test_landing_page_served_compressed_with_etag(self):
+        import gzip
+        with app.test_client() as client:
+            res = client.get("/", headers={"Accept-Encoding": "gzip"})
+            assert res.headers["Content-Encoding"] == "gzip"
+            assert b"Login with Spotify" in gzip.decompress(res.data)
+            plain = client.get("/")
+            assert "Content-Encoding" not in plain.headers
+            assert b"Login with Spotify" in plain.data
+            again = client.get("/", headers={"If-None-Match": res.headers["ETag"]})
+            assert again.status_code == 304 and again.data == b""
+
+    def test_templates_compiled_once(self):
+        import app as app_module
+        env = app_module.app.jinja_env
+        assert env.get_template("result.html") is env.get_template("result.html")
+        html = env.get_template("deepzoom.html").render(dzi_url="/deepzoom/x.dzi")
+        assert '"/deepzoom/x.dzi"' in html
+
+
+# --- Artifact janitor ---
+
+class TestArtifactJanitor:
+    def _write(self, janitor, size, on_evict=None):
+        f = janitor.new_file(".png")
+        f.write(b"x" * size)
+        f.close()
+        janitor.add(f.name, on_evict=on_evict)
+        return f.name
+
+    def test_quota_evicts_oldest_first(self, tmp_path):
+        from janitor import ArtifactJanitor
+        removed = []
+        janitor = ArtifactJanitor(str(tmp_path), quota_bytes=250, ttl_seconds=60,
+                                  on_remove=lambda path, reason: removed.append(reason))
+        evicted = []
+        first = self._write(janitor, 100, on_evict=evicted.append)
+        second = self._write(janitor, 100)
+        janitor.touch(first)
+        third = self._write(janitor, 100)
+        assert not os.path.exists(second)
+        assert os.path.exists(first) and os.path.exists(third)
+        assert removed == ["quota"] and evicted == []
+        usage = janitor.usage()
+        assert usage["files"] == 2 and usage["bytes"] == 200 and usage["disk_free_bytes"] > 0
+
+    def test_sweep_expires_and_adopts_leftovers(self, tmp_path):
+        from janitor import ArtifactJanitor
+        leftover = tmp_path / "orphan.png"
+        leftover.write_bytes(b"x" * 10)
+        os.utime(leftover, (time.time() - 120, time.time() - 120))
+        janitor = ArtifactJanitor(str(tmp_path), quota_bytes=10**6, ttl_seconds=60)
+        evicted = []
+        fresh = self._write(janitor, 10, on_evict=evicted.append)
+        assert janitor.sweep() == 1
+        assert not leftover.exists() and os.path.exists(fresh)
+        janitor.ttl_seconds = -1
+        janitor.touch(fresh)
+        janitor.sweep()
+        assert evicted == [fresh] and janitor.usage()["files"] == 0
+
+    def test_stale_masters_are_spilled_to_disk(self, monkeypatch, tmp_path):
+        import app as app_module
+        from janitor import ArtifactJanitor
+        monkeypatch.setattr(app_module, "artifacts", ArtifactJanitor(str(tmp_path), quota_bytes=10**8, ttl_seconds=60))
+        old = app_module.stash_master(Image.new("RGB", (8, 8)))
+        fresh = app_module.stash_master(Image.new("RGB", (8, 8)))
+        app_module.pending_masters[old]["created_at"] -= app_module.TASK_TTL_SECONDS + 1
+        app_module.spill_stale_masters()
+        assert app_module.pending_masters[old]["image"] is None
+        assert os.path.exists(app_module.pending_masters[old]["path"])
+        assert app_module.pending_masters[fresh]["image"] is not None
+        app_module.discard_master(old)
+        app_module.discard_master(fresh)
+
+    def test_evicted_master_is_forgotten(self, monkeypatch, tmp_path):
+        import app as app_module
+        from janitor import ArtifactJanitor
+        monkeypatch.setattr(app_module, "artifacts", ArtifactJanitor(str(tmp_path), quota_bytes=1, ttl_seconds=60))
+        first = app_module.stash_master(Image.new("RGB", (8, 8)))
+        second = app_module.stash_master(Image.new("RGB", (8, 8)))
+        assert app_module.master_path(first) is not None
+        app_module.master_path(second)
+        assert app_module.master_path(first) is None
+        assert os.path.exists(app_module.master_path(second))
+        app_module.discard_master(second)
+        assert os.listdir(tmp_path) == []
+
+
+# --- JSON job API ---
+
+class TestJobAPI:
+    def test_worker_name_lookups_are_bulk(self, monkeypatch):
+        from unittest.mock import MagicMock
+        import app as app_module
+        from albumgrids import PRIORITY_BULK, PRIORITY_HIGH
+        seen = []
+
+        def call(fn, *args, priority, cancel_event=None, **kwargs):
+            seen.append(priority)
+            return fn(*args, **kwargs)
+
+        monkeypatch.setattr(app_module, "spotify_governor", MagicMock(call=MagicMock(side_effect=call)))
+        sp = MagicMock()
+        sp.playlist.return_value = {"name": "Mix"}
+        job, _ = app_module.parse_job({"playlist_id": "a,b"})
+        assert app_module.grid_name(sp, job) == "Mix_and_1_more"
+        assert seen == [PRIORITY_BULK, PRIORITY_BULK]
+        app_module.grid_name(sp, job, priority=PRIORITY_HIGH)
+        assert seen[2:] == [PRIORITY_HIGH, PRIORITY_HIGH]
+
+    def test_submit_poll_and_fetch_with_idempotency(self, monkeypatch, tmp_path):
+        from unittest.mock import MagicMock
+        import app as app_module
+        from janitor import ArtifactJanitor
+        from spotipy.exceptions import SpotifyException
+        users = {"api-token": "user-1", "refreshed-token": "user-1", "someone-else": "user-2"}
+
+        def client_for(token):
+            sp = MagicMock()
+            sp.playlist.return_value = {"name": "My Mix"}
+            if token in users:
+                sp.current_user.return_value = {"id": users[token]}
+            else:
+                sp.current_user.side_effect = SpotifyException(401, -1, "Invalid access token")
+            return sp
+
+        calls = []
+
+        def fake_generate(cell_size=100, **options):
+            calls.append(options["playlist_id"])
+            return Image.new("RGB", (2 * cell_size, 2 * cell_size), (200, 10, 10))
+
+        monkeypatch.setattr(app_module, "get_spotify_client", client_for)
+        monkeypatch.setattr(app_module, "generate_album_grid", fake_generate)
+        monkeypatch.setattr(app_module, "artifacts", ArtifactJanitor(str(tmp_path), 10**8, 60))
+        auth = {"Authorization": "Bearer api-token", "Idempotency-Key": "batch-1"}
+        body = {"jobs": [{"playlist_id": "https://open.spotify.com/playlist/abc?si=1"}, {"mode": "bogus"}]}
+
+        with app.test_client() as client:
+            res = client.post("/api/jobs", json=body, headers=auth)
+            assert res.status_code == 202
+            first, bad = res.get_json()["jobs"]
+            rejected = client.post("/api/jobs", json={"jobs": [{"mode": "bogus"}]}, headers=auth)
+            assert rejected.status_code == 400
+            assert "error" in bad and first["reused"] is False
+            app_module.tasks[first["id"]]["future"].result(timeout=10)
+
+            retry = client.post("/api/jobs", json=body, headers=auth).get_json()["jobs"][0]
+            assert retry["id"] == first["id"] and retry["reused"] is True
+            assert calls == ["abc"]
+            changed = client.post("/api/jobs", json={"jobs": [{"playlist_id": "xyz"}, {}]}, headers=auth)
+            assert "error" in changed.get_json()["jobs"][0]
+
+            status = client.get(first["url"], headers=auth).get_json()
+            assert status["status"] == "done" and status["file_name"] == "My_Mix_2x2_normal.png"
+            png = client.get(status["artifact"], headers=auth)
+            assert Image.open(BytesIO(png.data)).size == (200, 200)
+            listed = client.get(f"/api/jobs?ids={first['id']},missing", headers=auth).get_json()["jobs"]
+            assert [j["status"] for j in listed] == ["done", "not_found"]
+            assert client.get(first["url"], headers={"Authorization": "Bearer someone-else"}).status_code == 404
+            # Jobs belong to the Spotify user, so they survive a token refresh.
+            refreshed = {"Authorization": "Bearer refreshed-token", "Idempotency-Key": "batch-1"}
+            assert client.get(first["url"], headers=refreshed).get_json()["status"] == "done"
+            assert client.post("/api/jobs", json=body, headers=refreshed).get_json()["jobs"][0]["reused"] is True
+            assert client.get(first["url"], headers={"Authorization": "Bearer forged"}).status_code == 401
+            assert client.post("/api/jobs", json={"playlist_id": "abc"}).status_code == 401
+        app_module.tasks.pop(first["id"], None)
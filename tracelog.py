@@ -0,0 +1,57 @@
+# tracelog.py
+"""
+Append-only JSONL trace of finished generations for offline capacity planning.
+
+Callers only enqueue a record; a background QueueListener does the file I/O
+through a size-rotating handler, so a slow disk never blocks a worker. When
+the queue is full the record is dropped and counted instead.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueListener, RotatingFileHandler
+
+
+class TraceLog:
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._listener is None:
+                handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                              backupCount=self.backup_count, encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._listener = QueueListener(self._queue, handler)
+                self._listener.start()
+                atexit.register(self.close)
+
+    def write(self, record):
+        if not self.path:
+            return False
+        self._ensure_started()
+        line = json.dumps(record, separators=(",", ":"), default=str)
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread."""
+        with self._lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()